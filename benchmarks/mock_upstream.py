@@ -0,0 +1,260 @@
+"""Mock upstream speaking every provider dialect the router supports.
+
+One ASGI app answers on the paths each adapter calls:
+
+    POST /v1/chat/completions                            openai, openrouter, llama_cpp
+    POST /v1/messages                                    anthropic (Messages API SSE)
+    POST /api/chat                                       ollama (NDJSON)
+    POST /api/v1/services/aigc/text-generation/generation  qwen (DashScope SSE)
+    GET  /health
+
+Each response carries ``tokens`` tokens. With ``token_rate`` set, streams
+emit that many tokens per second and non-streaming responses wait as long as
+the whole stream would take; with 0 they answer as fast as possible.
+
+    python -m benchmarks.mock_upstream [--port 9100] [--tokens 64] [--token-rate 0]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+
+TOKEN = "tok "
+
+# base_url for each provider type when the mock listens on ``root``.
+BASE_PATHS = {
+    "openai": "/v1",
+    "openrouter": "/v1",
+    "llama_cpp": "",
+    "anthropic": "/v1",
+    "ollama": "",
+    "qwen": "/api/v1",
+}
+
+
+def _compact(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+
+def _sse(data: bytes, event: bytes = b"") -> bytes:
+    prefix = b"event: " + event + b"\n" if event else b""
+    return prefix + b"data: " + data + b"\n\n"
+
+
+def _openai(model: str, tokens: int, stream: bool):
+    if not stream:
+        return _compact(
+            {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": TOKEN * tokens},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 8, "completion_tokens": tokens, "total_tokens": 8 + tokens},
+            }
+        )
+
+    def chunk(delta, finish=None):
+        return _sse(
+            _compact(
+                {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": 0,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+                }
+            )
+        )
+
+    head = chunk({"role": "assistant", "content": ""})
+    body = chunk({"content": TOKEN})
+    tail = chunk({}, "stop") + b"data: [DONE]\n\n"
+    return head, body, tail
+
+
+def _anthropic(model: str, tokens: int, stream: bool):
+    if not stream:
+        return _compact(
+            {
+                "id": "msg_mock",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": TOKEN * tokens}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": 8, "output_tokens": tokens},
+            }
+        )
+    head = _sse(
+        _compact(
+            {
+                "type": "message_start",
+                "message": {"id": "msg_mock", "model": model, "usage": {"input_tokens": 8, "output_tokens": 1}},
+            }
+        ),
+        b"message_start",
+    ) + _sse(
+        _compact({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+        b"content_block_start",
+    )
+    body = _sse(
+        _compact({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": TOKEN}}),
+        b"content_block_delta",
+    )
+    tail = (
+        _sse(_compact({"type": "content_block_stop", "index": 0}), b"content_block_stop")
+        + _sse(
+            _compact(
+                {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": tokens}}
+            ),
+            b"message_delta",
+        )
+        + _sse(_compact({"type": "message_stop"}), b"message_stop")
+    )
+    return head, body, tail
+
+
+def _ollama(model: str, tokens: int, stream: bool):
+    done = {
+        "model": model,
+        "created_at": "2025-01-01T00:00:00Z",
+        "message": {"role": "assistant", "content": "" if stream else TOKEN * tokens},
+        "done": True,
+        "done_reason": "stop",
+        "prompt_eval_count": 8,
+        "eval_count": tokens,
+    }
+    if not stream:
+        return _compact(done)
+    body = (
+        _compact(
+            {
+                "model": model,
+                "created_at": "2025-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": TOKEN},
+                "done": False,
+            }
+        )
+        + b"\n"
+    )
+    return b"", body, _compact(done) + b"\n"
+
+
+def _qwen(model: str, tokens: int, stream: bool):
+    if not stream:
+        return _compact(
+            {
+                "request_id": "req-mock",
+                "output": {"text": TOKEN * tokens, "finish_reason": "stop"},
+                "usage": {"input_tokens": 8, "output_tokens": tokens},
+            }
+        )
+
+    def event(content, finish):
+        return b"id:1\nevent:result\n:HTTP_STATUS/200\n" + b"data:" + _compact(
+            {
+                "request_id": "req-mock",
+                "output": {
+                    "choices": [
+                        {"message": {"role": "assistant", "content": content}, "finish_reason": finish}
+                    ]
+                },
+                "usage": {"input_tokens": 8, "output_tokens": tokens},
+            }
+        ) + b"\n\n"
+
+    return b"", event(TOKEN, "null"), event("", "stop")
+
+
+DIALECTS = {
+    "/v1/chat/completions": (_openai, b"text/event-stream"),
+    "/v1/messages": (_anthropic, b"text/event-stream"),
+    "/api/chat": (_ollama, b"application/x-ndjson"),
+    "/api/v1/services/aigc/text-generation/generation": (_qwen, b"text/event-stream"),
+}
+
+
+class MockUpstream:
+    """ASGI app; ``tokens`` and ``token_rate`` shape every response."""
+
+    def __init__(self, tokens: int = 64, token_rate: float = 0.0):
+        self.tokens = tokens
+        self.token_rate = token_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        dialect = DIALECTS.get(scope["path"])
+        if dialect is None:
+            status = 200 if scope["path"] == "/health" else 404
+            await send({"type": "http.response.start", "status": status, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        build, stream_type = dialect
+        request = json.loads(body or b"{}")
+        headers = dict(scope["headers"])
+        stream = bool(request.get("stream")) or headers.get(b"x-dashscope-sse") == b"enable"
+        model = request.get("model", "mock")
+        delay = 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+
+        if not stream:
+            if delay:
+                await asyncio.sleep(delay * self.tokens)
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 200,
+                    "headers": [(b"content-type", b"application/json")],
+                }
+            )
+            await send({"type": "http.response.body", "body": build(model, self.tokens, False)})
+            return
+
+        head, token, tail = build(model, self.tokens, True)
+        await send(
+            {"type": "http.response.start", "status": 200, "headers": [(b"content-type", stream_type)]}
+        )
+        if head:
+            await send({"type": "http.response.body", "body": head, "more_body": True})
+        for _ in range(self.tokens):
+            if delay:
+                await asyncio.sleep(delay)
+            await send({"type": "http.response.body", "body": token, "more_body": True})
+        await send({"type": "http.response.body", "body": tail})
+
+
+def app():
+    """Factory for ``uvicorn --factory``; reads the shape from the environment."""
+    return MockUpstream(
+        int(os.getenv("MOCK_TOKENS", "64")), float(os.getenv("MOCK_TOKEN_RATE", "0"))
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--token-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(MockUpstream(args.tokens, args.token_rate), host=args.host, port=args.port, log_level="warning")
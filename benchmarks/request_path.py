@@ -0,0 +1,131 @@
+"""Micro-benchmark: router CPU per non-streaming request by history size.
+
+Compares the previous path against the current one, stage by stage:
+
+- parse: pydantic ``ChatCompletionRequest`` plus ``model_dump()`` per
+  message, against one ``jsonlib.loads`` and ``parse_chat_request``;
+- key: the cache, near-duplicate scope and coalescer keys, each hashing
+  ``json.dumps(sort_keys=True)``, against one ``request_digest``;
+- upstream: ``json.dumps`` (httpx ``json=``) against ``jsonlib.dumps``;
+- response: ``json.loads`` of the upstream body and ``JSONResponse``
+  re-encoding, against forwarding the bytes in a ``RawJSONResponse``.
+
+    python -m benchmarks.request_path [--sizes 10 100 500] [--iterations 50]
+
+Sizes are request history sizes in KB; the response is a tenth of that.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import time
+
+from fastapi.responses import JSONResponse
+
+from src import jsonlib
+from src.cache import make_cache_key, request_digest
+from src.models import ChatCompletionRequest, parse_chat_request
+from src.responses import json_response
+
+TURN = "Explain how the scheduler hands out slots when several tenants are queued. " * 4
+
+
+def request_body(kb: int) -> bytes:
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    while len(json.dumps(messages)) < kb * 1024:
+        messages.append({"role": "user", "content": TURN})
+        messages.append({"role": "assistant", "content": TURN[::-1]})
+    return json.dumps({"model": "bench-model", "messages": messages, "max_tokens": 256}).encode()
+
+
+def upstream_body(kb: int) -> bytes:
+    content = (TURN * (kb * 1024 // len(TURN) + 1))[: kb * 1024]
+    return json.dumps(
+        {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "bench-model",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20},
+        }
+    ).encode()
+
+
+def legacy_key(messages: list, params: dict) -> str:
+    canonical = json.dumps(
+        {"provider": "p", "model": "bench-model", "messages": messages, "params": params, "stream": False},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def legacy(body: bytes, upstream: bytes) -> tuple:
+    t0 = time.perf_counter()
+    request = ChatCompletionRequest.model_validate_json(body)
+    messages = [m.model_dump() for m in request.messages]
+    params = request.provider_params()
+    t1 = time.perf_counter()
+    legacy_key(messages, params)  # cache
+    legacy_key([], params)  # near-duplicate scope
+    legacy_key(messages, params)  # coalescer
+    t2 = time.perf_counter()
+    json.dumps({"model": request.model, "messages": messages, **params})
+    t3 = time.perf_counter()
+    JSONResponse(content=json.loads(upstream))
+    t4 = time.perf_counter()
+    return t1 - t0, t2 - t1, t3 - t2, t4 - t3
+
+
+def current(body: bytes, upstream: bytes) -> tuple:
+    t0 = time.perf_counter()
+    request = parse_chat_request(jsonlib.loads(body))
+    t1 = time.perf_counter()
+    digest = request_digest(request.messages, request.params, False)
+    make_cache_key("p", "bench-model", digest)
+    make_cache_key("p", "bench-model", request_digest([], request.params, False))
+    make_cache_key("p", "bench-model", digest)
+    t2 = time.perf_counter()
+    jsonlib.dumps({"model": request.model, "messages": request.messages, **request.params})
+    t3 = time.perf_counter()
+    json_response(jsonlib.RawJSON(upstream))
+    t4 = time.perf_counter()
+    return t1 - t0, t2 - t1, t3 - t2, t4 - t3
+
+
+def measure(path, body: bytes, upstream: bytes, iterations: int) -> list:
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for _ in range(iterations):
+        for i, seconds in enumerate(path(body, upstream)):
+            totals[i] += seconds
+    return [t / iterations * 1000 for t in totals]
+
+
+def main(sizes: list, iterations: int) -> None:
+    print(f"JSON backend: {jsonlib.BACKEND}, {iterations} iterations, ms per request")
+    print(
+        f"{'size':>7} {'path':<8} {'parse':>8} {'key':>8} {'upstream':>9} "
+        f"{'response':>9} {'total':>8}"
+    )
+    for kb in sizes:
+        body, upstream = request_body(kb), upstream_body(max(1, kb // 10))
+        before = measure(legacy, body, upstream, iterations)
+        after = measure(current, body, upstream, iterations)
+        for label, row in (("legacy", before), ("current", after)):
+            print(
+                f"{kb:>5}KB {label:<8} {row[0]:>8.3f} {row[1]:>8.3f} {row[2]:>9.3f} "
+                f"{row[3]:>9.3f} {sum(row):>8.3f}"
+            )
+        print(f"{'':>7} {'speedup':<8} {sum(before) / sum(after):>8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    main(args.sizes, args.iterations)
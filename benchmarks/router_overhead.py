@@ -0,0 +1,374 @@
+"""Benchmark: latency and CPU the router adds on top of its upstreams.
+
+Starts ``benchmarks.mock_upstream`` and the router (``python -m src.serve``)
+with one provider per dialect pointing at the mock. For every provider and
+mode it drives the mock directly, then the same load through
+``/v1/chat/completions``, and reports:
+
+- requests/sec through the router;
+- p50/p99 overhead: router latency percentile minus direct percentile;
+- TTFT added: router minus direct time to the first content token (streams);
+- router CPU per streamed token and per request, read from /proc (Linux).
+
+    python -m benchmarks.router_overhead [--providers openai anthropic ...]
+        [--modes stream nonstream mixed] [--stream-ratio 0.5]
+        [--duration 5] [--concurrency 8] [--tokens 64] [--token-rate 0]
+        [--save] [--check] [--baseline benchmarks/baselines/router_overhead.json]
+
+``--save`` writes the results as the baseline; ``--check`` compares against
+it and exits non-zero when a metric regressed by more than ``--tolerance``.
+Baselines are only comparable on the same machine and settings.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+import httpx
+
+from benchmarks.mock_upstream import BASE_PATHS, DIALECTS
+from benchmarks.worker_scaling import _free_port, _percentile, _wait_ready
+
+PROVIDERS = list(BASE_PATHS)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "router_overhead.json")
+
+DIRECT_PATHS = {
+    "openai": "/v1/chat/completions",
+    "openrouter": "/v1/chat/completions",
+    "llama_cpp": "/v1/chat/completions",
+    "anthropic": "/v1/messages",
+    "ollama": "/api/chat",
+    "qwen": "/api/v1/services/aigc/text-generation/generation",
+}
+assert set(DIRECT_PATHS.values()) <= set(DIALECTS)
+
+# metric -> (higher is worse, absolute change below which it is noise)
+TRACKED = {
+    "overhead_p50_ms": (True, 0.25),
+    "overhead_p99_ms": (True, 1.0),
+    "ttft_added_ms": (True, 0.25),
+    "cpu_us_per_token": (True, 2.0),
+    "cpu_ms_per_request": (True, 0.1),
+    "rps": (False, 5.0),
+}
+
+
+class Sample(NamedTuple):
+    stream: bool
+    latency: float
+    ttft: Optional[float]
+    tokens: int
+    ok: bool
+
+
+def _model(provider: str) -> str:
+    return f"bench-{provider}"
+
+
+def _write_config(directory: str, upstream: str, providers: List[str]) -> str:
+    path = os.path.join(directory, "providers.yaml")
+    config = {
+        "server": {"host": "127.0.0.1", "port": 8000, "api_keys": []},
+        "shared_state": {"path": os.path.join(directory, "state", "shared.sqlite3")},
+        "providers": {
+            provider: {
+                "type": provider,
+                "base_url": upstream + BASE_PATHS[provider],
+                "api_key": "bench",
+                "coalesce": False,
+                "pool": {"max_connections": 256, "max_keepalive_connections": 256},
+                "models": [{"name": _model(provider), "provider_model_id": _model(provider)}],
+            }
+            for provider in providers
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(config, f)  # JSON is valid YAML
+    return path
+
+
+def _cpu_seconds(pid: int) -> Optional[float]:
+    """User + system CPU of ``pid`` and its direct children, or None off Linux."""
+    try:
+        ticks = os.sysconf("SC_CLK_TCK")
+        total = 0
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            # fields[1] is ppid; utime and stime are fields 14 and 15 of stat.
+            if int(entry) == pid or int(fields[1]) == pid:
+                total += int(fields[11]) + int(fields[12])
+        return total / ticks
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+async def _request(client: httpx.AsyncClient, url: str, body: dict, headers: dict, stream: bool) -> Sample:
+    start = time.perf_counter()
+    ttft = None
+    tokens = 0
+    try:
+        if not stream:
+            response = await client.post(url, json=body, headers=headers)
+            return Sample(False, time.perf_counter() - start, None, 0, response.status_code == 200)
+        carry = b""
+        async with client.stream("POST", url, json=body, headers=headers) as response:
+            async for chunk in response.aiter_raw():
+                data = carry + chunk
+                found = data.count(b"tok ")
+                if found and ttft is None:
+                    ttft = time.perf_counter() - start
+                tokens += found
+                carry = data[-3:]
+                if b"tok " in carry:
+                    carry = b""
+            ok = response.status_code == 200
+        return Sample(True, time.perf_counter() - start, ttft, tokens, ok)
+    except httpx.HTTPError:
+        return Sample(stream, time.perf_counter() - start, None, 0, False)
+
+
+async def _drive(
+    url: str, body_for, headers_for, duration: float, concurrency: int, stream_ratio: float
+) -> List[Sample]:
+    samples: List[Sample] = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    rng = random.Random(0)
+
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+
+        async def user(n: int) -> None:
+            i = 0
+            while time.perf_counter() < deadline:
+                stream = rng.random() < stream_ratio
+                samples.append(
+                    await _request(client, url, body_for(n, i, stream), headers_for(stream), stream)
+                )
+                i += 1
+
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+    return samples
+
+
+def _summarize(direct: List[Sample], routed: List[Sample], duration: float, cpu: Optional[float]) -> dict:
+    ok_direct = [s for s in direct if s.ok]
+    ok_routed = [s for s in routed if s.ok]
+    d_lat = [s.latency for s in ok_direct]
+    r_lat = [s.latency for s in ok_routed]
+    d_ttft = [s.ttft for s in ok_direct if s.ttft is not None]
+    r_ttft = [s.ttft for s in ok_routed if s.ttft is not None]
+    streamed = sum(s.tokens for s in ok_routed)
+
+    result = {
+        "requests": len(ok_routed),
+        "errors": len(routed) - len(ok_routed) + len(direct) - len(ok_direct),
+        "rps": len(ok_routed) / duration,
+        "direct_p50_ms": _percentile(d_lat, 0.5) * 1000,
+        "router_p50_ms": _percentile(r_lat, 0.5) * 1000,
+        "overhead_p50_ms": (_percentile(r_lat, 0.5) - _percentile(d_lat, 0.5)) * 1000,
+        "overhead_p99_ms": (_percentile(r_lat, 0.99) - _percentile(d_lat, 0.99)) * 1000,
+    }
+    if d_ttft and r_ttft:
+        result["ttft_added_ms"] = (_percentile(r_ttft, 0.5) - _percentile(d_ttft, 0.5)) * 1000
+    if cpu is not None:
+        if ok_routed:
+            result["cpu_ms_per_request"] = cpu / len(ok_routed) * 1000
+        if streamed:
+            result["cpu_us_per_token"] = cpu / streamed * 1e6
+    return result
+
+
+def _compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        for metric, (higher_is_worse, floor) in TRACKED.items():
+            if metric not in result or metric not in old:
+                continue
+            new_value, old_value = result[metric], old[metric]
+            change = new_value - old_value if higher_is_worse else old_value - new_value
+            if change > floor and change > abs(old_value) * tolerance:
+                regressions.append(f"{name} {metric}: {old_value:.2f} -> {new_value:.2f}")
+    return regressions
+
+
+def _print_table(results: Dict[str, dict], baseline: Dict[str, dict]) -> None:
+    columns = [
+        ("rps", "req/s", "{:>8.0f}"),
+        ("overhead_p50_ms", "+p50 ms", "{:>8.2f}"),
+        ("overhead_p99_ms", "+p99 ms", "{:>8.2f}"),
+        ("ttft_added_ms", "+TTFT ms", "{:>8.2f}"),
+        ("cpu_us_per_token", "µs/tok", "{:>8.1f}"),
+        ("cpu_ms_per_request", "ms/req", "{:>8.2f}"),
+        ("errors", "errors", "{:>8d}"),
+    ]
+    print(f"{'phase':<22}" + "".join(f"{title:>9}" for _, title, _ in columns))
+    for name, result in results.items():
+        cells = [
+            " " + (fmt.format(result[key]) if key in result else f"{'-':>8}")
+            for key, _, fmt in columns
+        ]
+        print(f"{name:<22}" + "".join(cells))
+        old = baseline.get(name)
+        if old:
+            cells = [
+                " " + (fmt.format(old[key]) if key in old else f"{'-':>8}") for key, _, fmt in columns
+            ]
+            print(f"{'  baseline':<22}" + "".join(cells))
+
+
+def _cpu_model() -> str:
+    """CPU model name, so a saved baseline says what it was measured on."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or "unknown"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=PROVIDERS)
+    parser.add_argument("--modes", nargs="+", choices=["stream", "nonstream", "mixed"], default=["stream", "nonstream"])
+    parser.add_argument("--stream-ratio", type=float, default=0.5, help="Share of streams in mixed mode")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per mock response")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Mock tokens/sec; 0 = unthrottled")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Exit 1 on regressions against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline: Dict[str, dict] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    ratios = {"stream": 1.0, "nonstream": 0.0, "mixed": args.stream_ratio}
+    results: Dict[str, dict] = {}
+    print(
+        f"cpus={os.cpu_count()} duration={args.duration:g}s concurrency={args.concurrency} "
+        f"tokens={args.tokens} token_rate={args.token_rate:g}"
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        upstream_port = _free_port()
+        env = dict(os.environ, MOCK_TOKENS=str(args.tokens), MOCK_TOKEN_RATE=str(args.token_rate))
+        upstream = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "benchmarks.mock_upstream:app", "--factory",
+                "--port", str(upstream_port), "--log-level", "warning",
+            ],
+            env=env,
+        )
+        router = None
+        try:
+            upstream_url = f"http://127.0.0.1:{upstream_port}"
+            _wait_ready(f"{upstream_url}/health", upstream)
+            config_path = _write_config(directory, upstream_url, args.providers)
+            port = _free_port()
+            router = subprocess.Popen(
+                [
+                    sys.executable, "-m", "src.serve", "--config", config_path,
+                    "--workers", str(args.workers), "--port", str(port),
+                ],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            _wait_ready(f"http://127.0.0.1:{port}/health", router)
+            router_url = f"http://127.0.0.1:{port}/v1/chat/completions"
+
+            for provider in args.providers:
+                model = _model(provider)
+
+                def body_for(n: int, i: int, stream: bool) -> dict:
+                    return {
+                        "model": model,
+                        "messages": [{"role": "user", "content": f"u{n} r{i}"}],
+                        "max_tokens": args.tokens,
+                        "stream": stream,
+                    }
+
+                def direct_headers(stream: bool) -> dict:
+                    return {"X-DashScope-SSE": "enable"} if stream and provider == "qwen" else {}
+
+                for mode in args.modes:
+                    ratio = ratios[mode]
+                    direct = asyncio.run(
+                        _drive(
+                            upstream_url + DIRECT_PATHS[provider], body_for, direct_headers,
+                            args.duration, args.concurrency, ratio,
+                        )
+                    )
+                    cpu_before = _cpu_seconds(router.pid)
+                    routed = asyncio.run(
+                        _drive(
+                            router_url, body_for, lambda stream: {},
+                            args.duration, args.concurrency, ratio,
+                        )
+                    )
+                    cpu_after = _cpu_seconds(router.pid)
+                    cpu = None
+                    if cpu_before is not None and cpu_after is not None:
+                        cpu = cpu_after - cpu_before
+                    results[f"{provider}/{mode}"] = _summarize(direct, routed, args.duration, cpu)
+        finally:
+            if router is not None:
+                router.terminate()
+                router.wait()
+            upstream.terminate()
+            upstream.wait()
+
+    _print_table(results, baseline)
+
+    regressions = _compare(results, baseline, args.tolerance) if baseline else []
+    for line in regressions:
+        print(f"REGRESSION {line}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        meta = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu": _cpu_model(),
+            "cpus": os.cpu_count(),
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "tokens": args.tokens,
+            "token_rate": args.token_rate,
+            "workers": args.workers,
+        }
+        with open(args.baseline, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2, sort_keys=True)
+        print(f"baseline written to {args.baseline}")
+
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
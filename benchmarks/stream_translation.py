@@ -0,0 +1,141 @@
+"""Micro-benchmark: per-chunk cost of translating Anthropic/Ollama streams.
+
+Compares the previous approach (``json.loads`` per event, a fresh nested dict
+and ``json.dumps`` per delta) against the byte-template translators used by
+the providers now.
+
+    python -m benchmarks.stream_translation [--chunks 20000]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+from src import jsonlib
+from src.config import ProviderConfig
+from src.providers.anthropic import AnthropicProvider
+from src.providers.ollama import OllamaProvider
+
+MODEL = "bench-model"
+WORDS = ["Hello", " world", ",", " the", " quick", " \"brown\"", " fox", "\n", " jumps", " ü"]
+
+
+def _compact(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def anthropic_lines(n: int) -> list[str]:
+    lines = [
+        "event: message_start",
+        "data: " + _compact({"type": "message_start", "message": {"id": "msg_1", "usage": {"input_tokens": 10, "output_tokens": 1}}}),
+        "",
+    ]
+    for i in range(n):
+        lines += [
+            "event: content_block_delta",
+            "data: " + _compact({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": WORDS[i % len(WORDS)]}}),
+            "",
+        ]
+    lines += [
+        "data: " + _compact({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": n}}),
+        "",
+        "data: " + _compact({"type": "message_stop"}),
+        "",
+    ]
+    return lines
+
+
+def ollama_lines(n: int) -> list[str]:
+    lines = [
+        _compact({"model": MODEL, "created_at": "2025-01-01T00:00:00Z", "message": {"role": "assistant", "content": WORDS[i % len(WORDS)]}, "done": False})
+        for i in range(n)
+    ]
+    lines.append(_compact({"model": MODEL, "created_at": "2025-01-01T00:00:00Z", "message": {"role": "assistant", "content": ""}, "done": True, "eval_count": n, "prompt_eval_count": 10}))
+    return lines
+
+
+async def legacy_anthropic(lines):
+    for line in lines:
+        if not line.startswith("data: "):
+            continue
+        data = json.loads(line[6:])
+        if data.get("type") == "content_block_delta":
+            chunk = {
+                "id": data.get("id", ""),
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": MODEL,
+                "choices": [{"index": 0, "delta": {"content": data["delta"].get("text", "")}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        elif data.get("type") == "message_stop":
+            yield "data: [DONE]\n\n"
+
+
+async def legacy_ollama(lines):
+    for line in lines:
+        if not line:
+            continue
+        data = json.loads(line)
+        if data.get("message"):
+            chunk = {
+                "id": f"ollama-{int(time.time())}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": MODEL,
+                "choices": [{"index": 0, "delta": {"content": data["message"].get("content", "")}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        if data.get("done"):
+            yield "data: [DONE]\n\n"
+
+
+async def byte_source(payload: bytes, size: int = 512):
+    for i in range(0, len(payload), size):
+        yield payload[i : i + size]
+
+
+async def drain(stream) -> int:
+    count = 0
+    async for _ in stream:
+        count += 1
+    return count
+
+
+async def timed(label: str, make_stream, n: int) -> float:
+    start = time.perf_counter()
+    await drain(make_stream())
+    per_chunk = (time.perf_counter() - start) / n * 1e6
+    print(f"  {label:<10} {per_chunk:8.2f} µs/chunk")
+    return per_chunk
+
+
+async def main(n: int) -> None:
+    print(f"JSON backend: {jsonlib.BACKEND}, {n} deltas per stream")
+    config = ProviderConfig(type="bench", base_url="http://bench", models=[])
+
+    lines = anthropic_lines(n)
+    payload = ("\n".join(lines) + "\n").encode()
+    provider = AnthropicProvider(config, None)
+    print("anthropic")
+    before = await timed("legacy", lambda: legacy_anthropic(lines), n)
+    after = await timed("template", lambda: provider._translate_stream(byte_source(payload), MODEL), n)
+    print(f"  speedup    {before / after:8.2f}x")
+
+    lines = ollama_lines(n)
+    payload = ("\n".join(lines) + "\n").encode()
+    provider = OllamaProvider(config, None)
+    print("ollama")
+    before = await timed("legacy", lambda: legacy_ollama(lines), n)
+    after = await timed("template", lambda: provider._translate_stream(byte_source(payload), MODEL), n)
+    print(f"  speedup    {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.chunks))
@@ -0,0 +1,218 @@
+"""Benchmark: router throughput as the number of worker processes grows.
+
+Starts a mock OpenAI-compatible upstream, then for each worker count launches
+``python -m src.serve --workers N`` against it and drives it with a fixed
+number of concurrent clients for a fixed time. The upstream answers
+instantly, so the numbers measure the router itself.
+
+Clients spread their requests over ``--keys`` API keys with rate limits
+high enough never to trigger, so every request goes through the shared
+rate-limit store as it would in production. ``--keys 0`` disables auth.
+
+    python -m benchmarks.worker_scaling [--workers 1 2 4] [--duration 10] [--concurrency 64] [--keys 8]
+
+Scaling is bounded by the cores available; on a machine with fewer cores
+than workers the extra processes only add contention.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+MODEL = "bench-model"
+
+_RESPONSE = json.dumps(
+    {
+        "id": "chatcmpl-bench",
+        "object": "chat.completion",
+        "created": 0,
+        "model": MODEL,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}
+        ],
+        "usage": {"prompt_tokens": 8, "completion_tokens": 1, "total_tokens": 9},
+    }
+).encode()
+
+
+async def mock_upstream(scope, receive, send):
+    """Minimal ASGI app answering every request with a fixed completion."""
+    if scope["type"] != "http":
+        return
+    while (await receive()).get("more_body"):
+        pass
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": _RESPONSE})
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _api_keys(count: int) -> list[dict]:
+    return [
+        {
+            "key": f"bench-key-{n}",
+            "name": f"bench-{n}",
+            "requests_per_minute": 10**9,
+            "tokens_per_minute": 10**12,
+        }
+        for n in range(count)
+    ]
+
+
+def _write_config(directory: str, upstream_port: int, keys: int) -> str:
+    path = os.path.join(directory, "providers.yaml")
+    config = {
+        "server": {"host": "127.0.0.1", "port": 8000, "api_keys": _api_keys(keys)},
+        "shared_state": {"path": os.path.join(directory, "state", "shared.sqlite3")},
+        "providers": {
+            "mock": {
+                "type": "openai",
+                "base_url": f"http://127.0.0.1:{upstream_port}/v1",
+                "api_key": "bench",
+                "coalesce": False,
+                "pool": {"max_connections": 256, "max_keepalive_connections": 256},
+                "models": [{"name": MODEL, "provider_model_id": MODEL}],
+            }
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(config, f)  # JSON is valid YAML
+    return path
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args} exited with {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:g}s")
+
+
+async def _load(
+    url: str, duration: float, concurrency: int, keys: int
+) -> tuple[int, int, list[float]]:
+    ok = errors = 0
+    latencies: list[float] = []
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+
+        async def user(n: int) -> None:
+            nonlocal ok, errors
+            headers = {"Authorization": f"Bearer bench-key-{n % keys}"} if keys else {}
+            i = 0
+            while time.perf_counter() < deadline:
+                body = {"model": MODEL, "messages": [{"role": "user", "content": f"u{n} r{i}"}]}
+                start = time.perf_counter()
+                try:
+                    response = await client.post(url, json=body, headers=headers)
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if response.status_code == 200:
+                    ok += 1
+                else:
+                    errors += 1
+                i += 1
+
+        await asyncio.gather(*(user(n) for n in range(concurrency)))
+    return ok, errors, latencies
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--keys", type=int, default=8, help="API keys with rate limits")
+    args = parser.parse_args()
+
+    print(
+        f"cpus={os.cpu_count()} duration={args.duration:g}s "
+        f"concurrency={args.concurrency} keys={args.keys}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        upstream_port = _free_port()
+        upstream = subprocess.Popen(
+            [
+                sys.executable, "-m", "uvicorn", "benchmarks.worker_scaling:mock_upstream",
+                "--port", str(upstream_port), "--workers", "2", "--log-level", "warning",
+            ]
+        )
+        try:
+            _wait_ready(f"http://127.0.0.1:{upstream_port}/", upstream)
+            config_path = _write_config(directory, upstream_port, args.keys)
+            baseline = None
+            print(f"{'workers':>7} {'req/s':>9} {'speedup':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for workers in args.workers:
+                port = _free_port()
+                router = subprocess.Popen(
+                    [
+                        sys.executable, "-m", "src.serve", "--config", config_path,
+                        "--workers", str(workers), "--port", str(port),
+                    ],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                )
+                try:
+                    _wait_ready(f"http://127.0.0.1:{port}/health", router)
+                    ok, errors, latencies = asyncio.run(
+                        _load(
+                            f"http://127.0.0.1:{port}/v1/chat/completions",
+                            args.duration,
+                            args.concurrency,
+                            args.keys,
+                        )
+                    )
+                finally:
+                    router.terminate()
+                    router.wait()
+                rps = ok / args.duration
+                baseline = baseline or rps
+                print(
+                    f"{workers:>7} {rps:>9.0f} {rps / baseline:>7.2f}x "
+                    f"{_percentile(latencies, 0.5) * 1000:>8.1f} "
+                    f"{_percentile(latencies, 0.99) * 1000:>8.1f} {errors:>7}"
+                )
+        finally:
+            upstream.terminate()
+            upstream.wait()
+
+
+if __name__ == "__main__":
+    main()
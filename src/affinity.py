@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Sequence, Tuple, TypeVar
+
+from .sse import Chunk
+
+T = TypeVar("T")
+
+# Prefix hashes of the request being sent, read by BalancingTransport. A
+# context variable lets the hint reach the transport without every provider
+# adapter passing it along.
+PREFIX_HASHES: ContextVar[Optional[Tuple[bytes, ...]]] = ContextVar(
+    "prefix_hashes", default=None
+)
+
+
+def prefix_hashes(model: str, messages: list) -> Tuple[bytes, ...]:
+    """Rolling hash of every leading run of messages, shortest first.
+
+    Each hash chains the previous one with the next message, so the whole
+    list costs one pass over the prompt and two requests that share their
+    first ``n`` messages share their first ``n`` hashes.
+    """
+
+    digest = model.encode()
+    hashes = []
+    for message in messages:
+        h = hashlib.blake2b(digest, digest_size=16)
+        h.update(str(message.get("role", "")).encode())
+        h.update(b"\0")
+        content = message.get("content")
+        h.update(content.encode() if isinstance(content, str) else repr(content).encode())
+        digest = h.digest()
+        hashes.append(digest)
+    return tuple(hashes)
+
+
+async def call_with_hint(var: ContextVar, value: Any, call: Callable[[], Awaitable[T]]) -> T:
+    """Await ``call()`` with a transport hint such as ``PREFIX_HASHES`` set."""
+    token = var.set(value)
+    try:
+        return await call()
+    finally:
+        var.reset(token)
+
+
+async def stream_with_hint(var: ContextVar, value: Any, stream: AsyncIterator[Chunk]) -> AsyncIterator[Chunk]:
+    # The upstream request goes out on the first read, so the hint only has
+    # to be visible until then.
+    token = var.set(value)
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        return
+    finally:
+        var.reset(token)
+    yield first
+    async for chunk in stream:
+        yield chunk
+
+
+class AffinityTable:
+    """Bounded LRU map from prompt prefix hash to the endpoint that last served it."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.overrides = 0
+
+    def lookup(self, hashes: Sequence[bytes]) -> Optional[Any]:
+        """Endpoint recorded for the longest known prefix of ``hashes``."""
+        entries = self._entries
+        for digest in reversed(hashes):
+            endpoint = entries.get(digest)
+            if endpoint is not None:
+                entries.move_to_end(digest)
+                return endpoint
+        return None
+
+    def record(self, hashes: Sequence[bytes], endpoint: Any) -> None:
+        entries = self._entries
+        for digest in hashes:
+            entries[digest] = endpoint
+            entries.move_to_end(digest)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "overrides": self.overrides,
+        }
@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional, Tuple
+
+import httpx
+
+from .affinity import PREFIX_HASHES, AffinityTable
+from .config import EndpointConfig, LoadBalancerConfig
+
+logger = logging.getLogger(__name__)
+
+# URLs of the endpoints that already have the requested model loaded, from
+# residency polling. pick() prefers them over replicas that would load it.
+RESIDENT_ON: ContextVar[Optional[FrozenSet[str]]] = ContextVar("resident_on", default=None)
+# Send to exactly this endpoint URL, for requests addressed to one replica
+# such as residency polls and warm-ups.
+PINNED_ENDPOINT: ContextVar[Optional[str]] = ContextVar("pinned_endpoint", default=None)
+
+
+class Endpoint:
+    """Live state for one replica of a provider backend."""
+
+    def __init__(self, config: EndpointConfig, transport: httpx.AsyncBaseTransport):
+        self.url = httpx.URL(config.url.rstrip("/"))
+        self.weight = config.weight
+        self.transport = transport
+        self.outstanding = 0
+        self.ewma_latency = 0.0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.current_weight = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": str(self.url),
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "ewma_latency": round(self.ewma_latency, 4),
+            "healthy": self.available(time.monotonic()),
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class LoadBalancer:
+    """Pick an endpoint per request and eject replicas that keep failing.
+
+    Ejection is passive: ``eject_after_failures`` consecutive failures remove
+    an endpoint for ``eject_duration`` seconds, doubling on each repeat
+    ejection up to ``max_eject_duration``. When ``health_check_path`` is set,
+    ejected endpoints are only readmitted once that path answers with 2xx.
+
+    With ``prefix_affinity``, a request whose leading messages were seen
+    before goes back to the endpoint that served them, where the server can
+    reuse its KV cache, unless that endpoint is unavailable or already has
+    ``affinity_max_outstanding`` requests in flight. Otherwise, endpoints
+    known to have the model loaded (``resident``) are preferred.
+    """
+
+    def __init__(self, config: LoadBalancerConfig, endpoints: List[Endpoint]):
+        self.config = config
+        self.endpoints = endpoints
+        self.affinity = AffinityTable(config.affinity_table_size) if config.prefix_affinity else None
+        self.resident_picks = 0
+
+    def pick(
+        self,
+        exclude: Optional[List[Endpoint]] = None,
+        prefixes: Optional[Tuple[bytes, ...]] = None,
+        resident: Optional[FrozenSet[str]] = None,
+    ) -> Endpoint:
+        now = time.monotonic()
+        if prefixes and self.affinity is not None:
+            endpoint = self._pick_affine(prefixes, exclude, now)
+            if endpoint is not None:
+                return endpoint
+
+        candidates = [
+            e for e in self.endpoints if e.available(now) and (not exclude or e not in exclude)
+        ]
+        if not candidates:
+            # Fail open: try whichever endpoint is due back soonest.
+            pool = [e for e in self.endpoints if not exclude or e not in exclude] or self.endpoints
+            return min(pool, key=lambda e: e.ejected_until)
+        if resident:
+            warm = [e for e in candidates if str(e.url) in resident]
+            if warm:
+                self.resident_picks += 1
+                candidates = warm
+        if len(candidates) == 1:
+            return candidates[0]
+
+        policy = self.config.policy
+        if policy == "round_robin":
+            return self._smooth_weighted_round_robin(candidates)
+        if policy == "least_outstanding":
+            return min(candidates, key=lambda e: (e.outstanding / e.weight, random.random()))
+        a, b = _two_distinct(candidates)
+        return a if self._cost(a) <= self._cost(b) else b
+
+    def _pick_affine(
+        self, prefixes: Tuple[bytes, ...], exclude: Optional[List[Endpoint]], now: float
+    ) -> Optional[Endpoint]:
+        endpoint = self.affinity.lookup(prefixes)
+        if endpoint is None:
+            self.affinity.misses += 1
+            return None
+        if (
+            endpoint.available(now)
+            and (not exclude or endpoint not in exclude)
+            and endpoint.outstanding < self.config.affinity_max_outstanding
+        ):
+            self.affinity.hits += 1
+            return endpoint
+        self.affinity.overrides += 1
+        return None
+
+    def record_success(self, endpoint: Endpoint, latency: float) -> None:
+        alpha = self.config.ewma_alpha
+        if endpoint.ewma_latency == 0.0:
+            endpoint.ewma_latency = latency
+        else:
+            endpoint.ewma_latency += alpha * (latency - endpoint.ewma_latency)
+        endpoint.consecutive_failures = 0
+        endpoint.ejections = 0
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        endpoint.failures += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.consecutive_failures >= self.config.eject_after_failures:
+            self._eject(endpoint)
+
+    def _eject(self, endpoint: Endpoint) -> None:
+        endpoint.ejections += 1
+        endpoint.consecutive_failures = 0
+        if self.config.health_check_path:
+            endpoint.ejected_until = float("inf")
+            logger.warning(f"Ejected endpoint {endpoint.url} until its health check passes")
+            return
+        duration = min(
+            self.config.eject_duration * 2 ** (endpoint.ejections - 1),
+            self.config.max_eject_duration,
+        )
+        endpoint.ejected_until = time.monotonic() + duration
+        logger.warning(f"Ejected endpoint {endpoint.url} for {duration:.0f}s")
+
+    def _cost(self, endpoint: Endpoint) -> float:
+        return endpoint.ewma_latency * (endpoint.outstanding + 1) / endpoint.weight
+
+    def _smooth_weighted_round_robin(self, candidates: List[Endpoint]) -> Endpoint:
+        total = 0.0
+        best = candidates[0]
+        for endpoint in candidates:
+            endpoint.current_weight += endpoint.weight
+            total += endpoint.weight
+            if endpoint.current_weight > best.current_weight:
+                best = endpoint
+        best.current_weight -= total
+        return best
+
+
+class _TrackedStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+
+
+class BalancingTransport(httpx.AsyncBaseTransport):
+    """httpx transport spreading requests for ``base_url`` across replicas.
+
+    Providers keep building URLs from ``base_url``; this transport rewrites the
+    prefix to the chosen endpoint, so adapters need no changes. Each endpoint
+    has its own connection pool. Requests that fail to connect are retried on
+    another endpoint since nothing has been sent yet.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        endpoints: List[Endpoint],
+        config: LoadBalancerConfig,
+    ):
+        self.base_url = str(httpx.URL(base_url)).rstrip("/")
+        self.balancer = LoadBalancer(config, endpoints)
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        return self.balancer.endpoints
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.balancer.config.health_check_path and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_check_loop())
+
+        url = str(request.url)
+        suffix = url[len(self.base_url):] if url.startswith(self.base_url) else None
+        prefixes = PREFIX_HASHES.get()
+        resident = RESIDENT_ON.get()
+        pinned = self._pinned(PINNED_ENDPOINT.get())
+        tried: List[Endpoint] = []
+
+        while True:
+            endpoint = pinned or self.balancer.pick(exclude=tried, prefixes=prefixes, resident=resident)
+            tried.append(endpoint)
+            if suffix is not None:
+                request.url = httpx.URL(str(endpoint.url) + suffix)
+                request.headers["Host"] = request.url.netloc.decode("ascii")
+
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            start = time.monotonic()
+            try:
+                response = await endpoint.transport.handle_async_request(request)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                endpoint.outstanding -= 1
+                self.balancer.record_failure(endpoint)
+                if suffix is None or pinned is not None or len(tried) >= len(self.endpoints):
+                    raise
+                continue
+            except httpx.TransportError:
+                endpoint.outstanding -= 1
+                self.balancer.record_failure(endpoint)
+                raise
+            except BaseException:
+                endpoint.outstanding -= 1
+                raise
+
+            if response.status_code >= 500:
+                self.balancer.record_failure(endpoint)
+            else:
+                self.balancer.record_success(endpoint, time.monotonic() - start)
+                if prefixes and self.balancer.affinity is not None:
+                    self.balancer.affinity.record(prefixes, endpoint)
+
+            def release(endpoint: Endpoint = endpoint) -> None:
+                endpoint.outstanding -= 1
+
+            response.stream = _TrackedStream(response.stream, release)
+            return response
+
+    def _pinned(self, url: Optional[str]) -> Optional[Endpoint]:
+        if url is None:
+            return None
+        for endpoint in self.endpoints:
+            if str(endpoint.url) == url:
+                return endpoint
+        raise ValueError(f"No endpoint {url} behind {self.base_url}")
+
+    async def _health_check_loop(self) -> None:
+        path = self.balancer.config.health_check_path
+        while True:
+            await asyncio.sleep(self.balancer.config.health_check_interval)
+            now = time.monotonic()
+            for endpoint in self.endpoints:
+                if endpoint.available(now):
+                    continue
+                request = httpx.Request("GET", str(endpoint.url) + path)
+                try:
+                    response = await endpoint.transport.handle_async_request(request)
+                    await response.aclose()
+                    healthy = response.status_code < 300
+                except httpx.TransportError:
+                    healthy = False
+                if healthy:
+                    endpoint.ejected_until = 0.0
+                    endpoint.ejections = 0
+                    logger.info(f"Endpoint {endpoint.url} passed health check")
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for endpoint in self.endpoints:
+            await endpoint.transport.aclose()
+
+
+def _two_distinct(candidates: List[Endpoint]) -> Tuple[Endpoint, Endpoint]:
+    """Weighted sample of two different endpoints, without replacement."""
+    first = random.choices(candidates, weights=[e.weight for e in candidates])[0]
+    rest = [e for e in candidates if e is not first]
+    second = random.choices(rest, weights=[e.weight for e in rest])[0]
+    return first, second
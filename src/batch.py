@@ -0,0 +1,497 @@
+"""Offline batch execution of JSONL chat completion requests.
+
+Input lines are either OpenAI batch records::
+
+    {"custom_id": "req-1", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+
+or bare chat completion request bodies, in which case the line number is used
+as the ``custom_id``. Results are appended to the output file as OpenAI batch
+output records as soon as each request finishes, so output order does not
+follow input order.
+
+Run from the command line with::
+
+    python -m src.batch requests.jsonl results.jsonl --checkpoint results.ckpt
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .config import DEFAULT_CONFIG_PATH, BatchConfig, load_config
+from .jsonlib import plain, usage_of
+from .models import InvalidRequest, parse_chat_request
+from .router import ModelRouter, is_retryable
+from .scheduler import Ticket
+from .tokens import ContextLengthExceeded
+from .usage import UsageTracker
+
+logger = logging.getLogger(__name__)
+
+# Offline work queues behind interactive traffic on scheduled providers.
+BATCH_TICKET = Ticket(priority="batch", tenant="batch")
+
+
+class BatchProgress:
+    def __init__(self, total: int):
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.completion_tokens = 0
+        self.started_at = time.time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        done = self.completed + self.failed
+        return {
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "elapsed": round(elapsed, 1),
+            "requests_per_second": round(done / elapsed, 2),
+            "tokens_per_second": round(self.completion_tokens / elapsed, 1),
+        }
+
+
+class Checkpoint:
+    """Tracks which input lines have finished, in bounded memory.
+
+    Lines below ``watermark`` are all done; ``done`` only holds finished lines
+    above it, which is bounded by how far work runs ahead of the slowest
+    in-flight request.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.watermark = 0
+        self.done: Set[int] = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.watermark = data.get("watermark", 0)
+            self.done = set(data.get("done", []))
+
+    def is_done(self, index: int) -> bool:
+        return index < self.watermark or index in self.done
+
+    def mark(self, index: int) -> None:
+        self.done.add(index)
+        while self.watermark in self.done:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"watermark": self.watermark, "done": sorted(self.done)}, f)
+        os.replace(tmp, self.path)
+
+
+def parse_line(line: str, index: int) -> Tuple[str, Dict[str, Any]]:
+    """Return ``(custom_id, request_body)`` for one input line."""
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Each line must be a JSON object")
+    if "body" in record:
+        url = record.get("url", "/v1/chat/completions")
+        if url != "/v1/chat/completions":
+            raise ValueError(f"Unsupported batch url: {url}")
+        return str(record.get("custom_id", index)), record["body"]
+    return str(record.get("custom_id", index)), record
+
+
+def count_lines(path: str) -> int:
+    count = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                count += 1
+    return count
+
+
+class BatchRunner:
+    """Run a JSONL file through the router with per-provider concurrency limits.
+
+    The reader only stays ``max_concurrency`` lines ahead of the workers, so
+    memory use does not grow with the size of the input file. Lines are not
+    rate limited: batch concurrency and the "batch" scheduler priority bound
+    them instead, and a 429 would only fail lines that are meant to wait.
+    """
+
+    def __init__(
+        self,
+        router: ModelRouter,
+        config: BatchConfig,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        usage: Optional[UsageTracker] = None,
+        tenant: Optional[str] = None,
+    ):
+        self.router = router
+        self.config = config
+        self.on_progress = on_progress
+        # Completed lines are recorded under the key that created the batch.
+        self.usage = usage
+        self.tenant = tenant
+        self.progress = BatchProgress(0)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, provider_name: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(provider_name)
+        if semaphore is None:
+            limit = self.config.provider_concurrency.get(
+                provider_name, self.config.default_concurrency
+            )
+            semaphore = self._semaphores[provider_name] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def run(
+        self, input_path: str, output_path: str, checkpoint_path: Optional[str] = None
+    ) -> Dict[str, Any]:
+        checkpoint = Checkpoint(checkpoint_path)
+        self.progress = BatchProgress(count_lines(input_path))
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.config.max_concurrency)
+
+        with open(output_path, "a") as output:
+            workers = [
+                asyncio.create_task(self._worker(queue, output, checkpoint))
+                for _ in range(self.config.max_concurrency)
+            ]
+            reporter = asyncio.create_task(self._report(output, checkpoint))
+            try:
+                index = 0
+                with open(input_path) as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        if checkpoint.is_done(index):
+                            self.progress.skipped += 1
+                        else:
+                            await queue.put((index, line))
+                        index += 1
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                reporter.cancel()
+                output.flush()
+                checkpoint.save()
+
+        snapshot = self.progress.snapshot()
+        if self.on_progress is not None:
+            self.on_progress(snapshot)
+        return snapshot
+
+    async def _worker(self, queue: asyncio.Queue, output, checkpoint: Checkpoint) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, line = item
+            record = await self._process(index, line)
+            output.write(json.dumps(record) + "\n")
+            checkpoint.mark(index)
+
+    async def _report(self, output, checkpoint: Checkpoint) -> None:
+        while True:
+            await asyncio.sleep(self.config.progress_interval)
+            output.flush()
+            checkpoint.save()
+            snapshot = self.progress.snapshot()
+            if self.on_progress is not None:
+                self.on_progress(snapshot)
+            else:
+                logger.info(f"Batch progress: {snapshot}")
+
+    async def _process(self, index: int, line: str) -> Dict[str, Any]:
+        custom_id = str(index)
+        # Hold on to one router per request; a config reload may swap it.
+        router = self.router
+        try:
+            custom_id, body = parse_line(line, index)
+            request = parse_chat_request(body)
+            messages = request.messages
+            prompt_estimate = router.estimator.count(messages)
+            resolved, params = router.fit_context(
+                router.resolve(request.model), prompt_estimate, request.provider_params()
+            )
+        except ContextLengthExceeded as e:
+            self.progress.failed += 1
+            return _error_record(custom_id, "context_length_exceeded", str(e), 400)
+        except (ValueError, InvalidRequest) as e:
+            self.progress.failed += 1
+            return _error_record(custom_id, "invalid_request", str(e), 400)
+
+        semaphore = self._semaphore(resolved.provider_name)
+
+        for attempt in range(self.config.max_retries + 1):
+            try:
+                async with semaphore:
+                    response = await router.chat_completion(
+                        resolved, messages, params, BATCH_TICKET, prompt_tokens=prompt_estimate
+                    )
+            except Exception as e:
+                if is_retryable(e) and attempt < self.config.max_retries:
+                    await asyncio.sleep(self.config.retry_backoff * 2**attempt)
+                    continue
+                self.progress.failed += 1
+                return _error_record(custom_id, "request_failed", str(e), 500)
+
+            self.progress.completed += 1
+            if self.usage is not None:
+                self.usage.record_response(
+                    self.tenant, resolved.model_config.name, response, prompt_estimate
+                )
+            usage = usage_of(response) or {}
+            self.progress.completion_tokens += usage.get("completion_tokens", 0) or 0
+            return {
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": custom_id,
+                "response": {
+                    "status_code": 200,
+                    "request_id": response.get("id", ""),
+                    "body": plain(response),
+                },
+                "error": None,
+            }
+
+        raise AssertionError("unreachable")  # pragma: no cover
+
+
+def _error_record(custom_id: str, code: str, message: str, status_code: int) -> Dict[str, Any]:
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": custom_id,
+        "response": {"status_code": status_code, "request_id": "", "body": None},
+        "error": {"code": code, "message": message},
+    }
+
+
+class BatchManager:
+    """Tracks batches started through the ``/v1/batches`` endpoints.
+
+    Each batch keeps its metadata, output and checkpoint under
+    ``BatchConfig.directory`` so an interrupted batch can be resumed.
+    """
+
+    def __init__(
+        self, router: ModelRouter, config: BatchConfig, usage: Optional[UsageTracker] = None
+    ):
+        self.router = router
+        self.config = config
+        self.usage = usage
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        # Usage label of the key that created each batch; saved with it but
+        # not part of the batch object clients see.
+        self._tenants: Dict[str, Optional[str]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._runners: Dict[str, BatchRunner] = {}
+
+    def set_router(self, router: ModelRouter) -> None:
+        """Point new and running batches at a reloaded router."""
+        self.router = router
+        for runner in self._runners.values():
+            runner.router = router
+
+    def file_path(self, name: str) -> str:
+        if os.path.basename(name) != name or name in ("", ".", ".."):
+            raise ValueError(f"Invalid file name: {name}")
+        return os.path.join(self.config.directory, name)
+
+    def readable_file(self, name: str, tenant: Optional[str] = None) -> str:
+        """Path of a file a client may download.
+
+        With ``tenant``, only the input and output files of that key's
+        batches are readable; batch metadata and checkpoints never are.
+        """
+        path = self.file_path(name)
+        if tenant is None:
+            return path
+        if name.endswith("_output.jsonl"):
+            self.get(name[: -len("_output.jsonl")], tenant)
+            return path
+        if any(
+            b["input_file_id"] == name and self._tenants.get(b["id"]) == tenant
+            for b in self._batches.values()
+        ):
+            return path
+        raise KeyError(name)
+
+    def create(
+        self,
+        input_file_id: str,
+        completion_window: str = "24h",
+        metadata: Optional[Dict[str, Any]] = None,
+        tenant: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        input_path = self.file_path(input_file_id)
+        if not os.path.exists(input_path):
+            raise ValueError(f"Input file '{input_file_id}' not found")
+
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": "/v1/chat/completions",
+            "input_file_id": input_file_id,
+            "output_file_id": f"{batch_id}_output.jsonl",
+            "completion_window": completion_window,
+            "status": "in_progress",
+            "created_at": int(time.time()),
+            "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": metadata or {},
+        }
+        self._tenants[batch_id] = tenant
+        self._start(batch)
+        return batch
+
+    def resume(self, batch_id: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        batch = self.get(batch_id, tenant)
+        if batch_id in self._tasks and not self._tasks[batch_id].done():
+            return batch
+        batch["status"] = "in_progress"
+        batch["completed_at"] = None
+        self._start(batch)
+        return batch
+
+    def get(self, batch_id: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        """Look up a batch; with ``tenant``, only one created by that key."""
+        batch = self._batches.get(batch_id)
+        if batch is None:
+            meta_path = self.file_path(f"{batch_id}.json")
+            if not os.path.exists(meta_path):
+                raise KeyError(batch_id)
+            with open(meta_path) as f:
+                batch = json.load(f)
+            self._tenants[batch_id] = batch.pop("tenant", None)
+            self._batches[batch_id] = batch
+        if tenant is not None and self._tenants.get(batch_id) != tenant:
+            raise KeyError(batch_id)
+        return batch
+
+    def list(self, tenant: Optional[str] = None) -> List[Dict[str, Any]]:
+        batches = [
+            b for b in self._batches.values() if tenant is None or self._tenants.get(b["id"]) == tenant
+        ]
+        return sorted(batches, key=lambda b: b["created_at"], reverse=True)
+
+    def cancel(self, batch_id: str, tenant: Optional[str] = None) -> Dict[str, Any]:
+        batch = self.get(batch_id, tenant)
+        task = self._tasks.get(batch_id)
+        if task is not None and not task.done():
+            batch["status"] = "cancelling"
+            task.cancel()
+        return batch
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    def _start(self, batch: Dict[str, Any]) -> None:
+        os.makedirs(self.config.directory, exist_ok=True)
+        self._batches[batch["id"]] = batch
+        self._save(batch)
+        self._tasks[batch["id"]] = asyncio.create_task(self._run(batch))
+
+    async def _run(self, batch: Dict[str, Any]) -> None:
+        def update(snapshot: Dict[str, Any]) -> None:
+            batch["request_counts"] = {
+                "total": snapshot["total"],
+                "completed": snapshot["completed"] + snapshot["skipped"],
+                "failed": snapshot["failed"],
+            }
+            batch["progress"] = snapshot
+
+        runner = self._runners[batch["id"]] = BatchRunner(
+            self.router,
+            self.config,
+            on_progress=update,
+            usage=self.usage,
+            tenant=self._tenants.get(batch["id"]),
+        )
+        try:
+            await runner.run(
+                self.file_path(batch["input_file_id"]),
+                self.file_path(batch["output_file_id"]),
+                self.file_path(f"{batch['id']}.checkpoint.json"),
+            )
+            batch["status"] = "completed"
+        except asyncio.CancelledError:
+            batch["status"] = "cancelled"
+        except Exception as e:
+            logger.error(f"Batch {batch['id']} failed: {e}", exc_info=True)
+            batch["status"] = "failed"
+            batch["errors"] = {"data": [{"message": str(e)}]}
+        finally:
+            del self._runners[batch["id"]]
+            update(runner.progress.snapshot())
+            batch["completed_at"] = int(time.time())
+            self._save(batch)
+
+    def _save(self, batch: Dict[str, Any]) -> None:
+        with open(self.file_path(f"{batch['id']}.json"), "w") as f:
+            json.dump({**batch, "tenant": self._tenants.get(batch["id"])}, f)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    config = load_config(args.config)
+    batch_config = config.batch.model_copy()
+    if args.concurrency is not None:
+        batch_config.max_concurrency = args.concurrency
+    if args.provider_concurrency is not None:
+        batch_config.default_concurrency = args.provider_concurrency
+    if args.max_retries is not None:
+        batch_config.max_retries = args.max_retries
+
+    router = ModelRouter(config)
+
+    def report(snapshot: Dict[str, Any]) -> None:
+        done = snapshot["completed"] + snapshot["failed"] + snapshot["skipped"]
+        print(
+            f"{done}/{snapshot['total']} done ({snapshot['failed']} failed, "
+            f"{snapshot['skipped']} resumed) "
+            f"{snapshot['requests_per_second']} req/s "
+            f"{snapshot['tokens_per_second']} tok/s",
+            flush=True,
+        )
+
+    usage = UsageTracker(config.usage) if config.usage.enabled else None
+    runner = BatchRunner(router, batch_config, on_progress=report, usage=usage)
+    try:
+        await runner.run(args.input, args.output, args.checkpoint)
+    finally:
+        await router.close()
+        if usage is not None:
+            await usage.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat completion requests.")
+    parser.add_argument("input", help="Input JSONL file")
+    parser.add_argument("output", help="Output JSONL file (appended to)")
+    parser.add_argument("--config", default=os.getenv("ROUTER_CONFIG", DEFAULT_CONFIG_PATH))
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted run")
+    parser.add_argument("--concurrency", type=int, help="Maximum requests in flight overall")
+    parser.add_argument("--provider-concurrency", type=int, help="Default per-provider limit")
+    parser.add_argument("--max-retries", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
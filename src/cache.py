@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from .config import CacheConfig
+from . import jsonlib
+from .jsonlib import RawJSON
+from .sse import Chunk, is_done
+
+
+def request_digest(messages: list, params: dict, stream: bool) -> str:
+    """Return a stable hash of what a request asks for.
+
+    Computed once per request and shared by the response cache and the
+    coalescer. Keys are sorted so that dict ordering in the incoming request
+    does not produce distinct entries.
+    """
+
+    canonical = jsonlib.canonical({"messages": messages, "params": params, "stream": stream})
+    return hashlib.sha256(canonical).hexdigest()
+
+
+def make_cache_key(provider_name: str, provider_model_id: str, digest: str) -> str:
+    """Key for the request behind ``digest`` when sent to one provider model."""
+    return f"{provider_name}/{provider_model_id}/{digest}"
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    expires_at: float
+    size: int
+
+
+class DiskCache:
+    """SQLite-backed second tier so cached responses survive restarts."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # WAL and a busy timeout let several worker processes share the file.
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self.delete(key)
+            return None
+        return row[0], row[1]
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """Exact-match response cache with LRU eviction and per-entry TTL.
+
+    Non-streaming responses are stored as the OpenAI-shaped dict; streamed
+    responses are stored as the list of SSE chunks so they can be replayed
+    verbatim.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        default_ttl: int = 300,
+        disk_path: Optional[str] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._disk = DiskCache(disk_path) if disk_path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config: CacheConfig) -> "ResponseCache":
+        return cls(
+            max_entries=config.max_entries,
+            max_bytes=config.max_bytes,
+            default_ttl=config.default_ttl,
+            disk_path=config.disk_path,
+        )
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        now = time.time()
+        if entry is not None:
+            if entry.expires_at >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            self._remove(key)
+
+        if self._disk is not None:
+            row = await asyncio.to_thread(self._disk.get, key)
+            if row is not None:
+                encoded, expires_at = row
+                value = json.loads(encoded)
+                self._insert(key, value, expires_at, len(encoded))
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        if isinstance(value, RawJSON):
+            encoded = value.body.decode()
+        else:
+            encoded = json.dumps(value, separators=(",", ":"))
+        if len(encoded) > self.max_bytes:
+            return
+
+        expires_at = time.time() + ttl
+        self._insert(key, value, expires_at, len(encoded))
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, encoded, expires_at)
+
+    async def record_stream(
+        self, key: str, stream: AsyncIterator[Chunk], ttl: Optional[int] = None
+    ) -> AsyncIterator[Chunk]:
+        """Pass ``stream`` through, storing its chunks once it completes.
+
+        Streams that fail, are abandoned or grow past the memory bound are
+        never stored. Byte chunks are only decoded once, when stored.
+        """
+
+        chunks: Optional[List[Chunk]] = []
+        size = 0
+        async for chunk in stream:
+            if chunks is not None:
+                size += len(chunk)
+                if size > self.max_bytes:
+                    chunks = None
+                else:
+                    chunks.append(chunk)
+            yield chunk
+
+        if chunks and is_done(chunks[-1]):
+            stored = [c.decode() if isinstance(c, bytes) else c for c in chunks]
+            await self.set(key, stored, ttl)
+
+    @staticmethod
+    async def replay(chunks: List[str]) -> AsyncIterator[str]:
+        for chunk in chunks:
+            yield chunk
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk": self._disk is not None,
+        }
+
+    async def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+    def _insert(self, key: str, value: Any, expires_at: float, size: int) -> None:
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CacheEntry(value=value, expires_at=expires_at, size=size)
+        self._bytes += size
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
@@ -0,0 +1,281 @@
+"""Asynchronous capture of chat completion traffic to rotating JSONL files.
+
+Each request handled by ``/v1/chat/completions`` becomes one record::
+
+    {"id": ..., "ts": <unix start>, "model": ..., "provider": ..., "tenant": ...,
+     "stream": false, "request": {...}, "status": 200, "cache": "HIT" | null,
+     "latency_ms": ..., "ttft_ms": ..., "response": {...} | null,
+     "output": "...", "finish_reason": ..., "usage": {...}}
+
+The request handler only appends a record to a bounded queue; a background
+task drains it in batches and a worker thread serializes, assembles streamed
+output and writes gzip files. When the queue is full the record is dropped
+and counted rather than slowing the request down.
+
+Files are named ``capture-<time>-<pid>-<seq>.jsonl.gz`` so workers never
+share one, and each worker keeps at most ``max_files`` of its own.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from . import jsonlib
+from .config import CaptureConfig
+from .sse import Chunk
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureRecord:
+    """One request as seen by the handler; assembled off the event loop."""
+
+    __slots__ = (
+        "id", "ts", "start", "request", "model", "provider", "tenant", "status",
+        "cache", "latency", "ttft", "body", "chunks",
+    )
+
+    def __init__(self, request: Any, provider: Optional[str], tenant: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.ts = time.time()
+        self.start = time.perf_counter()
+        self.request = request.body
+        self.model = request.model
+        self.provider = provider
+        self.tenant = tenant
+        self.status = 0
+        self.cache: Optional[str] = None
+        self.latency = 0.0
+        self.ttft: Optional[float] = None
+        self.body: Optional[bytes] = None
+        self.chunks: Optional[List[Chunk]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        record: Dict[str, Any] = {
+            "id": self.id,
+            "ts": self.ts,
+            "model": self.model,
+            "provider": self.provider,
+            "tenant": self.tenant,
+            "stream": self.chunks is not None,
+            "request": self.request,
+            "status": self.status,
+            "cache": self.cache,
+            "latency_ms": round(self.latency * 1000, 3),
+            "ttft_ms": round(self.ttft * 1000, 3) if self.ttft is not None else None,
+            "response": None,
+            "output": None,
+            "finish_reason": None,
+            "usage": None,
+        }
+        if self.chunks is not None:
+            record.update(assemble_stream(self.chunks))
+        elif self.body:
+            try:
+                response = jsonlib.loads(self.body)
+            except ValueError:
+                response = self.body.decode("utf-8", "replace")
+            record["response"] = response
+            if isinstance(response, dict):
+                record["usage"] = response.get("usage")
+                choices = response.get("choices") or [{}]
+                record["output"] = (choices[0].get("message") or {}).get("content")
+                record["finish_reason"] = choices[0].get("finish_reason")
+        return record
+
+
+def assemble_stream(chunks: List[Chunk]) -> Dict[str, Any]:
+    """Content, finish reason, usage and any error of an OpenAI SSE stream."""
+
+    parts: List[str] = []
+    finish_reason = None
+    usage = None
+    error = None
+    raw = b"".join(c if isinstance(c, bytes) else c.encode() for c in chunks)
+    for line in raw.split(b"\n"):
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if not data or data == b"[DONE]":
+            continue
+        try:
+            event = jsonlib.loads(data)
+        except ValueError:
+            continue
+        if event.get("error"):
+            error = event["error"]
+        if event.get("usage"):
+            usage = event["usage"]
+        for choice in event.get("choices") or ():
+            content = (choice.get("delta") or {}).get("content")
+            if content:
+                parts.append(content)
+            if choice.get("finish_reason"):
+                finish_reason = choice["finish_reason"]
+    result: Dict[str, Any] = {"output": "".join(parts), "finish_reason": finish_reason, "usage": usage}
+    if error is not None:
+        result["error"] = error
+    return result
+
+
+class CaptureLog:
+    def __init__(self, config: CaptureConfig):
+        self.config = config
+        self._queue: "asyncio.Queue[CaptureRecord]" = asyncio.Queue(maxsize=config.max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self._file: Optional[gzip.GzipFile] = None
+        self._file_bytes = 0
+        self._file_opened = 0.0
+        self._sequence = 0
+        # The writer thread of a cancelled batch may still be running on close.
+        self._lock = threading.Lock()
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        os.makedirs(config.directory, exist_ok=True)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def begin(self, request: Any, provider: Optional[str], tenant: Optional[str]) -> CaptureRecord:
+        return CaptureRecord(request, provider, tenant)
+
+    def finish(self, record: CaptureRecord, response: Any) -> Any:
+        """Queue ``record`` once ``response`` is complete; returns the response.
+
+        Streaming responses get their body iterator wrapped so the record is
+        queued when the stream ends, with every chunk it carried.
+        """
+
+        record.status = response.status_code
+        record.cache = response.headers.get("x-cache")
+        iterator = getattr(response, "body_iterator", None)
+        if iterator is None:
+            record.body = response.body
+            record.latency = time.perf_counter() - record.start
+            self._enqueue(record)
+        else:
+            record.chunks = []
+            response.body_iterator = self._tap(record, iterator)
+        return response
+
+    async def _tap(self, record: CaptureRecord, stream: AsyncIterator[Chunk]) -> AsyncIterator[Chunk]:
+        chunks = record.chunks
+        try:
+            async for chunk in stream:
+                if record.ttft is None:
+                    record.ttft = time.perf_counter() - record.start
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            record.latency = time.perf_counter() - record.start
+            self._enqueue(record)
+
+    def _enqueue(self, record: CaptureRecord) -> None:
+        try:
+            self._queue.put_nowait(record)
+            self.captured += 1
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _run(self) -> None:
+        queue = self._queue
+        batch_size = self.config.batch_size
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            await self._write_batch(batch)
+            if len(batch) < batch_size:
+                # Let a batch build up rather than writing every record alone.
+                await asyncio.sleep(self.config.flush_interval)
+
+    async def _write_batch(self, batch: List[CaptureRecord]) -> None:
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Failed to write {len(batch)} capture records: {e}")
+
+    def _write(self, batch: List[CaptureRecord]) -> None:
+        lines = b"".join(jsonlib.dumps(record.to_dict()) + b"\n" for record in batch)
+        with self._lock:
+            self._append(lines)
+
+    def _append(self, lines: bytes) -> None:
+        if self._file is not None and (
+            self._file_bytes >= self.config.max_file_bytes
+            or time.time() - self._file_opened >= self.config.rotate_interval
+        ):
+            self._close_file()
+        if self._file is None:
+            self._open_file()
+        self._file.write(lines)
+        # Sync-flush so the file is readable up to here while still open.
+        self._file.flush()
+        self._file_bytes += len(lines)
+
+    def _open_file(self) -> None:
+        pid = os.getpid()
+        self._sequence += 1
+        name = f"capture-{time.strftime('%Y%m%d-%H%M%S')}-{pid}-{self._sequence}.jsonl.gz"
+        self._file = gzip.open(os.path.join(self.config.directory, name), "wb")
+        self._file_bytes = 0
+        self._file_opened = time.time()
+
+        if self.config.max_files:
+            own = sorted(
+                glob.glob(os.path.join(self.config.directory, f"capture-*-{pid}-*.jsonl.gz")),
+                key=os.path.getmtime,
+            )
+            for path in own[: -self.config.max_files]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _close_locked(self) -> None:
+        with self._lock:
+            self._close_file()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "written": self.written,
+            "failed": self.failed,
+            "queued": self._queue.qsize(),
+            "directory": self.config.directory,
+        }
+
+    async def close(self) -> None:
+        """Write whatever is still queued and close the current file."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._write_batch(batch)
+        await asyncio.to_thread(self._close_locked)
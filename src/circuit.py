@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .config import CircuitBreakerConfig
+from .shared import SharedCircuit
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Error-rate and latency circuit breaker for one provider/model target.
+
+    Outcomes are tracked over a count-based sliding window so every check and
+    update is O(1). Calls slower than ``slow_call_threshold`` count as
+    failures. Once open, the breaker rejects calls for ``open_duration``
+    seconds and then lets a single probe through; the probe's outcome closes
+    or re-opens it. A probe that never reports back is replaced after another
+    ``open_duration``.
+
+    With ``shared``, trips and resets are published to the other workers and
+    a closed breaker adopts an open state another worker published.
+    """
+
+    def __init__(self, config: CircuitBreakerConfig, shared: Optional[SharedCircuit] = None):
+        self.config = config
+        self.shared = shared
+        self.state = CLOSED
+        self._window: Deque[bool] = deque(maxlen=config.window_size)
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            if self.shared is None or not self.shared.due(time.monotonic()):
+                return True
+            self._sync()
+            if self.state == CLOSED:
+                return True
+
+        now = time.monotonic()
+        if self.state == OPEN:
+            if now - self._opened_at < self.config.open_duration:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self._probe_started = now
+            return True
+
+        # Half-open: only one probe at a time.
+        if now - self._probe_started < self.config.open_duration:
+            self.rejected += 1
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self, latency: float) -> None:
+        threshold = self.config.slow_call_threshold
+        if threshold is not None and latency > threshold:
+            self.record_failure()
+            return
+
+        if self.state == HALF_OPEN:
+            self._reset()
+            return
+        self._record(False)
+
+    def record_failure(self) -> None:
+        if self.state == HALF_OPEN:
+            self._trip()
+            return
+        self._record(True)
+        if (
+            len(self._window) >= self.config.min_calls
+            and self._failures / len(self._window) >= self.config.failure_rate_threshold
+        ):
+            self._trip()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "calls": len(self._window),
+            "failures": self._failures,
+            "rejected": self.rejected,
+        }
+
+    def _record(self, failed: bool) -> None:
+        if len(self._window) == self._window.maxlen and self._window[0]:
+            self._failures -= 1
+        self._window.append(failed)
+        if failed:
+            self._failures += 1
+
+    def _trip(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        if self.shared is not None:
+            self.shared.publish_open()
+
+    def _reset(self) -> None:
+        self.state = CLOSED
+        self._window.clear()
+        self._failures = 0
+        if self.shared is not None:
+            self.shared.publish_closed()
+
+    def _sync(self) -> None:
+        opened_at = self.shared.opened_at()
+        if opened_at is None:
+            return
+        age = time.time() - opened_at
+        if age < self.config.open_duration:
+            self.state = OPEN
+            self._opened_at = time.monotonic() - age
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .sse import Chunk
+
+
+class SharedStream:
+    """Single upstream stream fanned out to any number of subscribers.
+
+    Chunks are buffered for the lifetime of the stream so subscribers that
+    attach late first replay everything already sent, then follow live. The
+    upstream is cancelled once the last subscriber goes away; ``on_done`` runs
+    first, so nobody can join a stream that is being torn down.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[Chunk],
+        on_done: Optional[Callable[[], None]] = None,
+    ):
+        self.chunks: List[Chunk] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_done = on_done
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Chunk]) -> None:
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = ConnectionError("Shared upstream stream was cancelled")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            if self._on_done is not None:
+                self._on_done()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[Chunk]:
+        index = 0
+        self.subscribers += 1
+        try:
+            while True:
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                    yield chunk
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                if self._on_done is not None:
+                    self._on_done()
+                self._task.cancel()
+
+
+class RequestCoalescer:
+    """Collapse identical in-flight requests onto one upstream call."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._streams: Dict[str, SharedStream] = {}
+
+    async def call(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``fn()``, sharing the result with concurrent callers of ``key``.
+
+        The upstream call runs in its own task so a cancelled caller does not
+        abort the request for everyone else waiting on it. It is cancelled
+        once every caller has gone.
+        """
+
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[task] = 0
+            task.add_done_callback(lambda t: self._finish_call(key, t))
+        self._waiters[task] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            if not task.done():
+                self._waiters[task] -= 1
+                if not self._waiters[task]:
+                    # Unlist it first so a new caller starts a fresh call.
+                    if self._calls.get(key) is task:
+                        del self._calls[key]
+                    task.cancel()
+
+    def stream(
+        self, key: str, factory: Callable[[], AsyncIterator[Chunk]]
+    ) -> AsyncIterator[Chunk]:
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = SharedStream(factory(), on_done=lambda: self._finish_stream(key, shared))
+            self._streams[key] = shared
+        return shared.subscribe()
+
+    def _finish_call(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        self._waiters.pop(task, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved when every waiter has gone.
+            task.exception()
+
+    def _finish_stream(self, key: str, shared: SharedStream) -> None:
+        # Runs twice for an abandoned stream; the key may be reused by then.
+        if self._streams.get(key) is shared:
+            del self._streams[key]
@@ -1,41 +1,268 @@
 from __future__ import annotations
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional, Union
 import os
 import re
 
 import yaml
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+
+class HedgeConfig(BaseModel):
+    # Model to race against the primary; defaults to the first fallback.
+    target: Optional[str] = None
+    # Fixed seconds before hedging. Unset: the primary's live `quantile`
+    # latency (time to first chunk for streams), once `min_samples` are in.
+    delay: Optional[float] = Field(default=None, gt=0)
+    quantile: float = Field(default=0.95, gt=0, lt=1)
+    min_delay: float = Field(default=0.05, ge=0)
+    min_samples: int = Field(default=20, gt=0)
+    window: int = Field(default=200, gt=0)
+    # At most this fraction of requests is hedged, with bursts of `max_burst`.
+    max_extra: float = Field(default=0.05, gt=0, le=1)
+    max_burst: float = Field(default=5.0, ge=1)
 
 
 class ModelConfig(BaseModel):
     name: str
     provider_model_id: str
     aliases: List[str] = Field(default_factory=list)
+    # Exact-match caching is opt-in: a sampled (temperature > 0) chat model
+    # would otherwise return the same "random" completion for the whole TTL.
+    cache: bool = False
+    cache_ttl: Optional[int] = None
+    fallbacks: List[str] = Field(default_factory=list)
+    priority: Literal["interactive", "default", "batch"] = "default"
+    # Similar-enough prompts may share a cached answer; see cache.near_duplicate.
+    deterministic_safe: bool = False
+    hedge: Optional[HedgeConfig] = None
+    # Load on every backend at startup (providers with residency enabled).
+    warm_up: bool = False
+    # Ollama keep_alive for this model; overrides residency.keep_alive.
+    keep_alive: Optional[Union[int, str]] = None
+    # Try a fallback whose model is already loaded before this one when this
+    # one is loaded nowhere.
+    prefer_loaded: bool = False
+    # Prompt plus output, and output alone, in tokens. Prompts that do not
+    # fit are rejected before any upstream call and max_tokens is clamped, or
+    # filled in when the client leaves it out.
+    context_window: Optional[int] = Field(default=None, gt=0)
+    max_output: Optional[int] = Field(default=None, gt=0)
+    # Models with larger windows that take prompts too long for this one.
+    overflow_to: List[str] = Field(default_factory=list)
+
+
+class PoolConfig(BaseModel):
+    max_connections: int = 50
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 5.0
+    http2: bool = False
+    connect_timeout: Optional[float] = None
+    read_timeout: Optional[float] = None
+    write_timeout: Optional[float] = None
+    pool_timeout: Optional[float] = None
+    # Connections opened per upstream (per endpoint when load balanced) at
+    # startup, and re-opened every rewarm_interval seconds once idle ones
+    # expire. Set keepalive_expiry above rewarm_interval to keep them warm.
+    prewarm_connections: int = Field(default=0, ge=0)
+    rewarm_interval: Optional[float] = Field(default=None, gt=0)
+
+
+class CircuitBreakerConfig(BaseModel):
+    window_size: int = 20
+    min_calls: int = 5
+    failure_rate_threshold: float = 0.5
+    slow_call_threshold: Optional[float] = None
+    open_duration: float = 30.0
+
+
+class EndpointConfig(BaseModel):
+    url: str
+    weight: float = Field(default=1.0, gt=0)
+
+
+class LoadBalancerConfig(BaseModel):
+    policy: Literal["p2c_ewma", "least_outstanding", "round_robin"] = "p2c_ewma"
+    ewma_alpha: float = 0.3
+    eject_after_failures: int = 3
+    eject_duration: float = 10.0
+    max_eject_duration: float = 300.0
+    health_check_path: Optional[str] = None
+    health_check_interval: float = 5.0
+    prefix_affinity: bool = False
+    affinity_table_size: int = Field(default=10000, gt=0)
+    affinity_max_outstanding: int = Field(default=4, gt=0)
+
+
+class SchedulerConfig(BaseModel):
+    max_concurrency: int = Field(default=4, gt=0)
+    max_queue: int = Field(default=64, ge=0)
+    queue_timeout: float = Field(default=30.0, gt=0)
+
+
+class ResidencyConfig(BaseModel):
+    # Track which models each backend has loaded (Ollama /api/ps, llama-swap
+    # /running) and prefer backends that have the requested one.
+    enabled: bool = False
+    poll_interval: float = Field(default=10.0, gt=0)
+    # Ollama keep_alive sent with every request and warm-up: seconds, a
+    # duration such as "30m", or -1 to keep models loaded indefinitely.
+    keep_alive: Optional[Union[int, str]] = None
 
 
 class ProviderConfig(BaseModel):
     type: str
-    base_url: str
+    base_url: str = ""
+    endpoints: List[EndpointConfig] = Field(default_factory=list)
+    load_balancer: LoadBalancerConfig = Field(default_factory=LoadBalancerConfig)
     api_key: Optional[str] = None
     enabled: bool = True
     timeout: int = 60
     max_retries: int = 2
+    coalesce: bool = True
+    stream_passthrough: bool = True
+    # Forward non-streaming bodies of OpenAI-compatible upstreams unparsed.
+    json_passthrough: bool = True
+    # Ask OpenAI-compatible upstreams for a final usage chunk on streams.
+    request_stream_usage: bool = True
+    expose_routed_model: bool = False
+    pool: PoolConfig = Field(default_factory=PoolConfig)
+    circuit_breaker: Optional[CircuitBreakerConfig] = None
+    scheduler: Optional[SchedulerConfig] = None
+    residency: ResidencyConfig = Field(default_factory=ResidencyConfig)
     models: List[ModelConfig]
 
+    @model_validator(mode="after")
+    def _default_base_url(self) -> "ProviderConfig":
+        # With several endpoints, base_url is only the prefix adapters build
+        # URLs from; the balancing transport swaps in the chosen replica.
+        if not self.base_url and self.endpoints:
+            self.base_url = self.endpoints[0].url
+        return self
+
+
+class ApiKeyConfig(BaseModel):
+    key: str
+    name: Optional[str] = None
+    requests_per_minute: Optional[int] = Field(default=None, gt=0)
+    tokens_per_minute: Optional[int] = Field(default=None, gt=0)
+    max_concurrent_streams: Optional[int] = Field(default=None, gt=0)
+    weight: float = Field(default=1.0, gt=0)
+    # May read usage recorded for other keys.
+    admin: bool = False
+
 
 class ServerConfig(BaseModel):
     host: str = "0.0.0.0"
     port: int = 8000
-    api_keys: List[str] = Field(default_factory=list)
+    api_keys: List[ApiKeyConfig] = Field(default_factory=list)
+    config_watch_interval: Optional[float] = Field(default=None, gt=0)
+    drain_timeout: float = 600.0
+
+    @field_validator("api_keys", mode="before")
+    @classmethod
+    def _plain_keys(cls, value):
+        # Bare strings are keys without limits.
+        if isinstance(value, list):
+            return [{"key": item} if isinstance(item, str) else item for item in value]
+        return value
+
+    def key_map(self) -> Dict[str, ApiKeyConfig]:
+        return {entry.key: entry for entry in self.api_keys}
+
+
+class NearDuplicateConfig(BaseModel):
+    enabled: bool = False
+    threshold: float = Field(default=0.9, gt=0, le=1)
+    num_perm: int = Field(default=128, gt=0)
+    bands: int = Field(default=16, gt=0)
+    shingle_size: int = Field(default=3, gt=0)
+    min_tokens: int = Field(default=16, ge=0)
+    max_entries: int = Field(default=10000, gt=0)
+
+    @model_validator(mode="after")
+    def _bands_divide(self) -> "NearDuplicateConfig":
+        if self.num_perm % self.bands:
+            raise ValueError("near_duplicate.num_perm must be a multiple of bands")
+        return self
+
+
+class CacheConfig(BaseModel):
+    enabled: bool = False
+    max_entries: int = 1024
+    max_bytes: int = 64 * 1024 * 1024
+    default_ttl: int = 300
+    disk_path: Optional[str] = None
+    near_duplicate: NearDuplicateConfig = Field(default_factory=NearDuplicateConfig)
+
+
+class BatchConfig(BaseModel):
+    directory: str = "batches"
+    max_concurrency: int = 16
+    default_concurrency: int = 4
+    provider_concurrency: Dict[str, int] = Field(default_factory=dict)
+    max_retries: int = 3
+    retry_backoff: float = 1.0
+    progress_interval: float = 5.0
+
+
+class CaptureConfig(BaseModel):
+    enabled: bool = False
+    directory: str = "captures"
+    max_queue: int = Field(default=10000, gt=0)
+    batch_size: int = Field(default=256, gt=0)
+    flush_interval: float = Field(default=1.0, gt=0)
+    # A new file is started at whichever limit is reached first.
+    max_file_bytes: int = Field(default=64 * 1024 * 1024, gt=0)
+    rotate_interval: float = Field(default=3600, gt=0)
+    max_files: Optional[int] = Field(default=None, gt=0)
+
+
+class UsageConfig(BaseModel):
+    enabled: bool = False
+    path: str = "state/usage.sqlite3"
+    flush_interval: float = Field(default=10.0, gt=0)
+
+
+class TokenizerConfig(BaseModel):
+    # "heuristic", "tiktoken" (needs the tiktoken package) or
+    # "module:function" for a callable that counts the tokens of a string.
+    backend: str = "heuristic"
+    encoding: str = "cl100k_base"
+    chars_per_token: float = Field(default=4.0, gt=0)
+    # Role and separator tokens added per message.
+    per_message_tokens: int = Field(default=4, ge=0)
+    # Counts of messages at least cache_min_chars long are kept, so resent
+    # conversation history is not tokenized again.
+    cache_size: int = Field(default=4096, ge=0)
+    cache_min_chars: int = Field(default=256, ge=0)
+
+
+class SharedStateConfig(BaseModel):
+    # Always on when launched with more than one worker.
+    enabled: bool = False
+    path: str = "state/shared.sqlite3"
+    circuit_sync_interval: float = Field(default=1.0, gt=0)
+    # How often a worker with queued requests checks for slots freed elsewhere.
+    slot_poll_interval: float = Field(default=0.05, gt=0)
 
 
 class Config(BaseModel):
     server: ServerConfig
     providers: Dict[str, ProviderConfig]
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    circuit_breaker: CircuitBreakerConfig = Field(default_factory=CircuitBreakerConfig)
+    batch: BatchConfig = Field(default_factory=BatchConfig)
+    capture: CaptureConfig = Field(default_factory=CaptureConfig)
+    usage: UsageConfig = Field(default_factory=UsageConfig)
+    shared_state: SharedStateConfig = Field(default_factory=SharedStateConfig)
+    tokenizer: TokenizerConfig = Field(default_factory=TokenizerConfig)
+
+
+DEFAULT_CONFIG_PATH = "config/providers.yaml"
 
 
-def load_config(path: str = "config/providers.yaml") -> Config:
+def load_config(path: str = DEFAULT_CONFIG_PATH) -> Config:
     """Load configuration from YAML, substituting environment variables."""
     with open(path) as f:
         raw = f.read()
@@ -49,6 +276,7 @@ def load_config(path: str = "config/providers.yaml") -> Config:
 
     config = Config(**data)
     _validate_no_duplicate_models(config)
+    _validate_fallbacks(config)
     return config
 
 
@@ -67,3 +295,37 @@ def _validate_no_duplicate_models(config: Config) -> None:
                         f"'{seen[name]}' and '{provider_name}'"
                     )
                 seen[name] = provider_name
+
+
+def _validate_fallbacks(config: Config) -> None:
+    """Ensure every fallback, overflow and hedge target names a model on an enabled provider."""
+    known = set()
+    for provider in config.providers.values():
+        if not provider.enabled:
+            continue
+        for model in provider.models:
+            known.add(model.name)
+            known.update(model.aliases)
+
+    for provider_name, provider in config.providers.items():
+        if not provider.enabled:
+            continue
+        for model in provider.models:
+            for fallback in model.fallbacks:
+                if fallback not in known:
+                    raise ValueError(
+                        f"Unknown fallback '{fallback}' for model '{model.name}' "
+                        f"in provider '{provider_name}'"
+                    )
+            for overflow in model.overflow_to:
+                if overflow not in known:
+                    raise ValueError(
+                        f"Unknown overflow_to model '{overflow}' for model '{model.name}' "
+                        f"in provider '{provider_name}'"
+                    )
+            if model.hedge is not None and model.hedge.target is not None:
+                if model.hedge.target not in known:
+                    raise ValueError(
+                        f"Unknown hedge target '{model.hedge.target}' for model "
+                        f"'{model.name}' in provider '{provider_name}'"
+                    )
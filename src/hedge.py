@@ -0,0 +1,154 @@
+"""Hedged requests: race a backup target when the primary is slow.
+
+If the primary has not answered (or sent its first stream chunk) after the
+hedge delay, the same request goes to a backup target. Whichever succeeds
+first wins and the other is cancelled. The delay is either fixed or a
+quantile of the primary's recent latencies.
+
+A budget caps the extra load: every request earns ``max_extra`` of a hedge,
+and a hedge is only sent when a whole one has been earned.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from . import metrics
+from .config import HedgeConfig
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """The last ``size`` latencies of one target, for quantile estimates."""
+
+    def __init__(self, size: int):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Hedging state for one model: latency windows, budget and counters."""
+
+    def __init__(self, model: str, config: HedgeConfig):
+        self.model = model
+        self.config = config
+        # Completion latency and first-chunk latency differ by orders of
+        # magnitude, so each keeps its own window.
+        self._latencies: Dict[Tuple[str, bool], LatencyWindow] = {}
+        self._credit = 0.0
+        self.requests = 0
+        self.hedged = 0
+        self.won = 0
+        self.denied = 0
+        self._metrics = {
+            outcome: metrics.HEDGES.labels(model, outcome) for outcome in ("sent", "won", "denied")
+        }
+
+    def observe(self, target: str, stream: bool, seconds: float) -> None:
+        window = self._latencies.get((target, stream))
+        if window is None:
+            window = self._latencies[(target, stream)] = LatencyWindow(self.config.window)
+        window.observe(seconds)
+
+    def delay(self, target: str, stream: bool) -> Optional[float]:
+        """Seconds to wait before hedging; None while there is no estimate yet."""
+        if self.config.delay is not None:
+            return self.config.delay
+        window = self._latencies.get((target, stream))
+        if window is None or len(window) < self.config.min_samples:
+            return None
+        return max(self.config.min_delay, window.quantile(self.config.quantile))
+
+    def _take_credit(self) -> bool:
+        if self._credit >= 1.0:
+            self._credit -= 1.0
+            return True
+        return False
+
+    async def race(
+        self,
+        primary: Callable[[], Awaitable[T]],
+        backup: Callable[[], Awaitable[T]],
+        delay: float,
+        discard: Optional[Callable[[T], Awaitable[None]]] = None,
+    ) -> Tuple[T, bool]:
+        """Run ``primary``, adding ``backup`` after ``delay``; first success wins.
+
+        Returns the result and whether it came from the backup. Failures only
+        count once both attempts have failed; then the primary's error is
+        raised. ``discard`` releases the result of a loser that completed
+        anyway, such as an opened stream.
+        """
+
+        self.requests += 1
+        self._credit = min(self.config.max_burst, self._credit + self.config.max_extra)
+        first = asyncio.ensure_future(primary())
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done or not self._take_credit():
+                if not done:
+                    self.denied += 1
+                    self._metrics["denied"].inc()
+                return await first, False
+        except BaseException:
+            await _cancel(first, discard)
+            raise
+
+        self.hedged += 1
+        self._metrics["sent"].inc()
+        second = asyncio.ensure_future(backup())
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in (first, second) if t in done and t.exception() is None), None)
+                if winner is None:
+                    continue
+                loser = second if winner is first else first
+                pending.discard(loser)
+                if loser in done:
+                    if discard is not None and loser.exception() is None:
+                        await discard(loser.result())
+                else:
+                    await _cancel(loser, discard)
+                if winner is second:
+                    self.won += 1
+                    self._metrics["won"].inc()
+                return winner.result(), winner is second
+        except BaseException:
+            for task in pending:
+                await _cancel(task, discard)
+            raise
+        second.exception()
+        raise first.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "backup_won": self.won,
+            "budget_denied": self.denied,
+            "delay": self.config.delay if self.config.delay is not None else f"p{self.config.quantile * 100:g}",
+        }
+
+
+async def _cancel(task: asyncio.Future, discard: Optional[Callable[[Any], Awaitable[None]]]) -> None:
+    task.cancel()
+    try:
+        result = await task
+    except BaseException:
+        return
+    if discard is not None:
+        await discard(result)
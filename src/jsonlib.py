@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Mapping
+from typing import Any, Iterator, Optional, Union
+
+from .sse import find_usage
+
+try:  # optional fast backend
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize ``obj`` to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def canonical(obj: Any) -> bytes:
+    """Serialize ``obj`` with sorted keys, for hashing."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class RawJSON(Mapping):
+    """An upstream JSON object kept in its encoded form.
+
+    Forwarded to the client byte for byte; it is only decoded if something
+    reads it like a dict (batch output, a missing ``usage``).
+    """
+
+    __slots__ = ("body", "_data")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self._data: Optional[dict] = None
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = loads(self.body)
+        return self._data
+
+    @property
+    def usage(self) -> Optional[dict]:
+        if self._data is not None:
+            return self._data.get("usage")
+        return find_usage(self.body)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+def usage_of(response: Any) -> Optional[dict]:
+    """The ``usage`` object of a completion, without decoding raw bodies."""
+    if isinstance(response, RawJSON):
+        return response.usage
+    if isinstance(response, dict):
+        return response.get("usage")
+    return None
+
+
+def plain(response: Any) -> Any:
+    """``response`` as ordinary Python objects, for re-encoding."""
+    return response.data if isinstance(response, RawJSON) else response
@@ -1,63 +1,318 @@
+# ruff: noqa: E402
 from __future__ import annotations
 
+import time
+
+# Start of the "imports" startup phase, before the imports below.
+_module_entered = time.perf_counter()
+
+import asyncio
 import json
 import logging
+import os
+from typing import Awaitable
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+
+from . import jsonlib, metrics
+from .batch import BatchManager
+from .cache import ResponseCache, make_cache_key, request_digest
+from .capture import CaptureLog
+from .config import DEFAULT_CONFIG_PATH, Config, load_config
+from .models import (
+    CHAT_REQUEST_SCHEMA,
+    BatchCreateRequest,
+    ChatRequest,
+    InvalidRequest,
+    parse_chat_request,
+)
+from .neardup import NearDuplicateIndex
+from .ratelimit import RateLimiter, RateLimitExceeded
+from .responses import FastJSONResponse, json_response
+from .reload import ConfigReloader
+from .router import ModelRouter, UpstreamUnavailableError
+from .scheduler import Ticket
+from .shared import SharedState, key_id, worker_count
+from .sse import drop_usage_events
+from .tokens import ContextLengthExceeded
+from .usage import GROUP_COLUMNS, StreamUsage, UsageTracker
+
+# nginx's status for a request the client abandoned; never actually sent.
+CLIENT_CLOSED_REQUEST = 499
+
+CONFIG_PATH = os.getenv("ROUTER_CONFIG", DEFAULT_CONFIG_PATH)
+
+# Seconds spent in each startup phase, served by /v1/startup.
+startup_phases: dict = {}
+_phase_started = _module_entered
+
+
+def _end_phase(name: str) -> None:
+    global _phase_started
+    now = time.perf_counter()
+    startup_phases[name] = round(now - _phase_started, 4)
+    _phase_started = now
 
-from fastapi import FastAPI, Header, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
 
-from .config import load_config
-from .models import ChatCompletionRequest
-from .router import ModelRouter
+_end_phase("imports")
 
-config = load_config()
-router = ModelRouter(config)
-app = FastAPI(title="OpenAI-Compatible API Router")
+
+config = load_config(CONFIG_PATH)
+_end_phase("config")
+shared = None
+if config.shared_state.enabled or worker_count() > 1:
+    shared = SharedState(config.shared_state, worker_count())
+    if shared.workers == 1:
+        # Sole process; the multi-worker launcher does this before forking.
+        shared.reset_transient()
+router = ModelRouter(config, shared=shared)
+_end_phase("providers")
+cache_config = config.cache
+if shared is not None and cache_config.disk_path is None:
+    # Without a disk tier each worker would only ever hit its own entries.
+    cache_config = cache_config.model_copy(
+        update={"disk_path": os.path.join(os.path.dirname(shared.config.path), "responses.sqlite3")}
+    )
+cache = ResponseCache.from_config(cache_config) if config.cache.enabled else None
+near_duplicates = (
+    NearDuplicateIndex(config.cache.near_duplicate)
+    if cache is not None and config.cache.near_duplicate.enabled
+    else None
+)
+capture = CaptureLog(config.capture) if config.capture.enabled else None
+usage = UsageTracker(config.usage) if config.usage.enabled else None
+batches = BatchManager(router, config.batch, usage)
+api_keys = config.server.key_map()
+limiter = RateLimiter(api_keys, shared=shared)
+_end_phase("state")
+app = FastAPI(title="OpenAI-Compatible API Router", default_response_class=FastJSONResponse)
+app.add_middleware(metrics.ReceiveTimeMiddleware)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-async def verify_api_key(authorization: str | None = Header(default=None)):
-    if config.server.api_keys:
+def _apply_config(new_config: Config, new_router: ModelRouter) -> None:
+    """Swap the live config and router.
+
+    Nothing here awaits, so no request sees a mix of old and new state.
+    """
+    global config, router, api_keys, limiter
+    config = new_config
+    router = new_router
+    api_keys = new_config.server.key_map()
+    limiter = RateLimiter(api_keys, previous=limiter, shared=shared)
+    batches.set_router(new_router)
+
+
+reloader = ConfigReloader(
+    CONFIG_PATH, router, _apply_config, config.server.drain_timeout, shared
+)
+
+
+async def verify_api_key(authorization: str | None = Header(default=None)) -> str | None:
+    if api_keys:
         if not authorization:
             raise HTTPException(status_code=401, detail="Missing authorization header")
 
         token = authorization.replace("Bearer ", "")
-        if token not in config.server.api_keys:
+        if token not in api_keys:
             raise HTTPException(status_code=401, detail="Invalid API key")
+        return token
+    return None
 
 
-@app.post("/v1/chat/completions")
+@app.post("/v1/chat/completions", openapi_extra=CHAT_REQUEST_SCHEMA)
 async def chat_completions(
-    request: ChatCompletionRequest, authorization: str | None = Header(default=None)
+    raw_request: Request,
+    authorization: str | None = Header(default=None),
 ):
-    if config.server.api_keys:
-        await verify_api_key(authorization)
+    request = await _parse_body(raw_request)
+    record = None
+    if capture is not None:
+        record = capture.begin(request, *_capture_labels(request.model, authorization))
+    handler = _chat_completions(request, raw_request, authorization)
+    if request.stream:
+        # StreamingResponse cancels the generator itself on disconnect.
+        response = await handler
+    else:
+        response = await _cancel_on_disconnect(raw_request, handler)
+    return response if record is None else capture.finish(record, response)
 
+
+async def _cancel_on_disconnect(raw_request: Request, handler: Awaitable[Response]) -> Response:
+    """Await ``handler``, cancelling it and its upstream call if the client leaves."""
+    task = asyncio.ensure_future(handler)
+    watcher = asyncio.ensure_future(_disconnected(raw_request))
     try:
-        provider, provider_model_id = router.resolve_model(request.model)
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            # Let the handler settle its slot, admission and metrics.
+            await asyncio.wait({task})
+    if task.cancelled():
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    return task.result()
+
 
-        params = {
-            "temperature": request.temperature,
-            "top_p": request.top_p,
-            "max_tokens": request.max_tokens,
-            "stop": request.stop,
-            "presence_penalty": request.presence_penalty,
-            "frequency_penalty": request.frequency_penalty,
-        }
-        params = {k: v for k, v in params.items() if v is not None}
+async def _disconnected(raw_request: Request) -> None:
+    # The body has been read, so the next message is the disconnect.
+    while (await raw_request.receive())["type"] != "http.disconnect":
+        pass
 
-        messages = [msg.model_dump() for msg in request.messages]
+
+async def _parse_body(raw_request: Request) -> ChatRequest:
+    """Decode and check the body once, keeping messages as plain dicts."""
+    body = await raw_request.body()
+    try:
+        data = jsonlib.loads(body)
+    except ValueError as e:
+        raise RequestValidationError(
+            [{"type": "json_invalid", "loc": ("body", 0), "msg": "JSON decode error",
+              "input": {}, "ctx": {"error": str(e)}}]
+        )
+    try:
+        return parse_chat_request(data)
+    except InvalidRequest as e:
+        raise RequestValidationError(e.errors)
+
+
+def _key_label(token: str | None) -> str | None:
+    """Name under which a key's traffic is recorded; never the key itself."""
+    entry = api_keys.get(token) if token else None
+    if entry is None:
+        return None
+    return entry.name or key_id(entry.key)[:12]
+
+
+def _capture_labels(model: str, authorization: str | None):
+    try:
+        provider = router.resolve(model).provider_name
+    except ValueError:
+        provider = None
+    token = authorization.replace("Bearer ", "") if authorization else None
+    return provider, _key_label(token)
+
+
+async def _chat_completions(
+    request: ChatRequest,
+    raw_request: Request,
+    authorization: str | None,
+):
+    handler_start = time.perf_counter()
+    metrics.observe_parse(
+        handler_start - getattr(raw_request.state, "received_at", handler_start)
+    )
+
+    api_key = await verify_api_key(authorization)
+
+    model_metrics = None
+    admission = None
+    streaming = False
+    held = False
+    try:
+        # Use one router for the whole request even if a reload swaps it,
+        # and hold it so the reload waits for this request before closing it.
+        current_router = router
+        current_router.hold()
+        held = True
+        resolved = current_router.resolve(request.model)
+        messages = request.messages
+        prompt_estimate = current_router.estimator.count(messages)
+        resolved, params = current_router.fit_context(
+            resolved, prompt_estimate, request.provider_params()
+        )
+        provider_model_id = resolved.provider_model_id
+        model_metrics = metrics.for_model(resolved.provider_name, resolved.model_config.name)
+        model_metrics.in_flight.inc()
+
+        model_name = resolved.model_config.name
+        tenant = _key_label(api_key)
+
+        ticket = Ticket(resolved.model_config.priority)
+        if api_key is not None:
+            admission = await limiter.admit(api_key, prompt_estimate, request.stream)
+            ticket = Ticket(ticket.priority, api_key, api_keys[api_key].weight)
+
+        # One hash of the request serves the cache and the coalescer.
+        digest = None
+        cache_key = None
+        cache_ttl = resolved.model_config.cache_ttl
+        if cache is not None and resolved.model_config.cache:
+            digest = request_digest(messages, params, request.stream)
+            cache_key = make_cache_key(resolved.provider_name, provider_model_id, digest)
+            cached = await cache.get(cache_key)
+            cache_status = "HIT"
+            if (
+                cached is None
+                and near_duplicates is not None
+                and resolved.model_config.deterministic_safe
+            ):
+                near_scope = make_cache_key(
+                    resolved.provider_name,
+                    provider_model_id,
+                    request_digest([], params, request.stream),
+                )
+                signature = near_duplicates.signature(messages)
+                if signature is not None:
+                    similar_key = near_duplicates.lookup(near_scope, signature)
+                    if similar_key is not None:
+                        cached = await cache.get(similar_key)
+                        if cached is None:
+                            near_duplicates.mark_stale()
+                        cache_status = "NEAR-HIT"
+                    if cached is None:
+                        # The answer is about to be cached under this request's key.
+                        near_duplicates.add(near_scope, signature, cache_key)
+            if cached is not None:
+                model_metrics.request("cache_hit")
+                if usage is not None:
+                    usage.record_cache_hit(tenant, model_name)
+                if request.stream:
+                    replay = cache.replay(cached)
+                    if admission is not None:
+                        replay = _settle_stream(admission, replay)
+                        admission = None
+                    if not request.include_usage:
+                        replay = drop_usage_events(replay)
+                    return StreamingResponse(
+                        replay,
+                        media_type="text/event-stream",
+                        headers={"X-Cache": cache_status},
+                    )
+                if admission is not None:
+                    admission.finish_response(cached)
+                return json_response(cached, headers={"X-Cache": cache_status})
+
+        metrics.observe_prepare(time.perf_counter() - handler_start)
 
         if request.stream:
+            current_router.check_capacity(resolved, prompt_estimate)
+
             async def generate():
+                status = "success"
+                stream = current_router.chat_completion_stream(
+                    resolved, messages, params, ticket, digest, prompt_estimate
+                )
+                if cache_key is not None:
+                    stream = cache.record_stream(cache_key, stream, cache_ttl)
+                meter = StreamUsage()
+                stream = meter.tap(stream)
+                if not request.include_usage:
+                    stream = drop_usage_events(stream)
                 try:
-                    async for chunk in provider.chat_completion_stream(
-                        provider_model_id, messages, params
-                    ):
+                    async for chunk in stream:
                         yield chunk
+                except (asyncio.CancelledError, GeneratorExit):
+                    # The client went away; unwinding closes the upstream stream.
+                    status = "cancelled"
+                    raise
                 except Exception as e:  # pragma: no cover - streaming fallback
+                    status = "error"
                     logger.error(f"Streaming error: {e}")
                     error_chunk = {
                         "error": {
@@ -66,13 +321,42 @@ async def chat_completions(
                         }
                     }
                     yield f"data: {json.dumps(error_chunk)}\n\n"
+                finally:
+                    model_metrics.in_flight.dec()
+                    if status == "cancelled":
+                        model_metrics.cancelled(meter.chunks, params.get("max_tokens"))
+                    else:
+                        model_metrics.request(status)
+                    if admission is not None:
+                        admission.finish_stream(meter)
+                    if usage is not None:
+                        usage.record_stream(tenant, model_name, meter, prompt_estimate)
+                    current_router.release()
 
+            streaming = True
             return StreamingResponse(generate(), media_type="text/event-stream")
         else:
-            response = await provider.chat_completion(provider_model_id, messages, params)
-            return response
+            try:
+                response = await current_router.chat_completion(
+                    resolved, messages, params, ticket, digest, prompt_estimate
+                )
+            except asyncio.CancelledError:
+                model_metrics.cancelled(0, params.get("max_tokens"))
+                raise
+            if cache_key is not None:
+                await cache.set(cache_key, response, cache_ttl)
+            if admission is not None:
+                admission.finish_response(response)
+            if usage is not None:
+                usage.record_response(tenant, model_name, response, prompt_estimate)
+            model_metrics.request("success")
+            serialize_start = time.perf_counter()
+            encoded = json_response(response)
+            metrics.observe_serialize(time.perf_counter() - serialize_start)
+            return encoded
 
     except ValueError as e:
+        metrics.REQUESTS.labels("", "unknown", "not_found").inc()
         return JSONResponse(
             status_code=404,
             content={
@@ -84,7 +368,51 @@ async def chat_completions(
                 }
             },
         )
+    except ContextLengthExceeded as e:
+        metrics.REQUESTS.labels(
+            resolved.provider_name, resolved.model_config.name, "context_length_exceeded"
+        ).inc()
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "message": str(e),
+                    "type": "invalid_request_error",
+                    "param": "messages",
+                    "code": "context_length_exceeded",
+                }
+            },
+        )
+    except RateLimitExceeded as e:
+        model_metrics.request("rate_limited")
+        return JSONResponse(
+            status_code=429,
+            content={
+                "error": {
+                    "message": str(e),
+                    "type": e.limit_type,
+                    "param": None,
+                    "code": "rate_limit_exceeded",
+                }
+            },
+            headers={"Retry-After": e.retry_after_header},
+        )
+    except UpstreamUnavailableError as e:
+        model_metrics.request("unavailable")
+        logger.error(str(e))
+        return JSONResponse(
+            status_code=e.status_code,
+            content={
+                "error": {
+                    "message": str(e),
+                    "type": "server_error",
+                    "code": "upstream_unavailable",
+                }
+            },
+        )
     except Exception as e:  # pragma: no cover - top level safety
+        if model_metrics is not None:
+            model_metrics.request("error")
         logger.error(f"Unexpected error: {e}", exc_info=True)
         return JSONResponse(
             status_code=500,
@@ -96,6 +424,97 @@ async def chat_completions(
                 }
             },
         )
+    finally:
+        if held and not streaming:
+            current_router.release()
+        if model_metrics is not None and not streaming:
+            model_metrics.in_flight.dec()
+        if admission is not None and not streaming:
+            admission.finish()
+
+
+async def _settle_stream(admission, stream):
+    meter = StreamUsage()
+    try:
+        async for chunk in meter.tap(stream):
+            yield chunk
+    finally:
+        admission.finish_stream(meter)
+
+
+def _batch_scope(api_key: str | None) -> str | None:
+    """Key label whose batches the caller may see; None means all of them.
+
+    Other keys' batches and files answer 404, as if they did not exist.
+    """
+    if api_key is None or api_keys[api_key].admin:
+        return None
+    return _key_label(api_key)
+
+
+def _batch_error(status_code: int, message: str, code: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "error": {
+                "message": message,
+                "type": "invalid_request_error",
+                "code": code,
+            }
+        },
+    )
+
+
+@app.post("/v1/batches")
+async def create_batch(request: BatchCreateRequest, api_key: str | None = Depends(verify_api_key)):
+    if request.endpoint != "/v1/chat/completions":
+        return _batch_error(400, f"Unsupported endpoint: {request.endpoint}", "invalid_endpoint")
+    try:
+        return batches.create(
+            request.input_file_id, request.completion_window, request.metadata, _key_label(api_key)
+        )
+    except ValueError as e:
+        return _batch_error(404, str(e), "file_not_found")
+
+
+@app.get("/v1/batches")
+async def list_batches(api_key: str | None = Depends(verify_api_key)):
+    return {"object": "list", "data": batches.list(_batch_scope(api_key))}
+
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str, api_key: str | None = Depends(verify_api_key)):
+    try:
+        return batches.get(batch_id, _batch_scope(api_key))
+    except (KeyError, ValueError):
+        return _batch_error(404, f"Batch '{batch_id}' not found", "batch_not_found")
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+async def cancel_batch(batch_id: str, api_key: str | None = Depends(verify_api_key)):
+    try:
+        return batches.cancel(batch_id, _batch_scope(api_key))
+    except (KeyError, ValueError):
+        return _batch_error(404, f"Batch '{batch_id}' not found", "batch_not_found")
+
+
+@app.post("/v1/batches/{batch_id}/resume")
+async def resume_batch(batch_id: str, api_key: str | None = Depends(verify_api_key)):
+    try:
+        return batches.resume(batch_id, _batch_scope(api_key))
+    except (KeyError, ValueError):
+        return _batch_error(404, f"Batch '{batch_id}' not found", "batch_not_found")
+
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str, api_key: str | None = Depends(verify_api_key)):
+    try:
+        path = batches.readable_file(file_id, _batch_scope(api_key))
+    except (KeyError, ValueError):
+        path = None
+    if path is None or not os.path.exists(path):
+        return _batch_error(404, f"File '{file_id}' not found", "file_not_found")
+    return FileResponse(path, media_type="application/jsonl")
 
 
 @app.get("/v1/models")
@@ -110,6 +529,12 @@ async def list_all_configured_models():
     return {"object": "list", "data": models}
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/health")
 async def health_check():
     return {
@@ -121,6 +546,143 @@ async def health_check():
     }
 
 
+@app.get("/v1/pools/stats")
+async def connection_pool_stats():
+    return {"providers": router.pool_stats()}
+
+
+@app.get("/v1/scheduler")
+async def scheduler_stats():
+    return {"providers": router.scheduler_stats()}
+
+
+@app.get("/v1/circuits")
+async def circuit_states():
+    return {"circuits": router.circuit_stats()}
+
+
+@app.get("/v1/residency")
+async def residency_stats():
+    return {"providers": router.residency_stats()}
+
+
+@app.get("/v1/hedging")
+async def hedging_stats():
+    return {"models": router.hedge_stats()}
+
+
+@app.get("/v1/startup")
+async def startup_timings():
+    return {"phases": startup_phases}
+
+
+@app.get("/v1/ratelimits", dependencies=[Depends(verify_api_key)])
+async def rate_limit_stats():
+    return {"keys": await limiter.stats()}
+
+
+@app.get("/v1/cache/stats")
+async def cache_stats():
+    if cache is None:
+        return {"enabled": False}
+    stats = {"enabled": True, **cache.stats()}
+    if near_duplicates is not None:
+        stats["near_duplicate"] = near_duplicates.stats()
+    return stats
+
+
+@app.get("/v1/usage")
+async def usage_report(
+    key: str | None = None,
+    model: str | None = None,
+    start: float | None = None,
+    end: float | None = None,
+    group_by: str = "key,model",
+    api_key: str | None = Depends(verify_api_key),
+):
+    """Token usage totals; ``start``/``end`` are unix times, ``group_by`` any of key, model, period.
+
+    Keys only see their own usage unless they are marked ``admin``.
+    """
+    if api_key is not None and not api_keys[api_key].admin:
+        own = _key_label(api_key)
+        if key is not None and key != own:
+            raise HTTPException(status_code=403, detail="Only admin keys can read other keys' usage")
+        key = own
+    if usage is None:
+        return {"enabled": False, "data": []}
+    columns = [c.strip() for c in group_by.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by column(s): {', '.join(unknown)}")
+    rows = await usage.query(key, model, start, end, columns)
+    return {"enabled": True, "object": "list", "data": rows}
+
+
+@app.get("/v1/capture/stats")
+async def capture_stats():
+    if capture is None:
+        return {"enabled": False}
+    return {"enabled": True, **capture.stats()}
+
+
+@app.post("/admin/reload", dependencies=[Depends(verify_api_key)])
+async def reload_config():
+    try:
+        return await reloader.reload_all("admin endpoint")
+    except Exception as e:
+        logger.error(f"Config reload failed, keeping current config: {e}")
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": {
+                    "message": f"Config reload failed: {e}",
+                    "type": "invalid_request_error",
+                    "code": "invalid_config",
+                }
+            },
+        )
+
+
+@app.on_event("startup")
+async def startup():
+    router.start()
+    if capture is not None:
+        capture.start()
+    if usage is not None:
+        usage.start()
+    reloader.install_signal_handler()
+    interval = config.server.config_watch_interval
+    if interval is None and shared is not None and shared.workers > 1:
+        # Needed to pick up reloads requested through another worker.
+        interval = 2.0
+    if interval:
+        reloader.watch(interval)
+    _end_phase("startup")
+    asyncio.create_task(_report_startup())
+
+
+async def _report_startup() -> None:
+    await router.prewarmed()
+    _end_phase("prewarm")
+    logger.info(
+        "Startup phases: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in startup_phases.items())
+    )
+
+
 @app.on_event("shutdown")
 async def shutdown():
+    await batches.close()
+    await reloader.close()
+    if capture is not None:
+        await capture.close()
+    if usage is not None:
+        await usage.close()
     await router.close()
+    if cache is not None:
+        await cache.close()
+    if shared is not None:
+        shared.close()
+
+
+_end_phase("app")
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from .jsonlib import usage_of
+from .sse import Chunk
+
+# Labels only ever take configured provider and model names (never the raw
+# requested model or alias), so cardinality is bounded by providers.yaml.
+REQUESTS = Counter(
+    "llm_router_requests_total",
+    "Chat completion requests handled by the router.",
+    ["provider", "model", "status"],
+)
+# Gauges sum across processes when running with several workers; the mode is
+# ignored otherwise.
+IN_FLIGHT = Gauge(
+    "llm_router_requests_in_flight",
+    "Chat completion requests currently being served.",
+    ["provider", "model"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "llm_router_upstream_latency_seconds",
+    "Time spent waiting on the upstream provider per attempt.",
+    ["provider", "model", "status"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_router_time_to_first_token_seconds",
+    "Time from opening an upstream stream to its first chunk.",
+    ["provider", "model"],
+    buckets=(0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+INTER_CHUNK_LATENCY = Histogram(
+    "llm_router_inter_chunk_latency_seconds",
+    "Gap between consecutive upstream stream chunks.",
+    ["provider", "model"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+OUTPUT_TOKENS_PER_SECOND = Histogram(
+    "llm_router_output_tokens_per_second",
+    "Upstream generation speed; streamed chunks count as one token each.",
+    ["provider", "model"],
+    buckets=(1, 5, 10, 20, 40, 60, 100, 150, 250, 500),
+)
+ROUTER_OVERHEAD = Histogram(
+    "llm_router_overhead_seconds",
+    "Time the router itself spends on a request, by phase.",
+    ["phase"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+QUEUE_DEPTH = Gauge(
+    "llm_router_queue_depth",
+    "Requests waiting for a provider concurrency slot.",
+    ["provider"],
+    multiprocess_mode="livesum",
+)
+SLOTS_IN_USE = Gauge(
+    "llm_router_slots_in_use",
+    "Provider concurrency slots currently held.",
+    ["provider"],
+    multiprocess_mode="livesum",
+)
+QUEUE_WAIT = Histogram(
+    "llm_router_queue_wait_seconds",
+    "Time spent waiting for a provider concurrency slot.",
+    ["provider", "priority"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+QUEUE_REJECTED = Counter(
+    "llm_router_queue_rejected_total",
+    "Requests shed by a provider scheduler.",
+    ["provider", "reason"],
+)
+MODEL_LOADED = Gauge(
+    "llm_router_model_loaded_endpoints",
+    "Backends that reported the model as loaded at the last residency poll.",
+    ["provider", "model"],
+    multiprocess_mode="livemax",
+)
+HEDGES = Counter(
+    "llm_router_hedged_requests_total",
+    "Hedged requests by outcome: sent, won by the backup, or denied by the budget.",
+    ["model", "outcome"],
+)
+CANCELLED_TOKENS = Counter(
+    "llm_router_cancelled_tokens_total",
+    "Tokens of requests cancelled by a client disconnect: generated before the "
+    "cancel, or avoided (the rest of max_tokens).",
+    ["provider", "model", "kind"],
+)
+CONTEXT_CHECKS = Counter(
+    "llm_router_context_checks_total",
+    "Requests changed by context-window checks: rejected, rerouted to an "
+    "overflow_to model, with max_tokens clamped, or a fallback or hedge "
+    "target skipped.",
+    ["model", "action"],
+)
+
+_PARSE = ROUTER_OVERHEAD.labels("parse")
+_PREPARE = ROUTER_OVERHEAD.labels("prepare")
+_SERIALIZE = ROUTER_OVERHEAD.labels("serialize")
+
+
+class ModelMetrics:
+    """Metric children pre-bound to one provider/model pair.
+
+    Resolving labels takes a lock and a dict lookup in prometheus_client, so
+    the hot path goes through these cached children instead.
+    """
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.in_flight = IN_FLIGHT.labels(provider, model)
+        self.ttft = TIME_TO_FIRST_TOKEN.labels(provider, model)
+        self.inter_chunk = INTER_CHUNK_LATENCY.labels(provider, model)
+        self.tokens_per_second = OUTPUT_TOKENS_PER_SECOND.labels(provider, model)
+        self.upstream_ok = UPSTREAM_LATENCY.labels(provider, model, "success")
+        self.upstream_error = UPSTREAM_LATENCY.labels(provider, model, "error")
+        self._requests: Dict[str, Any] = {}
+
+    def request(self, status: str) -> None:
+        counter = self._requests.get(status)
+        if counter is None:
+            counter = self._requests[status] = REQUESTS.labels(self.provider, self.model, status)
+        counter.inc()
+
+    def cancelled(self, generated: int, max_tokens: Optional[int]) -> None:
+        """Count a request the client abandoned; streamed chunks count as tokens."""
+        self.request("cancelled")
+        if generated:
+            CANCELLED_TOKENS.labels(self.provider, self.model, "generated").inc(generated)
+        if max_tokens and max_tokens > generated:
+            CANCELLED_TOKENS.labels(self.provider, self.model, "avoided").inc(max_tokens - generated)
+
+    async def timed_call(self, call) -> Dict[str, Any]:
+        start = time.perf_counter()
+        try:
+            response = await call()
+        except Exception:
+            self.upstream_error.observe(time.perf_counter() - start)
+            raise
+        elapsed = time.perf_counter() - start
+        self.upstream_ok.observe(elapsed)
+        usage = usage_of(response)
+        if usage and elapsed > 0:
+            completion_tokens = usage.get("completion_tokens")
+            if completion_tokens:
+                self.tokens_per_second.observe(completion_tokens / elapsed)
+        return response
+
+    async def observe_stream(self, stream: AsyncIterator[Chunk]) -> AsyncIterator[Chunk]:
+        start = time.perf_counter()
+        first: Optional[float] = None
+        last = start
+        chunks = 0
+        observe_gap = self.inter_chunk.observe
+        perf_counter = time.perf_counter
+        try:
+            async for chunk in stream:
+                now = perf_counter()
+                if first is None:
+                    first = now
+                    self.ttft.observe(now - start)
+                else:
+                    observe_gap(now - last)
+                last = now
+                chunks += 1
+                yield chunk
+        except Exception:
+            self.upstream_error.observe(perf_counter() - start)
+            raise
+        self.upstream_ok.observe(last - start)
+        if first is not None and last > first:
+            self.tokens_per_second.observe((chunks - 1) / (last - first))
+
+
+_model_metrics: Dict[Tuple[str, str], ModelMetrics] = {}
+
+
+def for_model(provider: str, model: str) -> ModelMetrics:
+    metrics = _model_metrics.get((provider, model))
+    if metrics is None:
+        metrics = _model_metrics[(provider, model)] = ModelMetrics(provider, model)
+    return metrics
+
+
+def observe_parse(seconds: float) -> None:
+    _PARSE.observe(seconds)
+
+
+def observe_prepare(seconds: float) -> None:
+    _PREPARE.observe(seconds)
+
+
+def observe_serialize(seconds: float) -> None:
+    _SERIALIZE.observe(seconds)
+
+
+def render() -> Tuple[bytes, str]:
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Several workers: aggregate what every process has written.
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class ReceiveTimeMiddleware:
+    """Stamp each HTTP request with its arrival time.
+
+    A plain ASGI middleware rather than ``@app.middleware`` so it adds no task
+    or stream wrapping to the request path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        await self.app(scope, receive, send)
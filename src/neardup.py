@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import re
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .config import NearDuplicateConfig
+
+_MASK = (1 << 64) - 1
+_EMPTY = _MASK
+
+# Volatile details that should not make two prompts look different. Other
+# numbers and ids stay: "convert 100 USD" and "convert 250 USD" need
+# different answers.
+_NORMALIZERS = [
+    (re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"), " <uuid> "),
+    (
+        re.compile(
+            r"\d{4}-\d{2}-\d{2}(?:[t ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:z|[+-]\d{2}:?\d{2})?)?"
+        ),
+        " <date> ",
+    ),
+    (re.compile(r"\b\d{1,2}:\d{2}(?::\d{2})?\b"), " <time> "),
+]
+_TOKEN = re.compile(r"\w+|<\w+>")
+
+Signature = Tuple[int, ...]
+
+
+def normalize(messages: list) -> List[str]:
+    """Lower-cased word tokens of the conversation with volatile details masked.
+
+    Whitespace and punctuation differences disappear, and UUIDs, dates and
+    times collapse to placeholders. Each message starts with its role
+    so moving text between roles still changes the prompt.
+    """
+
+    tokens: List[str] = []
+    for message in messages:
+        content = message.get("content")
+        text = content.lower() if isinstance(content, str) else repr(content).lower()
+        for pattern, replacement in _NORMALIZERS:
+            text = pattern.sub(replacement, text)
+        tokens.append(f"<{message.get('role', '')}>")
+        tokens.extend(_TOKEN.findall(text))
+    return tokens
+
+
+class NearDuplicateIndex:
+    """Locality-sensitive index from prompt fingerprints to exact cache keys.
+
+    Prompts are reduced to word shingles and a MinHash signature computed
+    with one-permutation hashing (one hash per shingle, spread over
+    ``num_perm`` bins). LSH banding finds candidates in O(bands); each
+    candidate is then verified by the fraction of matching signature slots,
+    which estimates the Jaccard similarity of the shingle sets. Candidates
+    that fail verification are counted as false positives.
+
+    Entries only ever point at keys in the exact-match cache, so TTLs,
+    eviction and the disk tier are shared with it.
+    """
+
+    def __init__(self, config: NearDuplicateConfig):
+        self.config = config
+        self.num_perm = config.num_perm
+        self.rows = config.num_perm // config.bands
+        self._entries: "OrderedDict[int, Tuple[Signature, str, List[Tuple]]]" = OrderedDict()
+        self._buckets: Dict[Tuple, Set[int]] = {}
+        self._next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.false_positives = 0
+        self.stale = 0
+        self.skipped = 0
+
+    def signature(self, messages: list) -> Optional[Signature]:
+        """MinHash signature of ``messages``, or None if the prompt is too short."""
+        tokens = normalize(messages)
+        if len(tokens) < self.config.min_tokens:
+            self.skipped += 1
+            return None
+
+        k = self.num_perm
+        n = self.config.shingle_size
+        mins = [_EMPTY] * k
+        for i in range(len(tokens) - n + 1):
+            h = hash(tuple(tokens[i : i + n])) & _MASK
+            slot = h % k
+            value = h // k
+            if value < mins[slot]:
+                mins[slot] = value
+
+        # Densify: an empty bin borrows from the next filled bin to its right
+        # so that sparse prompts still compare slot by slot.
+        if _EMPTY in mins:
+            filled = [i for i, v in enumerate(mins) if v != _EMPTY]
+            if not filled:
+                return None
+            for i in range(k):
+                if mins[i] == _EMPTY:
+                    j = next((f for f in filled if f > i), filled[0])
+                    mins[i] = mins[j] + (j - i) % k
+        return tuple(mins)
+
+    def lookup(self, scope: str, signature: Signature) -> Optional[str]:
+        """Cache key of the most similar indexed prompt above the threshold."""
+        best_id = None
+        best_similarity = 0.0
+        seen: Set[int] = set()
+        for band in self._bands(scope, signature):
+            for entry_id in self._buckets.get(band, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                similarity = self._similarity(signature, self._entries[entry_id][0])
+                if similarity < self.config.threshold:
+                    self.false_positives += 1
+                elif similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+
+        if best_id is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        return self._entries[best_id][1]
+
+    def add(self, scope: str, signature: Signature, cache_key: str) -> None:
+        entry_id = self._next_id
+        self._next_id += 1
+        bands = self._bands(scope, signature)
+        self._entries[entry_id] = (signature, cache_key, bands)
+        for band in bands:
+            self._buckets.setdefault(band, set()).add(entry_id)
+        while len(self._entries) > self.config.max_entries:
+            self._evict(next(iter(self._entries)))
+
+    def mark_stale(self) -> None:
+        """A match pointed at a response the exact cache no longer holds."""
+        self.hits -= 1
+        self.misses += 1
+        self.stale += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "threshold": self.config.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "false_positives": self.false_positives,
+            "stale": self.stale,
+            "skipped": self.skipped,
+        }
+
+    def _bands(self, scope: str, signature: Signature) -> List[Tuple]:
+        rows = self.rows
+        return [
+            (scope, band, signature[band * rows : (band + 1) * rows])
+            for band in range(self.config.bands)
+        ]
+
+    def _similarity(self, a: Signature, b: Signature) -> float:
+        return sum(x == y for x, y in zip(a, b)) / self.num_perm
+
+    def _evict(self, entry_id: int) -> None:
+        _, _, bands = self._entries.pop(entry_id)
+        for band in bands:
+            bucket = self._buckets.get(band)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band]
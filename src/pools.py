@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import ssl
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from .balancer import BalancingTransport, Endpoint
+from .config import ProviderConfig
+
+logger = logging.getLogger(__name__)
+
+
+# Provider settings baked into a client; a reload that leaves these alone can
+# keep the existing pool and its warm connections.
+CLIENT_FIELDS = {"base_url", "endpoints", "load_balancer", "pool", "timeout"}
+
+
+def same_client_settings(old: ProviderConfig, new: ProviderConfig) -> bool:
+    return old.model_dump(include=CLIENT_FIELDS) == new.model_dump(include=CLIENT_FIELDS)
+
+
+def build_timeout(config: ProviderConfig) -> httpx.Timeout:
+    """Per-request timeout with optional connect/read/write/pool overrides."""
+    pool = config.pool
+    return httpx.Timeout(
+        config.timeout,
+        connect=pool.connect_timeout if pool.connect_timeout is not None else config.timeout,
+        read=pool.read_timeout if pool.read_timeout is not None else config.timeout,
+        write=pool.write_timeout if pool.write_timeout is not None else config.timeout,
+        pool=pool.pool_timeout if pool.pool_timeout is not None else config.timeout,
+    )
+
+
+_ssl_contexts: Dict[bool, ssl.SSLContext] = {}
+
+
+def ssl_context(http2: bool) -> ssl.SSLContext:
+    """One verifying SSL context per ALPN setting, shared by every pool.
+
+    Loading the CA bundle dominates client construction, so doing it once
+    instead of per provider and per replica shortens startup. httpcore sets
+    ALPN on the context when connecting, hence one context per HTTP version.
+    """
+
+    context = _ssl_contexts.get(http2)
+    if context is None:
+        context = _ssl_contexts[http2] = httpx.create_ssl_context(http2=http2)
+    return context
+
+
+def build_client(config: ProviderConfig) -> httpx.AsyncClient:
+    """Create a dedicated connection pool for one provider."""
+    pool = config.pool
+    http2 = pool.http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+
+    limits = httpx.Limits(
+        max_connections=pool.max_connections,
+        max_keepalive_connections=pool.max_keepalive_connections,
+        keepalive_expiry=pool.keepalive_expiry,
+    )
+
+    if len(config.endpoints) > 1:
+        # One pool per replica, so the limits apply to each backend box.
+        endpoints = [
+            Endpoint(
+                endpoint,
+                httpx.AsyncHTTPTransport(verify=ssl_context(http2), http2=http2, limits=limits),
+            )
+            for endpoint in config.endpoints
+        ]
+        return httpx.AsyncClient(
+            timeout=build_timeout(config),
+            transport=BalancingTransport(config.base_url, endpoints, config.load_balancer),
+        )
+
+    return httpx.AsyncClient(
+        verify=ssl_context(http2), http2=http2, timeout=build_timeout(config), limits=limits
+    )
+
+
+class PoolWarmer:
+    """Keeps ``prewarm_connections`` connections open to each upstream.
+
+    At startup it opens them with concurrent HEAD requests, which also
+    resolves DNS and finishes the TLS handshakes before real traffic arrives.
+    Every ``rewarm_interval`` seconds it tops up pools whose idle
+    connections have expired. The HEAD responses are ignored; any status
+    leaves a reusable keepalive connection behind.
+    """
+
+    def __init__(self, name: str, client: httpx.AsyncClient, config: ProviderConfig):
+        self.name = name
+        self.config = config.pool
+        self.count = min(config.pool.prewarm_connections, config.pool.max_keepalive_connections)
+        self._timeout = build_timeout(config).as_dict()
+        transport = getattr(client, "_transport", None)
+        if isinstance(transport, BalancingTransport):
+            self._targets: List[Tuple[str, Any]] = [
+                (str(endpoint.url), endpoint.transport) for endpoint in transport.endpoints
+            ]
+        else:
+            self._targets = [(config.base_url, transport)]
+        self.opened = 0
+        self.last_warm_seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        try:
+            await self.warm()
+        finally:
+            self.ready.set()
+        while self.config.rewarm_interval:
+            await asyncio.sleep(self.config.rewarm_interval)
+            try:
+                await self.warm()
+            except Exception as e:
+                self.error = str(e) or type(e).__name__
+                logger.warning(f"Re-warming connections for '{self.name}' failed: {self.error}")
+
+    async def warm(self) -> int:
+        """Open connections until each upstream has ``count``; returns how many opened."""
+        start = time.monotonic()
+        opened = sum(
+            await asyncio.gather(*(self._warm(url, transport) for url, transport in self._targets))
+        )
+        self.opened += opened
+        self.last_warm_seconds = time.monotonic() - start
+        return opened
+
+    async def _warm(self, url: str, transport: Any) -> int:
+        # Expired connections stay in the pool until its next request.
+        live = [
+            conn
+            for conn in getattr(getattr(transport, "_pool", None), "connections", [])
+            if not conn.has_expired()
+        ]
+        missing = self.count - len(live)
+        if missing <= 0:
+            return 0
+        results = await asyncio.gather(
+            *(self._head(url, transport) for _ in range(missing)), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if errors:
+            self.error = str(errors[0]) or type(errors[0]).__name__
+            logger.warning(
+                f"Could not pre-open {len(errors)} of {missing} connections to {url} "
+                f"for '{self.name}': {self.error}"
+            )
+        else:
+            self.error = None
+        return len(results) - len(errors)
+
+    async def _head(self, url: str, transport: Any) -> None:
+        request = httpx.Request("HEAD", url, extensions={"timeout": self._timeout})
+        response = await transport.handle_async_request(request)
+        try:
+            # Closing a response that was not read drops its connection.
+            await response.aread()
+        finally:
+            await response.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "prewarm_connections": self.count,
+            "rewarm_interval": self.config.rewarm_interval,
+            "opened": self.opened,
+            "last_warm_seconds": self.last_warm_seconds,
+            "error": self.error,
+        }
+
+
+def pool_stats(client: httpx.AsyncClient, config: ProviderConfig) -> Dict[str, Any]:
+    """Summarise connection usage for a provider pool.
+
+    For load-balanced providers the totals and limits cover every replica,
+    each of which has its own pool, and the per-endpoint breakdown is
+    included.
+    """
+
+    transport = getattr(client, "_transport", None)
+    if isinstance(transport, BalancingTransport):
+        per_endpoint = []
+        totals: Dict[str, Any] = {}
+        for endpoint in transport.endpoints:
+            usage = _transport_usage(endpoint.transport)
+            for key, value in usage.items():
+                totals[key] = totals.get(key, 0) + value
+            per_endpoint.append({**endpoint.stats(), **usage})
+        stats = {
+            "max_connections": config.pool.max_connections * len(transport.endpoints),
+            "max_keepalive_connections": config.pool.max_keepalive_connections * len(transport.endpoints),
+            "policy": config.load_balancer.policy,
+            **totals,
+            "endpoints": per_endpoint,
+        }
+        if transport.balancer.affinity is not None:
+            stats["prefix_affinity"] = transport.balancer.affinity.stats()
+        stats["resident_picks"] = transport.balancer.resident_picks
+        return stats
+
+    return {
+        "max_connections": config.pool.max_connections,
+        "max_keepalive_connections": config.pool.max_keepalive_connections,
+        **_transport_usage(transport),
+    }
+
+
+def _transport_usage(transport: Any) -> Dict[str, int]:
+    """Read connection counts from an httpcore pool.
+
+    httpx does not expose pool state publicly, so this reads the underlying
+    pool defensively and reports zeros if its layout changes.
+    """
+
+    connections = []
+    waiting = 0
+    pool = getattr(transport, "_pool", None)
+    if pool is not None:
+        connections = list(getattr(pool, "connections", []))
+        waiting = sum(
+            1
+            for request in getattr(pool, "_requests", [])
+            if getattr(request, "connection", None) is None
+        )
+
+    idle = sum(1 for conn in connections if conn.is_idle())
+    http2 = sum(
+        1
+        for conn in connections
+        if type(getattr(conn, "_connection", None)).__name__ == "AsyncHTTP2Connection"
+    )
+    return {
+        "connections": len(connections),
+        "active": len(connections) - idle,
+        "idle": idle,
+        "http2_connections": http2,
+        "waiting": waiting,
+    }
@@ -1,8 +1,21 @@
 from __future__ import annotations
 
-import json
+import time
+from typing import AsyncIterator
 
-from .base import BaseProvider
+from .. import jsonlib
+from ..sse import DONE_EVENT
+from ..translate import ChunkEncoder, extract_string, iter_lines, usage_dict
+from .base import BaseProvider, ProviderError
+
+TEXT_DELTA_MARKER = b'"delta":{"type":"text_delta","text":'
+
+FINISH_REASONS = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+}
 
 
 class AnthropicProvider(BaseProvider):
@@ -40,7 +53,10 @@ class AnthropicProvider(BaseProvider):
                         "role": "assistant",
                         "content": content,
                     },
-                    "finish_reason": anthropic_response.get("stop_reason"),
+                    "finish_reason": FINISH_REASONS.get(
+                        anthropic_response.get("stop_reason"),
+                        anthropic_response.get("stop_reason"),
+                    ),
                 }
             ],
             "usage": {
@@ -75,15 +91,17 @@ class AnthropicProvider(BaseProvider):
 
         response = await self.client.post(
             f"{self.config.base_url}/messages",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
         )
         if response.status_code != 200:
-            raise Exception(f"Anthropic API error: {response.status_code} - {response.text}")
+            raise ProviderError(
+                f"Anthropic API error: {response.status_code} - {response.text}",
+                response.status_code,
+            )
         response.raise_for_status()
 
-        return self._to_openai_format(response.json())
+        return self._to_openai_format(jsonlib.loads(response.content))
 
     async def chat_completion_stream(
         self, provider_model_id: str, messages: list, params: dict
@@ -100,6 +118,9 @@ class AnthropicProvider(BaseProvider):
         if system:
             payload["system"] = system
 
+        if "temperature" in params:
+            payload["temperature"] = params["temperature"]
+
         headers = {
             "x-api-key": self.config.api_key,
             "anthropic-version": "2023-06-01",
@@ -108,38 +129,72 @@ class AnthropicProvider(BaseProvider):
         async with self.client.stream(
             "POST",
             f"{self.config.base_url}/messages",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
         ) as response:
             if response.status_code != 200:
                 error_body = await response.aread()
-                raise Exception(f"Anthropic API error: {response.status_code} - {error_body.decode()}")
+                raise ProviderError(
+                    f"Anthropic API error: {response.status_code} - {error_body.decode()}",
+                    response.status_code,
+                )
             response.raise_for_status()
 
-            async for line in response.aiter_lines():
-                if not line.startswith("data: "):
-                    continue
-
-                data = json.loads(line[6:])
-
-                if data.get("type") == "content_block_delta":
-                    chunk = {
-                        "id": data.get("id", ""),
-                        "object": "chat.completion.chunk",
-                        "created": 0,
-                        "model": provider_model_id,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {
-                                    "content": data["delta"].get("text", ""),
-                                },
-                                "finish_reason": None,
-                            }
-                        ],
-                    }
-                    yield f"data: {json.dumps(chunk)}\n\n"
+            async for chunk in self._translate_stream(response.aiter_bytes(), provider_model_id):
+                yield chunk
+
+    async def _translate_stream(
+        self, source: AsyncIterator[bytes], provider_model_id: str
+    ) -> AsyncIterator[bytes]:
+        """Translate Messages API SSE into OpenAI chunks.
+
+        Text deltas are spliced straight from the upstream bytes; only the
+        handful of other events per stream are parsed.
+        """
+
+        encoder = ChunkEncoder("", provider_model_id, int(time.time()))
+        prompt_tokens = 0
+        completion_tokens = 0
+        stop_reason = None
+
+        async for line in iter_lines(source):
+            if not line.startswith(b"data: "):
+                continue
+
+            text = extract_string(line, TEXT_DELTA_MARKER, b"}}")
+            if text is not None:
+                yield encoder.content(text)
+                continue
+
+            data = jsonlib.loads(line[6:])
+            event_type = data.get("type")
+
+            if event_type == "content_block_delta":
+                text = data["delta"].get("text")
+                if text:
+                    yield encoder.text(text)
+
+            elif event_type == "message_start":
+                message = data.get("message", {})
+                encoder = ChunkEncoder(
+                    message.get("id", ""), provider_model_id, int(time.time())
+                )
+                prompt_tokens = message.get("usage", {}).get("input_tokens", 0)
+                yield encoder.role()
+
+            elif event_type == "message_delta":
+                stop_reason = data.get("delta", {}).get("stop_reason") or stop_reason
+                completion_tokens = data.get("usage", {}).get(
+                    "output_tokens", completion_tokens
+                )
+
+            elif event_type == "message_stop":
+                yield encoder.finish(
+                    FINISH_REASONS.get(stop_reason, stop_reason),
+                    usage_dict(prompt_tokens, completion_tokens),
+                )
+                yield DONE_EVENT
 
-                elif data.get("type") == "message_stop":
-                    yield "data: [DONE]\n\n"
+            elif event_type == "error":
+                error = data.get("error", {})
+                raise ProviderError(f"Anthropic stream error: {error.get('message', error)}")
@@ -1,10 +1,22 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Any, AsyncIterator, Dict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 import httpx
 
+from .. import jsonlib
+from ..pools import build_timeout
+from ..sse import Chunk, model_rewrites, passthrough
+
+
+class ProviderError(Exception):
+    """Upstream returned an error response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
 
 class BaseProvider(ABC):
     """Abstract base for provider adapters."""
@@ -12,6 +24,9 @@ class BaseProvider(ABC):
     def __init__(self, config: Any, client: httpx.AsyncClient):
         self.config = config
         self.client = client
+        self.timeout = build_timeout(config)
+        self._routed_names = {m.provider_model_id: m.name for m in config.models}
+        self._rewrites: Dict[str, Tuple[Tuple[bytes, bytes], ...]] = {}
 
     @abstractmethod
     async def chat_completion(
@@ -28,5 +43,78 @@ class BaseProvider(ABC):
         provider_model_id: str,
         messages: list,
         params: dict,
-    ) -> AsyncIterator[str]:
+    ) -> AsyncIterator[Chunk]:
         """Streaming chat completion returning SSE chunks."""
+
+    # Adapters whose backends report loaded models override loaded_models
+    # and warm_up; see residency.py.
+    supports_residency = False
+
+    async def loaded_models(self) -> List[str]:
+        """Model ids the backend at ``base_url`` currently has loaded."""
+        return []
+
+    async def warm_up(self, provider_model_id: str) -> None:
+        """Load ``provider_model_id`` on the backend without generating."""
+
+    @staticmethod
+    def _json_body(payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """httpx arguments sending ``payload`` encoded with jsonlib."""
+        return {
+            "content": jsonlib.dumps(payload),
+            "headers": {**(headers or {}), "Content-Type": "application/json"},
+        }
+
+    def _openai_response(self, response: httpx.Response, provider_model_id: str) -> Any:
+        """Body of an OpenAI-compatible completion.
+
+        With ``json_passthrough`` the upstream bytes are kept as they are, with
+        only the model id rewritten in place when configured.
+        """
+
+        if not self.config.json_passthrough:
+            return self._with_routed_model(jsonlib.loads(response.content), provider_model_id)
+        body = response.content
+        rewrites = self._model_rewrites(provider_model_id)
+        if rewrites:
+            for old, new in rewrites:
+                body = body.replace(old, new)
+        return jsonlib.RawJSON(body)
+
+    def _model_rewrites(self, provider_model_id: str) -> Optional[Tuple[Tuple[bytes, bytes], ...]]:
+        if not self.config.expose_routed_model or provider_model_id not in self._routed_names:
+            return None
+        rewrites = self._rewrites.get(provider_model_id)
+        if rewrites is None:
+            rewrites = model_rewrites(provider_model_id, self._routed_names[provider_model_id])
+            self._rewrites[provider_model_id] = rewrites
+        return rewrites
+
+    def _with_routed_model(self, response: Dict[str, Any], provider_model_id: str) -> Dict[str, Any]:
+        """Report the routed model name instead of the upstream id, if configured."""
+        if self.config.expose_routed_model and provider_model_id in self._routed_names:
+            response["model"] = self._routed_names[provider_model_id]
+        return response
+
+    async def _forward_openai_stream(
+        self, response: httpx.Response, provider_model_id: str
+    ) -> AsyncIterator[Chunk]:
+        """Relay an upstream that already speaks OpenAI SSE.
+
+        In passthrough mode raw bytes are forwarded with only the model id
+        rewritten in place; otherwise lines are decoded and re-framed.
+        """
+
+        rewrites = self._model_rewrites(provider_model_id)
+
+        if self.config.stream_passthrough:
+            async for chunk in passthrough(response.aiter_bytes(), rewrites):
+                yield chunk
+            return
+
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                if rewrites:
+                    for old, new in rewrites:
+                        line = line.replace(old.decode(), new.decode())
+                yield line + "\n\n"
@@ -1,9 +1,35 @@
 from __future__ import annotations
 
+from typing import List
+
+from .. import jsonlib
 from .base import BaseProvider
 
 
 class LlamaCppProvider(BaseProvider):
+    supports_residency = True
+
+    async def loaded_models(self) -> List[str]:
+        # llama-swap's list of running upstream servers.
+        response = await self.client.get(f"{self.config.base_url}/running", timeout=self.timeout)
+        response.raise_for_status()
+        running = jsonlib.loads(response.content).get("running") or []
+        return [m["model"] for m in running if m.get("state", "ready") == "ready"]
+
+    async def warm_up(self, provider_model_id: str) -> None:
+        # llama-swap starts the model's server on the first request for it.
+        payload = {
+            "model": provider_model_id,
+            "messages": [{"role": "user", "content": "hi"}],
+            "max_tokens": 1,
+        }
+        response = await self.client.post(
+            f"{self.config.base_url}/v1/chat/completions",
+            **self._json_body(payload),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
     async def chat_completion(self, provider_model_id: str, messages: list, params: dict):
         payload = {
             "model": provider_model_id,
@@ -13,11 +39,11 @@ class LlamaCppProvider(BaseProvider):
 
         response = await self.client.post(
             f"{self.config.base_url}/v1/chat/completions",
-            json=payload,
-            timeout=self.config.timeout,
+            **self._json_body(payload),
+            timeout=self.timeout,
         )
         response.raise_for_status()
-        return response.json()
+        return self._openai_response(response, provider_model_id)
 
     async def chat_completion_stream(
         self, provider_model_id: str, messages: list, params: dict
@@ -28,14 +54,15 @@ class LlamaCppProvider(BaseProvider):
             "stream": True,
             **params,
         }
+        if self.config.request_stream_usage:
+            payload["stream_options"] = {"include_usage": True}
 
         async with self.client.stream(
             "POST",
             f"{self.config.base_url}/v1/chat/completions",
-            json=payload,
-            timeout=self.config.timeout,
+            **self._json_body(payload),
+            timeout=self.timeout,
         ) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    yield line + "\n\n"
+            async for chunk in self._forward_openai_stream(response, provider_model_id):
+                yield chunk
@@ -1,12 +1,54 @@
 from __future__ import annotations
 
-import json
 import time
+from typing import Any, AsyncIterator, List
 
-from .base import BaseProvider
+import httpx
+
+from .. import jsonlib
+from ..sse import DONE_EVENT
+from ..translate import ChunkEncoder, extract_string, iter_lines, usage_dict
+from .base import BaseProvider, ProviderError
+
+CONTENT_MARKER = b'"message":{"role":"assistant","content":'
+CONTENT_TERMINATOR = b'},"done":false}'
+# OpenAI parameter -> Ollama option.
+_OPTIONS = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "num_predict"}
 
 
 class OllamaProvider(BaseProvider):
+    supports_residency = True
+
+    def __init__(self, config: Any, client: httpx.AsyncClient):
+        super().__init__(config, client)
+        default = config.residency.keep_alive
+        self._keep_alive = {
+            m.provider_model_id: m.keep_alive if m.keep_alive is not None else default
+            for m in config.models
+        }
+
+    def _payload(self, provider_model_id: str, messages: list, stream: bool) -> dict:
+        payload: dict = {"model": provider_model_id, "messages": messages, "stream": stream}
+        keep_alive = self._keep_alive.get(provider_model_id)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+    async def loaded_models(self) -> List[str]:
+        response = await self.client.get(f"{self.config.base_url}/api/ps", timeout=self.timeout)
+        response.raise_for_status()
+        models = jsonlib.loads(response.content).get("models") or []
+        return [m.get("model") or m.get("name") for m in models]
+
+    async def warm_up(self, provider_model_id: str) -> None:
+        # A chat request without messages loads the model and returns.
+        response = await self.client.post(
+            f"{self.config.base_url}/api/chat",
+            **self._json_body(self._payload(provider_model_id, [], False)),
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+
     def _to_openai_format(self, ollama_response: dict, model: str) -> dict:
         return {
             "id": f"ollama-{int(time.time())}",
@@ -34,75 +76,75 @@ class OllamaProvider(BaseProvider):
         }
 
     async def chat_completion(self, provider_model_id: str, messages: list, params: dict):
-        payload: dict = {
-            "model": provider_model_id,
-            "messages": messages,
-            "stream": False,
-        }
-
-        if "temperature" in params or "top_p" in params:
-            payload["options"] = {}
-            if "temperature" in params:
-                payload["options"]["temperature"] = params["temperature"]
-            if "top_p" in params:
-                payload["options"]["top_p"] = params["top_p"]
+        payload = self._payload(provider_model_id, messages, False)
+        options = _options(params)
+        if options:
+            payload["options"] = options
 
         response = await self.client.post(
             f"{self.config.base_url}/api/chat",
-            json=payload,
-            timeout=self.config.timeout,
+            **self._json_body(payload),
+            timeout=self.timeout,
         )
         response.raise_for_status()
 
-        return self._to_openai_format(response.json(), provider_model_id)
+        return self._to_openai_format(jsonlib.loads(response.content), provider_model_id)
 
     async def chat_completion_stream(
         self, provider_model_id: str, messages: list, params: dict
     ):
-        payload: dict = {
-            "model": provider_model_id,
-            "messages": messages,
-            "stream": True,
-        }
-
-        if "temperature" in params or "top_p" in params:
-            payload["options"] = {}
-            if "temperature" in params:
-                payload["options"]["temperature"] = params["temperature"]
-            if "top_p" in params:
-                payload["options"]["top_p"] = params["top_p"]
+        payload = self._payload(provider_model_id, messages, True)
+        options = _options(params)
+        if options:
+            payload["options"] = options
 
         async with self.client.stream(
             "POST",
             f"{self.config.base_url}/api/chat",
-            json=payload,
-            timeout=self.config.timeout,
+            **self._json_body(payload),
+            timeout=self.timeout,
         ) as response:
             response.raise_for_status()
 
-            async for line in response.aiter_lines():
-                if not line:
-                    continue
-
-                data = json.loads(line)
-
-                if data.get("message"):
-                    chunk = {
-                        "id": f"ollama-{int(time.time())}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": provider_model_id,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {
-                                    "content": data["message"].get("content", ""),
-                                },
-                                "finish_reason": None,
-                            }
-                        ],
-                    }
-                    yield f"data: {json.dumps(chunk)}\n\n"
-
-                if data.get("done"):
-                    yield "data: [DONE]\n\n"
+            async for chunk in self._translate_stream(response.aiter_bytes(), provider_model_id):
+                yield chunk
+
+    async def _translate_stream(
+        self, source: AsyncIterator[bytes], provider_model_id: str
+    ) -> AsyncIterator[bytes]:
+        """Translate Ollama NDJSON into OpenAI chunks.
+
+        Ordinary content lines are spliced from the upstream bytes without
+        parsing; the id and timestamp are fixed once per stream.
+        """
+
+        created = int(time.time())
+        encoder = ChunkEncoder(f"ollama-{created}", provider_model_id, created)
+
+        async for line in iter_lines(source):
+            text = extract_string(line, CONTENT_MARKER, CONTENT_TERMINATOR)
+            if text is not None:
+                if text != b'""':
+                    yield encoder.content(text)
+                continue
+
+            data = jsonlib.loads(line)
+            if data.get("error"):
+                raise ProviderError(f"Ollama stream error: {data['error']}")
+
+            content = (data.get("message") or {}).get("content")
+            if content:
+                yield encoder.text(content)
+
+            if data.get("done"):
+                prompt_tokens = data.get("prompt_eval_count", 0)
+                completion_tokens = data.get("eval_count", 0)
+                yield encoder.finish(
+                    "length" if data.get("done_reason") == "length" else "stop",
+                    usage_dict(prompt_tokens, completion_tokens),
+                )
+                yield DONE_EVENT
+
+
+def _options(params: dict) -> dict:
+    return {option: params[name] for name, option in _OPTIONS.items() if name in params}
@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import json
-
 from .base import BaseProvider
 
 
@@ -17,12 +15,11 @@ class OpenAIProvider(BaseProvider):
 
         response = await self.client.post(
             f"{self.config.base_url}/chat/completions",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
         )
         response.raise_for_status()
-        return response.json()
+        return self._openai_response(response, provider_model_id)
 
     async def chat_completion_stream(
         self, provider_model_id: str, messages: list, params: dict
@@ -33,17 +30,17 @@ class OpenAIProvider(BaseProvider):
             "stream": True,
             **params,
         }
+        if self.config.request_stream_usage:
+            payload["stream_options"] = {"include_usage": True}
 
         headers = {"Authorization": f"Bearer {self.config.api_key}"}
 
         async with self.client.stream(
             "POST",
             f"{self.config.base_url}/chat/completions",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
         ) as response:
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    yield line + "\n\n"
+            async for chunk in self._forward_openai_stream(response, provider_model_id):
+                yield chunk
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from .base import BaseProvider
+from .base import BaseProvider, ProviderError
 
 
 class OpenRouterProvider(BaseProvider):
@@ -48,14 +48,16 @@ class OpenRouterProvider(BaseProvider):
 
         response = await self.client.post(
             f"{self.config.base_url}/chat/completions",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
         )
         if response.status_code != 200:
-            raise Exception(f"OpenRouter API error: {response.status_code} - {response.text}")
+            raise ProviderError(
+                f"OpenRouter API error: {response.status_code} - {response.text}",
+                response.status_code,
+            )
         response.raise_for_status()
-        return response.json()
+        return self._openai_response(response, provider_model_id)
 
     async def chat_completion_stream(
         self, provider_model_id: str, messages: list, params: dict
@@ -68,6 +70,8 @@ class OpenRouterProvider(BaseProvider):
             "stream": True,
             **params,
         }
+        if self.config.request_stream_usage:
+            payload["stream_options"] = {"include_usage": True}
 
         headers = {
             "Authorization": f"Bearer {self.config.api_key}",
@@ -78,14 +82,15 @@ class OpenRouterProvider(BaseProvider):
         async with self.client.stream(
             "POST",
             f"{self.config.base_url}/chat/completions",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
         ) as response:
             if response.status_code != 200:
                 error_body = await response.aread()
-                raise Exception(f"OpenRouter API error: {response.status_code} - {error_body.decode()}")
+                raise ProviderError(
+                    f"OpenRouter API error: {response.status_code} - {error_body.decode()}",
+                    response.status_code,
+                )
             response.raise_for_status()
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    yield line + "\n\n"
+            async for chunk in self._forward_openai_stream(response, provider_model_id):
+                yield chunk
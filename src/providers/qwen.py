@@ -1,33 +1,62 @@
 from __future__ import annotations
 
-from .base import BaseProvider
+from typing import AsyncIterator
+
+from .. import jsonlib
+from ..sse import DONE_EVENT
+from ..translate import ChunkEncoder, iter_lines, usage_dict
+from .base import BaseProvider, ProviderError
+
+# OpenAI parameter name -> DashScope parameter name. DashScope has no
+# frequency_penalty equivalent, so it is dropped.
+PARAMETER_NAMES = {
+    "temperature": "temperature",
+    "top_p": "top_p",
+    "max_tokens": "max_tokens",
+    "stop": "stop",
+    "presence_penalty": "presence_penalty",
+    "seed": "seed",
+}
 
 
 class QwenProvider(BaseProvider):
-    async def chat_completion(self, provider_model_id: str, messages: list, params: dict):
-        payload = {
-            "model": provider_model_id,
-            "input": {"messages": messages},
-            "parameters": {
-                "temperature": params.get("temperature", 1.0),
-                "max_tokens": params.get("max_tokens", 2000),
-            },
+    def _parameters(self, params: dict) -> dict:
+        parameters = {
+            "temperature": params.get("temperature", 1.0),
+            "max_tokens": params.get("max_tokens", 2000),
         }
+        for name, dashscope_name in PARAMETER_NAMES.items():
+            if name in params:
+                parameters[dashscope_name] = params[name]
+        return parameters
 
-        headers = {
+    def _headers(self) -> dict:
+        return {
             "Authorization": f"Bearer {self.config.api_key}",
             "Content-Type": "application/json",
         }
 
+    @staticmethod
+    def _usage(qwen_usage: dict) -> dict:
+        return usage_dict(
+            qwen_usage.get("input_tokens", 0), qwen_usage.get("output_tokens", 0)
+        )
+
+    async def chat_completion(self, provider_model_id: str, messages: list, params: dict):
+        payload = {
+            "model": provider_model_id,
+            "input": {"messages": messages},
+            "parameters": self._parameters(params),
+        }
+
         response = await self.client.post(
             f"{self.config.base_url}/services/aigc/text-generation/generation",
-            json=payload,
-            headers=headers,
-            timeout=self.config.timeout,
+            **self._json_body(payload, self._headers()),
+            timeout=self.timeout,
         )
         response.raise_for_status()
 
-        qwen_data = response.json()
+        qwen_data = jsonlib.loads(response.content)
         return {
             "id": qwen_data["request_id"],
             "object": "chat.completion",
@@ -43,10 +72,75 @@ class QwenProvider(BaseProvider):
                     "finish_reason": qwen_data["output"].get("finish_reason"),
                 }
             ],
-            "usage": qwen_data.get("usage", {}),
+            "usage": self._usage(qwen_data.get("usage", {})),
         }
 
     async def chat_completion_stream(
         self, provider_model_id: str, messages: list, params: dict
     ):
-        raise NotImplementedError("Qwen streaming is not implemented yet.")
+        parameters = self._parameters(params)
+        # Incremental output makes each event carry only the new text rather
+        # than everything generated so far.
+        parameters["incremental_output"] = True
+        parameters["result_format"] = "message"
+
+        payload = {
+            "model": provider_model_id,
+            "input": {"messages": messages},
+            "parameters": parameters,
+        }
+
+        headers = self._headers()
+        headers["X-DashScope-SSE"] = "enable"
+
+        async with self.client.stream(
+            "POST",
+            f"{self.config.base_url}/services/aigc/text-generation/generation",
+            **self._json_body(payload, headers),
+            timeout=self.timeout,
+        ) as response:
+            if response.status_code != 200:
+                error_body = await response.aread()
+                raise ProviderError(
+                    f"Qwen API error: {response.status_code} - {error_body.decode()}",
+                    response.status_code,
+                )
+
+            async for chunk in self._translate_stream(response.aiter_bytes(), provider_model_id):
+                yield chunk
+
+    async def _translate_stream(
+        self, source: AsyncIterator[bytes], provider_model_id: str
+    ) -> AsyncIterator[bytes]:
+        """Translate DashScope incremental SSE into OpenAI chunks."""
+
+        encoder = None
+        event = b"result"
+
+        async for line in iter_lines(source):
+            if line.startswith(b"event:"):
+                event = line[6:].strip()
+                continue
+            if not line.startswith(b"data:"):
+                continue
+
+            data = jsonlib.loads(line[5:])
+            if event == b"error" or data.get("code"):
+                raise ProviderError(
+                    f"Qwen stream error: {data.get('code')} - {data.get('message')}"
+                )
+
+            if encoder is None:
+                encoder = ChunkEncoder(data.get("request_id", ""), provider_model_id, 0)
+                yield encoder.role()
+
+            choice = (data.get("output", {}).get("choices") or [{}])[0]
+            content = (choice.get("message") or {}).get("content")
+            if content:
+                yield encoder.text(content)
+
+            finish_reason = choice.get("finish_reason")
+            if finish_reason and finish_reason != "null":
+                yield encoder.finish(finish_reason, self._usage(data.get("usage", {})))
+                yield DONE_EVENT
+                return
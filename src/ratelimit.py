@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from typing import Callable, Dict, Mapping, Optional, Set
+
+from .config import ApiKeyConfig
+from .jsonlib import usage_of
+from .shared import SharedState, key_id
+from .usage import StreamUsage, response_completion_estimate
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, message: str, limit_type: str, retry_after: float):
+        super().__init__(message)
+        self.limit_type = limit_type
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on access, so every call is O(1).
+
+    ``consume`` may drive the balance negative to settle usage that was only
+    known after the fact; new requests then wait until it recovers.
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.clock = clock
+        self.tokens = float(per_minute)
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` is available; 0 if it already is."""
+        self._refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return needed / self.rate if needed > 0 else 0.0
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= amount
+
+    @property
+    def remaining(self) -> int:
+        self._refill()
+        return max(0, int(self.tokens))
+
+
+class Admission:
+    """Resources held by one admitted request; ``finish`` settles them once.
+
+    Prompt tokens are charged from an estimate at admission. Upstream usage
+    corrects that when it is seen, otherwise the output is estimated.
+    """
+
+    def __init__(self, limiter: "KeyLimiter", prompt_estimate: int, stream: bool):
+        self._limiter = limiter
+        self._prompt_estimate = prompt_estimate
+        self._stream = stream
+        self._finished = False
+        self.completion_estimate = 0
+
+    def finish_stream(self, meter: StreamUsage) -> None:
+        self.completion_estimate = meter.chunks
+        self.finish(meter.usage())
+
+    def finish_response(self, response: Mapping) -> None:
+        usage = usage_of(response)
+        if not usage:
+            self.completion_estimate = response_completion_estimate(response)
+        self.finish(usage)
+
+    def finish(self, usage: Optional[dict] = None) -> None:
+        if self._finished:
+            return
+        self._finished = True
+
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens") or self._prompt_estimate
+            completion_tokens = usage.get("completion_tokens") or 0
+            tokens = prompt_tokens - self._prompt_estimate + completion_tokens
+        else:
+            tokens = self.completion_estimate
+        self._limiter.settle(self._stream, tokens)
+
+
+class KeyLimiter:
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, config: ApiKeyConfig):
+        self.config = config
+        self.requests = (
+            TokenBucket(config.requests_per_minute, self.clock)
+            if config.requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(config.tokens_per_minute, self.clock) if config.tokens_per_minute else None
+        )
+        self.active_streams = 0
+
+    async def admit(self, prompt_estimate: int, stream: bool) -> Admission:
+        return self.try_admit(prompt_estimate, stream)
+
+    def try_admit(self, prompt_estimate: int, stream: bool) -> Admission:
+        name = self.config.name or "this API key"
+        if self.requests is not None:
+            wait = self.requests.wait_time(1)
+            if wait > 0:
+                raise RateLimitExceeded(
+                    f"Rate limit reached for requests on {name}: "
+                    f"{self.config.requests_per_minute} per minute. "
+                    f"Please try again in {wait:.1f}s.",
+                    "requests",
+                    wait,
+                )
+        if self.tokens is not None:
+            wait = self.tokens.wait_time(prompt_estimate)
+            if wait > 0:
+                raise RateLimitExceeded(
+                    f"Rate limit reached for tokens on {name}: "
+                    f"{self.config.tokens_per_minute} per minute. "
+                    f"Please try again in {wait:.1f}s.",
+                    "tokens",
+                    wait,
+                )
+        limit = self.config.max_concurrent_streams
+        if stream and limit is not None and self.active_streams >= limit:
+            raise RateLimitExceeded(
+                f"Too many concurrent streams on {name}: limit is {limit}.",
+                "concurrency",
+                1.0,
+            )
+
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(prompt_estimate)
+        if stream:
+            self.active_streams += 1
+        return Admission(self, prompt_estimate, stream)
+
+    def settle(self, stream: bool, tokens: float) -> None:
+        if stream:
+            self.active_streams -= 1
+        if self.tokens is not None and tokens:
+            self.tokens.consume(tokens)
+
+    async def stats(self) -> Dict[str, Optional[int]]:
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, Optional[int]]:
+        return {
+            "requests_remaining": self.requests.remaining if self.requests else None,
+            "tokens_remaining": self.tokens.remaining if self.tokens else None,
+            "active_streams": self.active_streams,
+        }
+
+
+class SharedKeyLimiter(KeyLimiter):
+    """KeyLimiter whose buckets live in SharedState so all workers agree.
+
+    Each operation loads the row, runs the in-memory logic and writes it
+    back inside one write transaction. That may wait on another worker's
+    transaction, so it runs on a thread. Wall-clock time is used because the
+    buckets are compared across processes.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self, config: ApiKeyConfig, state: SharedState):
+        super().__init__(config)
+        self._state = state
+        self._id = key_id(config.key)
+        self._settling: Set[asyncio.Task] = set()
+
+    async def admit(self, prompt_estimate: int, stream: bool) -> Admission:
+        return await self._state.run(self.try_admit, prompt_estimate, stream)
+
+    def try_admit(self, prompt_estimate: int, stream: bool) -> Admission:
+        with self._state.transaction() as db:
+            self._load(db)
+            try:
+                return super().try_admit(prompt_estimate, stream)
+            finally:
+                self._save(db)
+
+    def settle(self, stream: bool, tokens: float) -> None:
+        # Nothing waits for the outcome, so the write happens in the background.
+        task = asyncio.get_running_loop().create_task(
+            self._state.run(self._settle, stream, tokens)
+        )
+        self._settling.add(task)
+        task.add_done_callback(self._settling.discard)
+
+    def _settle(self, stream: bool, tokens: float) -> None:
+        with self._state.transaction() as db:
+            self._load(db)
+            super().settle(stream, tokens)
+            self._save(db)
+
+    async def stats(self) -> Dict[str, Optional[int]]:
+        return await self._state.run(self.snapshot)
+
+    def snapshot(self) -> Dict[str, Optional[int]]:
+        with self._state.transaction() as db:
+            self._load(db)
+            return super().snapshot()
+
+    def _load(self, db) -> None:
+        row = db.execute(
+            "SELECT requests, tokens, updated, streams FROM rate_limits WHERE key = ?",
+            (self._id,),
+        ).fetchone()
+        if row is None:
+            return
+        requests, tokens, updated, self.active_streams = row
+        for bucket, level in ((self.requests, requests), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.tokens = bucket.capacity if level is None else min(level, bucket.capacity)
+                bucket.updated = updated
+
+    def _save(self, db) -> None:
+        db.execute(
+            "INSERT OR REPLACE INTO rate_limits (key, requests, tokens, updated, streams) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                self._id,
+                self.requests.tokens if self.requests else None,
+                self.tokens.tokens if self.tokens else None,
+                self.clock(),
+                self.active_streams,
+            ),
+        )
+
+
+class RateLimiter:
+    """Per-API-key admission control with token buckets.
+
+    Buckets are in memory unless ``shared`` is given, in which case keys
+    that have limits keep them in the cross-worker store.
+    """
+
+    def __init__(
+        self,
+        keys: Dict[str, ApiKeyConfig],
+        previous: Optional["RateLimiter"] = None,
+        shared: Optional[SharedState] = None,
+    ):
+        # On reload, keys with unchanged limits keep their bucket state.
+        old = previous._limiters if previous is not None else {}
+        self._limiters: Dict[str, KeyLimiter] = {}
+        for key, config in keys.items():
+            if key in old and old[key].config == config:
+                self._limiters[key] = old[key]
+            elif shared is not None and _has_limits(config):
+                self._limiters[key] = SharedKeyLimiter(config, shared)
+            else:
+                self._limiters[key] = KeyLimiter(config)
+
+    async def admit(self, key: str, prompt_estimate: int, stream: bool) -> Optional[Admission]:
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            return None
+        return await limiter.admit(prompt_estimate, stream)
+
+    async def stats(self) -> Dict[str, Dict[str, Optional[int]]]:
+        return {
+            limiter.config.name or f"key-{index}": await limiter.stats()
+            for index, limiter in enumerate(self._limiters.values())
+        }
+
+
+def _has_limits(config: ApiKeyConfig) -> bool:
+    return bool(
+        config.requests_per_minute or config.tokens_per_minute or config.max_concurrent_streams
+    )
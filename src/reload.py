@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import signal
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .config import Config, load_config
+from .router import ModelRouter
+from .shared import SharedState
+
+logger = logging.getLogger(__name__)
+
+# Read once at startup; a reload cannot change them.
+RESTART_SECTIONS = ("cache", "batch", "capture", "usage", "shared_state")
+RESTART_SERVER_FIELDS = ("host", "port", "config_watch_interval")
+
+
+def restart_required(old: Config, new: Config) -> List[str]:
+    """Settings changed between ``old`` and ``new`` that only a restart applies."""
+    changed = [name for name in RESTART_SECTIONS if getattr(old, name) != getattr(new, name)]
+    changed += [
+        f"server.{name}"
+        for name in RESTART_SERVER_FIELDS
+        if getattr(old.server, name) != getattr(new.server, name)
+    ]
+    return changed
+
+
+class ConfigReloader:
+    """Swap in a new ModelRouter when providers.yaml changes.
+
+    The new config is fully validated and its router built before anything
+    is replaced; a bad file leaves the running router untouched. The old
+    router keeps serving the requests it already started and is closed once
+    they finish, except for clients the new router took over.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        router: ModelRouter,
+        on_swap: Callable[[Config, ModelRouter], None],
+        drain_timeout: float,
+        shared: Optional[SharedState] = None,
+    ):
+        self.path = path
+        self.shared = shared
+        self.router = router
+        self.on_swap = on_swap
+        self.drain_timeout = drain_timeout
+        self.reloads = 0
+        self._lock = asyncio.Lock()
+        self._mtime = self._file_mtime()
+        self._generation = shared.config_generation() if shared is not None else 0
+        self._retiring: Set[asyncio.Task] = set()
+        self._watcher: Optional[asyncio.Task] = None
+
+    async def reload(self, reason: str = "manual") -> Dict[str, Any]:
+        async with self._lock:
+            self._mtime = self._file_mtime()
+            config = load_config(self.path)
+            old = self.router
+            pending = restart_required(old.config, config)
+            new = ModelRouter(config, previous=old)
+            self.router = new
+            self.on_swap(config, new)
+            old.stop()
+            new.start()
+            self.drain_timeout = config.server.drain_timeout
+            self.reloads += 1
+
+            task = asyncio.create_task(self._retire(old, new))
+            self._retiring.add(task)
+            task.add_done_callback(self._retiring.discard)
+
+            rebuilt = sorted(set(new.clients_by_provider()) - new.reused)
+            logger.info(
+                f"Reloaded {self.path} ({reason}): reused {sorted(new.reused)}, "
+                f"rebuilt {rebuilt}, {old.active_requests} requests draining"
+            )
+            if pending:
+                logger.warning(f"Changes to {', '.join(pending)} need a restart to take effect")
+            return {
+                "status": "restart_required" if pending else "reloaded",
+                "reason": reason,
+                "reused": sorted(new.reused),
+                "rebuilt": rebuilt,
+                "draining": old.active_requests,
+                "restart_required": pending,
+            }
+
+    async def reload_all(self, reason: str = "manual") -> Dict[str, Any]:
+        """Reload here, then have every other worker follow."""
+        result = await self.reload(reason)
+        if self.shared is not None:
+            self._generation = self.shared.bump_config_generation()
+        return result
+
+    async def _retire(self, old: ModelRouter, new: ModelRouter) -> None:
+        try:
+            if not await old.drain(self.drain_timeout):
+                logger.warning(
+                    f"{old.active_requests} requests still running after "
+                    f"{self.drain_timeout:g}s; closing old connection pools anyway"
+                )
+        finally:
+            await old.close(keep=new.clients())
+
+    def schedule(self, reason: str) -> None:
+        """Reload in the background, logging rather than raising on failure."""
+
+        async def run() -> None:
+            try:
+                await self.reload(reason)
+            except Exception as e:
+                logger.error(f"Config reload ({reason}) failed, keeping current config: {e}")
+
+        asyncio.get_running_loop().create_task(run())
+
+    def install_signal_handler(self) -> None:
+        if not hasattr(signal, "SIGHUP"):
+            return
+        try:
+            asyncio.get_running_loop().add_signal_handler(
+                signal.SIGHUP, self.schedule, "SIGHUP"
+            )
+        except (NotImplementedError, RuntimeError):  # pragma: no cover - platform specific
+            logger.warning("SIGHUP reload is not supported on this platform")
+
+    def watch(self, interval: float) -> None:
+        self._watcher = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    async def _watch(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self._file_mtime()
+            if mtime is not None and mtime != self._mtime:
+                self._mtime = mtime
+                self.schedule("file change")
+            elif self.shared is not None:
+                generation = self.shared.config_generation()
+                if generation != self._generation:
+                    self._generation = generation
+                    self.schedule("another worker reloaded")
+
+    def _file_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    async def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+        for task in list(self._retiring):
+            task.cancel()
+        await asyncio.gather(*self._retiring, return_exceptions=True)
@@ -0,0 +1,145 @@
+"""Re-send captured or batch traffic to a router for load testing.
+
+Reads capture files (``capture-*.jsonl.gz``), OpenAI batch input files or
+bare request-body JSONL, plain or gzipped, and posts every request to
+``/v1/chat/completions``::
+
+    python -m src.replay captures/*.jsonl.gz --url http://localhost:8000 --speed 2
+    python -m src.replay requests.jsonl --rate 20 --concurrency 32
+
+Capture records are sent at their original spacing divided by ``--speed``
+(``--speed 0`` sends as fast as ``--concurrency`` allows). Lines without a
+timestamp are sent at ``--rate`` requests per second, or back to back.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from .batch import parse_line
+
+
+def read_requests(paths: List[str]) -> Iterator[Tuple[Optional[float], Dict[str, Any]]]:
+    """Yield ``(timestamp or None, request body)`` from every file in order."""
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for index, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                record = json.loads(line)
+                if isinstance(record, dict) and "request" in record:
+                    yield record.get("ts"), record["request"]
+                else:
+                    yield None, parse_line(line, index)[1]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def replay(
+    requests: Iterator[Tuple[Optional[float], Dict[str, Any]]],
+    url: str,
+    api_key: Optional[str],
+    speed: float,
+    rate: Optional[float],
+    concurrency: int,
+    model: Optional[str] = None,
+) -> Dict[str, Any]:
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: Counter = Counter()
+    latencies: List[float] = []
+    tasks = []
+
+    async def send(client: httpx.AsyncClient, body: Dict[str, Any]) -> None:
+        start = time.perf_counter()
+        try:
+            if body.get("stream"):
+                async with client.stream("POST", url, json=body, headers=headers) as response:
+                    async for _ in response.aiter_raw():
+                        pass
+            else:
+                response = await client.post(url, json=body, headers=headers)
+            statuses[response.status_code] += 1
+            latencies.append(time.perf_counter() - start)
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+        finally:
+            semaphore.release()
+
+    started = time.perf_counter()
+    first_ts: Optional[float] = None
+    sent = 0
+    async with httpx.AsyncClient(limits=limits, timeout=300.0) as client:
+        for ts, body in requests:
+            if model:
+                body = {**body, "model": model}
+            if ts is not None and speed > 0:
+                if first_ts is None:
+                    first_ts = ts
+                delay = (ts - first_ts) / speed - (time.perf_counter() - started)
+            elif ts is None and rate:
+                delay = sent / rate - (time.perf_counter() - started)
+            else:
+                delay = 0.0
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(send(client, body)))
+            sent += 1
+        await asyncio.gather(*tasks)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "sent": sent,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(sent / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay chat completion traffic against a router.")
+    parser.add_argument("files", nargs="+", help="Capture, batch or request-body JSONL files")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--api-key", default=os.getenv("ROUTER_API_KEY"))
+    parser.add_argument("--speed", type=float, default=1.0, help="Time scale for captured traffic; 0 = no delays")
+    parser.add_argument("--rate", type=float, help="Requests/sec for lines without timestamps")
+    parser.add_argument("--concurrency", type=int, default=64, help="Maximum requests in flight")
+    parser.add_argument("--model", help="Send every request to this model instead")
+    args = parser.parse_args()
+
+    summary = asyncio.run(
+        replay(
+            read_requests(args.files),
+            args.url.rstrip("/") + "/v1/chat/completions",
+            args.api_key,
+            args.speed,
+            args.rate,
+            args.concurrency,
+            args.model,
+        )
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
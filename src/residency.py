@@ -0,0 +1,175 @@
+"""Which models each Ollama or llama-swap backend has loaded.
+
+One tracker per provider polls every endpoint every ``poll_interval``
+seconds (Ollama ``/api/ps``, llama-swap ``/running``) and, at startup, loads
+the models marked ``warm_up``. A cold load takes tens of seconds, so the
+router prefers replicas, and with ``prefer_loaded`` fallbacks, that already
+have the model in memory.
+
+An endpoint whose last poll failed is "unknown" rather than empty, so a
+flaky poll never makes a model look cold.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Set, TypeVar
+
+import httpx
+
+from . import metrics
+from .affinity import call_with_hint
+from .balancer import PINNED_ENDPOINT
+from .providers.base import BaseProvider
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class EndpointResidency:
+    __slots__ = ("url", "models", "polled_at", "error")
+
+    def __init__(self, url: str):
+        self.url = url
+        # None until a poll succeeds.
+        self.models: Optional[Set[str]] = None
+        self.polled_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "models": sorted(self.models) if self.models is not None else None,
+            "polled_at": self.polled_at,
+            "error": self.error,
+        }
+
+
+class ResidencyTracker:
+    def __init__(self, name: str, provider: BaseProvider, previous: Optional["ResidencyTracker"] = None):
+        self.name = name
+        self.provider = provider
+        self.config = provider.config.residency
+        urls = [e.url for e in provider.config.endpoints] or [provider.config.base_url]
+        # Requests to one replica have to get past the balancing transport.
+        self._pin = len(provider.config.endpoints) > 1
+        self.endpoints: Dict[str, EndpointResidency] = {}
+        for url in urls:
+            url = str(httpx.URL(url.rstrip("/")))
+            endpoint = EndpointResidency(url)
+            if previous is not None and url in previous.endpoints:
+                old = previous.endpoints[url]
+                endpoint.models, endpoint.polled_at = old.models, old.polled_at
+            self.endpoints[url] = endpoint
+        self.warm_up_state: Dict[str, Dict[str, str]] = {}
+        self.polls = 0
+        self._task: Optional[asyncio.Task] = None
+        self._gauges = {
+            model.provider_model_id: metrics.MODEL_LOADED.labels(name, model.name)
+            for model in provider.config.models
+        }
+
+    def _key(self, model_id: str) -> str:
+        # Ollama reports "mistral:latest" for a model requested as "mistral".
+        if self.provider.config.type == "ollama" and ":" not in model_id:
+            return model_id + ":latest"
+        return model_id
+
+    def resident_on(self, model_id: str) -> FrozenSet[str]:
+        """URLs of the endpoints that have ``model_id`` loaded."""
+        key = self._key(model_id)
+        return frozenset(
+            url for url, endpoint in self.endpoints.items()
+            if endpoint.models is not None and key in endpoint.models
+        )
+
+    def is_cold(self, model_id: str) -> bool:
+        """True only if every endpoint answered its last poll without the model."""
+        key = self._key(model_id)
+        return all(
+            endpoint.models is not None and key not in endpoint.models
+            for endpoint in self.endpoints.values()
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        await self.poll()
+        await self.warm_up()
+        while True:
+            await asyncio.sleep(self.config.poll_interval)
+            await self.poll()
+
+    async def poll(self) -> None:
+        await asyncio.gather(*(self._poll(endpoint) for endpoint in self.endpoints.values()))
+        self.polls += 1
+        for model_id, gauge in self._gauges.items():
+            gauge.set(len(self.resident_on(model_id)))
+
+    async def _poll(self, endpoint: EndpointResidency) -> None:
+        try:
+            models = await self._on(endpoint, self.provider.loaded_models)
+        except Exception as e:
+            if endpoint.error is None:
+                logger.warning(f"Could not list loaded models on {endpoint.url}: {e}")
+            endpoint.models = None
+            endpoint.error = str(e) or type(e).__name__
+            return
+        endpoint.models = {self._key(model) for model in models if model}
+        endpoint.polled_at = time.time()
+        endpoint.error = None
+
+    async def warm_up(self) -> None:
+        """Load every ``warm_up`` model wherever it is not loaded yet.
+
+        Endpoints warm up in parallel, their models one after another so a
+        box is not asked to load several at once.
+        """
+
+        models = [m.provider_model_id for m in self.provider.config.models if m.warm_up]
+        if models:
+            await asyncio.gather(*(self._warm(endpoint, models) for endpoint in self.endpoints.values()))
+
+    async def _warm(self, endpoint: EndpointResidency, models: List[str]) -> None:
+        state = self.warm_up_state.setdefault(endpoint.url, {})
+        for model_id in models:
+            if endpoint.models is not None and self._key(model_id) in endpoint.models:
+                state[model_id] = "resident"
+                continue
+            state[model_id] = "loading"
+            start = time.monotonic()
+            try:
+                await self._on(endpoint, self.provider.warm_up, model_id)
+            except Exception as e:
+                state[model_id] = f"failed: {e}"
+                logger.warning(f"Warm-up of '{model_id}' on {endpoint.url} failed: {e}")
+                continue
+            state[model_id] = "loaded"
+            if endpoint.models is not None:
+                endpoint.models.add(self._key(model_id))
+            logger.info(f"Warmed up '{model_id}' on {endpoint.url} in {time.monotonic() - start:.1f}s")
+
+    async def _on(self, endpoint: EndpointResidency, fn: Callable[..., Awaitable[T]], *args: Any) -> T:
+        if not self._pin:
+            return await fn(*args)
+        return await call_with_hint(PINNED_ENDPOINT, endpoint.url, lambda: fn(*args))
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "poll_interval": self.config.poll_interval,
+            "polls": self.polls,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints.values()],
+        }
+        if self.warm_up_state:
+            stats["warm_up"] = self.warm_up_state
+        return stats
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+from typing import Any, Mapping, Optional
+
+from fastapi.responses import JSONResponse, Response
+
+from . import jsonlib
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when it is installed."""
+
+    def render(self, content: Any) -> bytes:
+        return jsonlib.dumps(content)
+
+
+class RawJSONResponse(Response):
+    """Response whose body is JSON that is already encoded."""
+
+    media_type = "application/json"
+
+
+def json_response(
+    content: Any, status_code: int = 200, headers: Optional[Mapping[str, str]] = None
+) -> Response:
+    """Send ``content``, forwarding upstream bodies untouched."""
+    if isinstance(content, jsonlib.RawJSON):
+        return RawJSONResponse(content.body, status_code=status_code, headers=headers)
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
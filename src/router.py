@@ -1,29 +1,162 @@
 from __future__ import annotations
 
-from typing import Tuple
+import asyncio
+import importlib
+import logging
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
 import httpx
 
-from .config import Config
-from .providers.anthropic import AnthropicProvider
-from .providers.base import BaseProvider
-from .providers.llama_cpp import LlamaCppProvider
-from .providers.ollama import OllamaProvider
-from .providers.openai import OpenAIProvider
-from .providers.openrouter import OpenRouterProvider
-from .providers.qwen import QwenProvider
+from .affinity import PREFIX_HASHES, call_with_hint, prefix_hashes, stream_with_hint
+from .balancer import RESIDENT_ON
+from .cache import make_cache_key, request_digest
+from . import metrics
+from .circuit import CircuitBreaker
+from .coalesce import RequestCoalescer
+from .hedge import Hedger
+from .config import CircuitBreakerConfig, Config, ModelConfig, SchedulerConfig
+from .pools import PoolWarmer, build_client, pool_stats, same_client_settings
+from .providers.base import BaseProvider, ProviderError
+from .residency import ResidencyTracker
+from .scheduler import QueueRejected, Scheduler, Ticket
+from .shared import SharedState
+from .sse import Chunk
+from .tokens import ContextLengthExceeded, TokenEstimator, fits, output_limit
+
+# Adapter classes by provider type as "module:Class" under src/providers,
+# imported on first use so a process only loads the adapters it runs.
+PROVIDER_TYPES: dict[str, str] = {
+    "openai": "openai:OpenAIProvider",
+    "anthropic": "anthropic:AnthropicProvider",
+    "ollama": "ollama:OllamaProvider",
+    "llama_cpp": "llama_cpp:LlamaCppProvider",
+    "openrouter": "openrouter:OpenRouterProvider",
+    "qwen": "qwen:QwenProvider",
+}
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upstream statuses worth another attempt: server errors, rate limits and
+# request timeouts. Other 4xx are the caller's fault and say nothing about
+# upstream health.
+RETRYABLE_STATUS = frozenset(range(500, 600)) | {408, 429}
+
+
+def provider_class(provider_type: str) -> type[BaseProvider]:
+    path = PROVIDER_TYPES.get(provider_type)
+    if path is None:
+        raise ValueError(f"Unknown provider type: {provider_type}")
+    module, name = path.split(":")
+    return getattr(importlib.import_module(f".providers.{module}", __package__), name)
+
+
+class UpstreamUnavailableError(Exception):
+    """Every target in a failover chain failed or had an open circuit."""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ResolvedModel(NamedTuple):
+    provider_name: str
+    provider: BaseProvider
+    provider_model_id: str
+    model_config: ModelConfig
 
 
 class ModelRouter:
     """Core routing logic mapping models to providers."""
 
-    def __init__(self, config: Config):
+    def __init__(
+        self,
+        config: Config,
+        previous: Optional["ModelRouter"] = None,
+        shared: Optional[SharedState] = None,
+    ):
+        """Build providers for ``config``.
+
+        When replacing ``previous`` on reload, providers keep its HTTP client,
+        scheduler and circuit breakers wherever the settings behind them are
+        unchanged. With ``shared`` (inherited from ``previous`` by default),
+        circuit state and scheduler slots are shared with the other workers,
+        and scheduler queues are split between them.
+        """
+
         self.config = config
+        self.shared = shared or (previous.shared if previous is not None else None)
         self._model_map = self._build_model_map()
-        self._http_client = httpx.AsyncClient(
-            limits=httpx.Limits(max_keepalive_connections=100, max_connections=200)
-        )
-        self._providers = self._initialize_providers()
+        # Cached message counts stay valid while the tokenizer does not change.
+        if previous is not None and previous.estimator.config == config.tokenizer:
+            self.estimator = previous.estimator
+        else:
+            self.estimator = TokenEstimator(config.tokenizer)
+        self._http_clients: dict[str, httpx.AsyncClient] = {}
+        self.reused: Set[str] = set()
+        if previous is not None:
+            self.reused = {
+                name
+                for name, provider_config in config.providers.items()
+                if provider_config.enabled
+                and name in previous._http_clients
+                and same_client_settings(previous.config.providers[name], provider_config)
+            }
+        self._providers = self._initialize_providers(previous)
+        self._coalescer = RequestCoalescer()
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._schedulers: Dict[str, Scheduler] = {}
+        for name, provider_config in config.providers.items():
+            if not provider_config.enabled or provider_config.scheduler is None:
+                continue
+            scheduler_config = self._scheduler_config(provider_config.scheduler)
+            scheduler = previous._schedulers.get(name) if previous is not None else None
+            if scheduler is None or scheduler.config != scheduler_config:
+                # In-flight requests on the old router keep their own slots.
+                slots = None
+                if self.shared is not None and self.shared.workers > 1:
+                    slots = self.shared.slots(name, scheduler_config.max_concurrency)
+                scheduler = Scheduler(name, scheduler_config, slots)
+            self._schedulers[name] = scheduler
+        self._residency: Dict[str, ResidencyTracker] = {}
+        for name, provider in self._providers.items():
+            if not provider.config.residency.enabled:
+                continue
+            if not provider.supports_residency:
+                logger.warning(f"Provider '{name}' cannot report loaded models; ignoring residency")
+                continue
+            old = previous._residency.get(name) if previous is not None else None
+            self._residency[name] = ResidencyTracker(name, provider, old)
+        self._warmers: Dict[str, PoolWarmer] = {
+            name: PoolWarmer(name, self._http_clients[name], provider.config)
+            for name, provider in self._providers.items()
+            if provider.config.pool.prewarm_connections
+        }
+        # Latency windows and budgets survive reloads that keep the settings.
+        self._hedgers: Dict[str, Hedger] = dict(previous._hedgers) if previous is not None else {}
+        if previous is not None:
+            for key, breaker in previous._breakers.items():
+                if key[0] in config.providers and breaker.config == self._breaker_config(key[0]):
+                    self._breakers[key] = breaker
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
 
     def _build_model_map(self) -> dict:
         model_map = {}
@@ -48,52 +181,609 @@ class ModelRouter:
 
         return model_map
 
-    def _initialize_providers(self) -> dict:
+    def _initialize_providers(self, previous: Optional["ModelRouter"] = None) -> dict:
         providers: dict[str, BaseProvider] = {}
 
         for provider_name, provider_config in self.config.providers.items():
             if not provider_config.enabled:
                 continue
 
-            provider_type = provider_config.type
-            if provider_type == "openai":
-                providers[provider_name] = OpenAIProvider(
-                    provider_config, self._http_client
-                )
-            elif provider_type == "anthropic":
-                providers[provider_name] = AnthropicProvider(
-                    provider_config, self._http_client
-                )
-            elif provider_type == "ollama":
-                providers[provider_name] = OllamaProvider(
-                    provider_config, self._http_client
-                )
-            elif provider_type == "llama_cpp":
-                providers[provider_name] = LlamaCppProvider(
-                    provider_config, self._http_client
-                )
-            elif provider_type == "openrouter":
-                providers[provider_name] = OpenRouterProvider(
-                    provider_config, self._http_client
-                )
-            elif provider_type == "qwen":
-                providers[provider_name] = QwenProvider(provider_config, self._http_client)
+            provider_cls = provider_class(provider_config.type)
+            if provider_name in self.reused:
+                client = previous._http_clients[provider_name]
             else:
-                raise ValueError(f"Unknown provider type: {provider_type}")
+                client = build_client(provider_config)
+            self._http_clients[provider_name] = client
+            providers[provider_name] = provider_cls(provider_config, client)
 
         return providers
 
-    def resolve_model(self, model_name: str) -> Tuple[BaseProvider, str]:
+    def resolve(self, model_name: str) -> ResolvedModel:
         if model_name not in self._model_map:
             available = sorted(self._model_map.keys())
             raise ValueError(
                 f"Model '{model_name}' not found. Available models: {available}"
             )
 
-        provider_name, provider_model_id, _ = self._model_map[model_name]
+        provider_name, provider_model_id, model_config = self._model_map[model_name]
         provider = self._providers[provider_name]
 
-        return provider, provider_model_id
+        return ResolvedModel(provider_name, provider, provider_model_id, model_config)
+
+    def resolve_model(self, model_name: str) -> Tuple[BaseProvider, str]:
+        resolved = self.resolve(model_name)
+        return resolved.provider, resolved.provider_model_id
+
+    def failover_chain(self, resolved: ResolvedModel) -> List[ResolvedModel]:
+        """Return the primary target followed by its configured fallbacks.
+
+        With ``prefer_loaded``, a primary that no backend has loaded goes
+        behind the first fallback that is loaded somewhere.
+        """
+
+        chain = [resolved]
+        seen = {(resolved.provider_name, resolved.provider_model_id)}
+        for name in resolved.model_config.fallbacks:
+            target = self.resolve(name)
+            key = (target.provider_name, target.provider_model_id)
+            if key not in seen:
+                seen.add(key)
+                chain.append(target)
+        if resolved.model_config.prefer_loaded and len(chain) > 1 and self._is_cold(resolved):
+            for i, target in enumerate(chain[1:], 1):
+                if self._resident_on(target):
+                    chain.insert(0, chain.pop(i))
+                    break
+        return chain
+
+    def fit_context(
+        self, resolved: ResolvedModel, prompt_tokens: int, params: dict
+    ) -> Tuple[ResolvedModel, dict]:
+        """Check a prompt against the model's context window before sending it.
+
+        A prompt that does not fit goes to the first ``overflow_to`` model
+        whose window holds it, or raises ContextLengthExceeded. The returned
+        params are fitted to that model with ``fit_output``. Fallbacks and
+        hedge targets are checked when the completion runs.
+        """
+
+        model = resolved.model_config
+        target = resolved
+        if not fits(model, prompt_tokens):
+            for name in model.overflow_to:
+                candidate = self.resolve(name)
+                if fits(candidate.model_config, prompt_tokens):
+                    target = candidate
+                    break
+            else:
+                metrics.CONTEXT_CHECKS.labels(model.name, "rejected").inc()
+                raise ContextLengthExceeded(model, prompt_tokens)
+            metrics.CONTEXT_CHECKS.labels(model.name, "rerouted").inc()
+
+        return target, self.fit_output(target, prompt_tokens, params)
+
+    def fit_output(self, target: ResolvedModel, prompt_tokens: int, params: dict) -> dict:
+        """``params`` with ``max_tokens`` fitted to what ``target`` has room for.
+
+        An explicit value that does not fit is lowered; a missing one is only
+        filled in from ``max_output``, never from the window.
+        """
+
+        model = target.model_config
+        requested = params.get("max_tokens")
+        limit = output_limit(model, prompt_tokens)
+        if requested is None:
+            if model.max_output is not None:
+                return {**params, "max_tokens": limit}
+            return params
+        if limit is not None and requested > limit:
+            metrics.CONTEXT_CHECKS.labels(model.name, "clamped").inc()
+            return {**params, "max_tokens": limit}
+        return params
+
+    def _fitting(
+        self, chain: List[ResolvedModel], prompt_tokens: Optional[int]
+    ) -> List[ResolvedModel]:
+        """The targets in ``chain`` whose context window holds the prompt."""
+        if prompt_tokens is None:
+            return chain
+        fitting = []
+        for target in chain:
+            if fits(target.model_config, prompt_tokens):
+                fitting.append(target)
+            else:
+                metrics.CONTEXT_CHECKS.labels(target.model_config.name, "skipped").inc()
+        return fitting
+
+    def _target_params(
+        self, target: ResolvedModel, params: dict, prompt_tokens: Optional[int]
+    ) -> dict:
+        if prompt_tokens is None:
+            return params
+        return self.fit_output(target, prompt_tokens, params)
+
+    def check_capacity(self, resolved: ResolvedModel, prompt_tokens: Optional[int] = None) -> None:
+        """Raise if every target in the chain would shed a request right now.
+
+        Lets streams be rejected with a status code before the response
+        starts, instead of as an error event after a 200.
+        """
+
+        for target in self._fitting(self.failover_chain(resolved), prompt_tokens):
+            scheduler = self._schedulers.get(target.provider_name)
+            if scheduler is None or not scheduler.full:
+                return
+        raise UpstreamUnavailableError(
+            f"All providers for '{resolved.model_config.name}' are at capacity "
+            "(queues full)",
+            503,
+        )
+
+    async def chat_completion(
+        self,
+        resolved: ResolvedModel,
+        messages: list,
+        params: dict,
+        ticket: Optional[Ticket] = None,
+        digest: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """Run a non-streaming completion across the failover chain.
+
+        Targets whose circuit is open or whose queue sheds the request are
+        skipped without a network call. With hedging configured, the first
+        attempt races a backup target once the primary is slow. ``digest``
+        is the request's ``request_digest`` if the caller already has it.
+        With ``prompt_tokens``, targets whose context window cannot hold the
+        prompt are skipped and ``max_tokens`` is fitted to each target.
+        """
+
+        self.hold()
+        try:
+            ticket = ticket or Ticket(resolved.model_config.priority)
+            chain = self._fitting(self.failover_chain(resolved), prompt_tokens)
+            if not chain:
+                raise ContextLengthExceeded(resolved.model_config, prompt_tokens)
+            hedge = self._hedge_plan(resolved, chain, prompt_tokens)
+
+            def attempt(target: ResolvedModel):
+                target_params = self._target_params(target, params, prompt_tokens)
+                return self._attempt(target, messages, target_params, ticket, digest)
+
+            tried: Set[Tuple[str, str]] = set()
+            last_error: Optional[Exception] = None
+            for target in chain:
+                if _target_key(target) in tried or not self._breaker(target).allow():
+                    continue
+                tried.add(_target_key(target))
+
+                try:
+                    if hedge is not None and target is chain[0]:
+                        hedger, backup = hedge
+                        return await self._hedged(
+                            hedger,
+                            target,
+                            backup,
+                            False,
+                            attempt,
+                            tried,
+                        )
+                    return await attempt(target)
+                except QueueRejected as e:
+                    last_error = e
+                    logger.warning(str(e))
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    last_error = e
+                    logger.warning(
+                        f"Provider '{target.provider_name}' failed for "
+                        f"'{target.provider_model_id}': {e}"
+                    )
+
+            raise _unavailable(resolved, last_error)
+        finally:
+            self.release()
+
+    async def chat_completion_stream(
+        self,
+        resolved: ResolvedModel,
+        messages: list,
+        params: dict,
+        ticket: Optional[Ticket] = None,
+        digest: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+    ) -> AsyncIterator[Chunk]:
+        """Stream a completion across the failover chain.
+
+        Failover and hedging only happen before the first chunk; once
+        anything has been yielded, upstream errors propagate to the caller.
+        """
+
+        self.hold()
+        try:
+            ticket = ticket or Ticket(resolved.model_config.priority)
+            chain = self._fitting(self.failover_chain(resolved), prompt_tokens)
+            if not chain:
+                raise ContextLengthExceeded(resolved.model_config, prompt_tokens)
+            hedge = self._hedge_plan(resolved, chain, prompt_tokens)
+
+            def open_first(target: ResolvedModel):
+                target_params = self._target_params(target, params, prompt_tokens)
+                return self._open_first(target, messages, target_params, ticket, digest)
+
+            tried: Set[Tuple[str, str]] = set()
+            last_error: Optional[Exception] = None
+            for target in chain:
+                if _target_key(target) in tried or not self._breaker(target).allow():
+                    continue
+                tried.add(_target_key(target))
+
+                try:
+                    if hedge is not None and target is chain[0]:
+                        hedger, backup = hedge
+                        opened = await self._hedged(
+                            hedger,
+                            target,
+                            backup,
+                            True,
+                            open_first,
+                            tried,
+                        )
+                    else:
+                        opened = await open_first(target)
+                except QueueRejected as e:
+                    last_error = e
+                    logger.warning(str(e))
+                    continue
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    last_error = e
+                    logger.warning(
+                        f"Provider '{target.provider_name}' failed to stream "
+                        f"'{target.provider_model_id}': {e}"
+                    )
+                    continue
+
+                target, stream, first, first_chunk_latency = opened
+                if first is None:
+                    return
+                breaker = self._breaker(target)
+                try:
+                    yield first
+                    async for chunk in stream:
+                        yield chunk
+                except Exception as e:
+                    if is_retryable(e):
+                        breaker.record_failure()
+                    raise
+                finally:
+                    await _aclose(stream)
+                breaker.record_success(first_chunk_latency)
+                return
+
+            raise _unavailable(resolved, last_error)
+        finally:
+            self.release()
+
+    async def _attempt(
+        self,
+        target: ResolvedModel,
+        messages: list,
+        params: dict,
+        ticket: Ticket,
+        digest: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Call one target, recording the outcome on its circuit breaker."""
+        breaker = self._breaker(target)
+        start = time.monotonic()
+        try:
+            response = await self._call_target(target, messages, params, ticket, digest)
+        except QueueRejected:
+            raise
+        except Exception as e:
+            if is_retryable(e):
+                breaker.record_failure()
+            raise
+        breaker.record_success(time.monotonic() - start)
+        return response
+
+    async def _open_first(
+        self,
+        target: ResolvedModel,
+        messages: list,
+        params: dict,
+        ticket: Ticket,
+        digest: Optional[str] = None,
+    ) -> Tuple[ResolvedModel, AsyncIterator[Chunk], Optional[Chunk], float]:
+        """Open a stream on one target and wait for its first chunk.
+
+        Returns the target, the stream, the first chunk (None if the stream
+        was empty) and the time it took.
+        """
+
+        breaker = self._breaker(target)
+        start = time.monotonic()
+        stream = self._open_target_stream(target, messages, params, ticket, digest)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            breaker.record_success(time.monotonic() - start)
+            return target, stream, None, time.monotonic() - start
+        except QueueRejected:
+            await _aclose(stream)
+            raise
+        except BaseException as e:
+            await _aclose(stream)
+            if isinstance(e, Exception) and is_retryable(e):
+                breaker.record_failure()
+            raise
+        return target, stream, first, time.monotonic() - start
+
+    async def _hedged(
+        self,
+        hedger: Hedger,
+        primary: ResolvedModel,
+        backup: ResolvedModel,
+        stream: bool,
+        attempt: Callable[[ResolvedModel], Awaitable[T]],
+        tried: Set[Tuple[str, str]],
+    ) -> T:
+        """Run ``attempt`` on ``primary``, racing ``backup`` if it is slow.
+
+        The backup is added to ``tried`` once it has been called, so failover
+        does not call it again.
+        """
+
+        name = primary.provider_name
+
+        async def run_primary():
+            start = time.monotonic()
+            try:
+                result = await attempt(primary)
+            except asyncio.CancelledError:
+                # Lost the race: its latency was at least this long.
+                hedger.observe(name, stream, time.monotonic() - start)
+                raise
+            hedger.observe(name, stream, time.monotonic() - start)
+            return result
+
+        async def run_backup():
+            tried.add(_target_key(backup))
+            if not self._breaker(backup).allow():
+                raise _unavailable(backup, None)
+            return await attempt(backup)
+
+        delay = hedger.delay(name, stream)
+        if delay is None:
+            return await run_primary()
+        result, _ = await hedger.race(
+            run_primary,
+            run_backup,
+            delay,
+            (lambda opened: _aclose(opened[1])) if stream else None,
+        )
+        return result
+
+    def _hedge_plan(
+        self,
+        resolved: ResolvedModel,
+        chain: List[ResolvedModel],
+        prompt_tokens: Optional[int] = None,
+    ) -> Optional[Tuple[Hedger, ResolvedModel]]:
+        """The hedger and backup target for ``resolved``, if it hedges.
+
+        ``chain`` only holds targets that fit the prompt; a ``hedge.target``
+        that does not is not raced.
+        """
+        hedge = resolved.model_config.hedge
+        if hedge is None:
+            return None
+        if hedge.target is not None:
+            backup = self.resolve(hedge.target)
+            if not self._fitting([backup], prompt_tokens):
+                return None
+        elif len(chain) > 1:
+            backup = chain[1]
+        else:
+            return None
+        if _target_key(backup) == _target_key(resolved):
+            return None
+
+        name = resolved.model_config.name
+        hedger = self._hedgers.get(name)
+        if hedger is None or hedger.config != hedge:
+            hedger = self._hedgers[name] = Hedger(name, hedge)
+        return hedger, backup
+
+    async def _call_target(
+        self,
+        target: ResolvedModel,
+        messages: list,
+        params: dict,
+        ticket: Ticket,
+        digest: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Call one target, coalescing identical in-flight calls.
+
+        Coalesced callers receive the same response object and must not
+        mutate it. Only the call that actually goes upstream takes a slot.
+        """
+
+        model_metrics = metrics.for_model(target.provider_name, target.model_config.name)
+        scheduler = self._schedulers.get(target.provider_name)
+        prefixes = self._prefix_hashes(target, messages)
+        resident = self._resident_endpoints(target)
+
+        def call():
+            return model_metrics.timed_call(
+                lambda: target.provider.chat_completion(
+                    target.provider_model_id, messages, params
+                )
+            )
+
+        if prefixes is not None:
+            without_prefix = call
+
+            def call():
+                return call_with_hint(PREFIX_HASHES, prefixes, without_prefix)
+
+        if resident is not None:
+            without_residency = call
+
+            def call():
+                return call_with_hint(RESIDENT_ON, resident, without_residency)
+
+        if scheduler is not None:
+            unscheduled = call
+
+            async def call():
+                async with scheduler.slot(ticket):
+                    return await unscheduled()
+
+        if not self.config.providers[target.provider_name].coalesce:
+            return await call()
+
+        digest = digest or request_digest(messages, params, False)
+        key = make_cache_key(target.provider_name, target.provider_model_id, digest)
+        return await self._coalescer.call(key, call)
+
+    def _open_target_stream(
+        self,
+        target: ResolvedModel,
+        messages: list,
+        params: dict,
+        ticket: Ticket,
+        digest: Optional[str] = None,
+    ) -> AsyncIterator[Chunk]:
+        """Open a stream on one target, attaching to an identical one in flight.
+
+        A scheduler slot, if any, is held until the stream ends.
+        """
+
+        model_metrics = metrics.for_model(target.provider_name, target.model_config.name)
+        scheduler = self._schedulers.get(target.provider_name)
+        prefixes = self._prefix_hashes(target, messages)
+        resident = self._resident_endpoints(target)
+
+        def open_stream():
+            stream = model_metrics.observe_stream(
+                target.provider.chat_completion_stream(
+                    target.provider_model_id, messages, params
+                )
+            )
+            if prefixes is not None:
+                stream = stream_with_hint(PREFIX_HASHES, prefixes, stream)
+            if resident is not None:
+                stream = stream_with_hint(RESIDENT_ON, resident, stream)
+            return stream
+
+        if scheduler is not None:
+            unscheduled = open_stream
+
+            async def open_stream():
+                async with scheduler.slot(ticket):
+                    async for chunk in unscheduled():
+                        yield chunk
+
+        if not self.config.providers[target.provider_name].coalesce:
+            return open_stream()
+
+        digest = digest or request_digest(messages, params, True)
+        key = make_cache_key(target.provider_name, target.provider_model_id, digest)
+        return self._coalescer.stream(key, open_stream)
+
+    def _breaker(self, target: ResolvedModel) -> CircuitBreaker:
+        key = (target.provider_name, target.provider_model_id)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            shared = None
+            if self.shared is not None:
+                shared = self.shared.circuit(f"{target.provider_name}/{target.provider_model_id}")
+            breaker = CircuitBreaker(self._breaker_config(target.provider_name), shared)
+            self._breakers[key] = breaker
+        return breaker
+
+    def _resident_on(self, target: ResolvedModel) -> FrozenSet[str]:
+        tracker = self._residency.get(target.provider_name)
+        return tracker.resident_on(target.provider_model_id) if tracker is not None else frozenset()
+
+    def _is_cold(self, target: ResolvedModel) -> bool:
+        tracker = self._residency.get(target.provider_name)
+        return tracker is not None and tracker.is_cold(target.provider_model_id)
+
+    def _resident_endpoints(self, target: ResolvedModel) -> Optional[FrozenSet[str]]:
+        """Replicas to prefer for ``target``; None unless some but not all have it."""
+        tracker = self._residency.get(target.provider_name)
+        if tracker is None or len(tracker.endpoints) < 2:
+            return None
+        resident = tracker.resident_on(target.provider_model_id)
+        return resident if 0 < len(resident) < len(tracker.endpoints) else None
+
+    def _prefix_hashes(
+        self, target: ResolvedModel, messages: list
+    ) -> Optional[Tuple[bytes, ...]]:
+        provider_config = self.config.providers[target.provider_name]
+        if not provider_config.load_balancer.prefix_affinity or len(provider_config.endpoints) < 2:
+            return None
+        return prefix_hashes(target.provider_model_id, messages)
+
+    def _scheduler_config(self, config: SchedulerConfig) -> SchedulerConfig:
+        """Split a provider's queue between worker processes.
+
+        Slots are not split; with several workers the scheduler counts them
+        in the shared state.
+        """
+        workers = self.shared.workers if self.shared is not None else 1
+        if workers == 1 or not config.max_queue:
+            return config
+        return config.model_copy(update={"max_queue": max(1, config.max_queue // workers)})
+
+    def _breaker_config(self, provider_name: str) -> CircuitBreakerConfig:
+        provider_config = self.config.providers[provider_name]
+        return provider_config.circuit_breaker or self.config.circuit_breaker
+
+    def circuit_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            f"{provider_name}/{model_id}": breaker.stats()
+            for (provider_name, model_id), breaker in self._breakers.items()
+        }
+
+    def residency_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: tracker.stats() for name, tracker in self._residency.items()}
+
+    def start(self) -> None:
+        """Start background work: connection pre-warming, residency polling and model warm-up."""
+        for warmer in self._warmers.values():
+            warmer.start()
+        for tracker in self._residency.values():
+            tracker.start()
+
+    async def prewarmed(self) -> None:
+        """Wait until every pool has made its first round of connections."""
+        await asyncio.gather(*(warmer.ready.wait() for warmer in self._warmers.values()))
+
+    def stop(self) -> None:
+        for warmer in self._warmers.values():
+            warmer.stop()
+        for tracker in self._residency.values():
+            tracker.stop()
+
+    def hedge_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: hedger.stats() for name, hedger in self._hedgers.items()}
+
+    def scheduler_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: scheduler.stats() for name, scheduler in self._schedulers.items()}
+
+    def pool_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {
+            name: pool_stats(client, self.config.providers[name])
+            for name, client in self._http_clients.items()
+        }
+        for name, warmer in self._warmers.items():
+            stats[name]["prewarm"] = warmer.stats()
+        return stats
 
     def list_models(self) -> list:
         models = []
@@ -151,5 +841,89 @@ class ModelRouter:
 
         return models
 
-    async def close(self) -> None:
-        await self._http_client.aclose()
+    def hold(self) -> None:
+        """Count a request that will use this router until ``release``.
+
+        Completions count themselves while they run; callers hold the router
+        from the moment they pick it so ``drain`` also covers the time before
+        a completion starts, such as a stream that has not been iterated yet.
+        """
+        self._active += 1
+        self._idle.clear()
+
+    def release(self) -> None:
+        self._active -= 1
+        if self._active == 0:
+            self._idle.set()
+
+    @property
+    def active_requests(self) -> int:
+        return self._active
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait for in-flight requests to finish; False if ``timeout`` hit first."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self, keep: Iterable[httpx.AsyncClient] = ()) -> None:
+        """Close every HTTP client except those in ``keep``, now owned elsewhere."""
+        self.stop()
+        keep = {id(client) for client in keep}
+        for client in self._http_clients.values():
+            if id(client) not in keep:
+                await client.aclose()
+
+    def clients(self) -> List[httpx.AsyncClient]:
+        return list(self._http_clients.values())
+
+    def clients_by_provider(self) -> Dict[str, httpx.AsyncClient]:
+        return dict(self._http_clients)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether ``error`` is a transient upstream failure worth another attempt.
+
+    Only network errors, timeouts and retryable statuses qualify; anything
+    else, such as a KeyError from an adapter bug, surfaces instead of
+    tripping breakers and failing over.
+    """
+    if isinstance(
+        error, (UpstreamUnavailableError, httpx.TransportError, ConnectionError, TimeoutError)
+    ):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    if isinstance(error, ProviderError):
+        # No status: an error event inside an upstream stream.
+        return error.status_code is None or error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def _unavailable(
+    resolved: ResolvedModel, last_error: Optional[Exception]
+) -> UpstreamUnavailableError:
+    if last_error is None:
+        return UpstreamUnavailableError(
+            f"All providers for '{resolved.model_config.name}' are unavailable "
+            "(circuit open)",
+            503,
+        )
+    error = UpstreamUnavailableError(
+        f"All providers for '{resolved.model_config.name}' failed: {last_error}",
+        503 if isinstance(last_error, QueueRejected) else 502,
+    )
+    error.__cause__ = last_error
+    return error
+
+
+def _target_key(target: ResolvedModel) -> Tuple[str, str]:
+    return target.provider_name, target.provider_model_id
+
+
+async def _aclose(stream: AsyncIterator[Chunk]) -> None:
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
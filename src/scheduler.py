@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Set
+
+from . import metrics
+from .config import SchedulerConfig
+from .shared import SharedSlots
+
+PRIORITIES = {"interactive": 0, "default": 1, "batch": 2}
+
+
+class QueueRejected(Exception):
+    """A request was shed by a provider scheduler instead of being queued."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class Ticket(NamedTuple):
+    """Who is asking and how urgently; decides queue order."""
+
+    priority: str = "default"
+    tenant: str = ""
+    weight: float = 1.0
+
+
+class Scheduler:
+    """Concurrency slots for one provider with a bounded priority queue.
+
+    Waiters are ordered by priority class first. Within a class, tenants
+    (API keys) share slots in proportion to their weight using start-time
+    fair queueing: each request is tagged ``max(virtual_time, last tag of its
+    tenant) + 1 / weight`` and the smallest tag goes next, so a tenant with a
+    deep backlog cannot starve one that just arrived.
+
+    With ``slots`` the concurrency limit is shared with the other worker
+    processes. The queue stays local, and while it is not empty a background
+    task claims slots as they free up here or in another worker.
+    """
+
+    def __init__(
+        self, provider: str, config: SchedulerConfig, slots: Optional[SharedSlots] = None
+    ):
+        self.provider = provider
+        self.config = config
+        self.slots = slots
+        self.active = 0
+        self.waiting = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "queue_timeout": 0}
+        self.admitted = 0
+        self.total_wait = 0.0
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._tenant_tags: Dict[str, float] = {}
+        self._freed = asyncio.Event()
+        self._pump: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._depth = metrics.QUEUE_DEPTH.labels(provider)
+        self._slots = metrics.SLOTS_IN_USE.labels(provider)
+        self._waits = {
+            priority: metrics.QUEUE_WAIT.labels(provider, priority) for priority in PRIORITIES
+        }
+
+    @property
+    def full(self) -> bool:
+        return (
+            self.active >= self.config.max_concurrency
+            and self.waiting >= self.config.max_queue
+        )
+
+    @asynccontextmanager
+    async def slot(self, ticket: Ticket) -> AsyncIterator[None]:
+        await self.acquire(ticket)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, ticket: Ticket) -> None:
+        wait_metric = self._waits.get(ticket.priority) or self._waits["default"]
+        if not self.waiting and await self._claim():
+            self._take()
+            self.admitted += 1
+            wait_metric.observe(0)
+            return
+        if self.waiting >= self.config.max_queue:
+            self._reject("queue_full")
+            raise QueueRejected(
+                f"Queue for provider '{self.provider}' is full "
+                f"({self.waiting} waiting, {self.active} running)",
+                "queue_full",
+            )
+
+        tag = max(self._virtual_time, self._tenant_tags.get(ticket.tenant, 0.0))
+        tag += 1.0 / ticket.weight
+        self._tenant_tags[ticket.tenant] = tag
+        future = asyncio.get_running_loop().create_future()
+        rank = PRIORITIES.get(ticket.priority, PRIORITIES["default"])
+        heapq.heappush(self._heap, (rank, tag, next(self._seq), future))
+        self.waiting += 1
+        self._depth.set(self.waiting)
+        if self.slots is not None and (self._pump is None or self._pump.done()):
+            self._pump = self._spawn(self._claim_for_queue())
+
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.config.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as we gave up; pass it on.
+                self.release()
+            else:
+                self.waiting -= 1
+                self._depth.set(self.waiting)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("queue_timeout")
+                raise QueueRejected(
+                    f"Timed out after {self.config.queue_timeout:g}s waiting for a "
+                    f"slot on provider '{self.provider}'",
+                    "queue_timeout",
+                ) from None
+            raise
+        waited = time.monotonic() - start
+        self.admitted += 1
+        self.total_wait += waited
+        wait_metric.observe(waited)
+
+    def release(self) -> None:
+        self.active -= 1
+        self._slots.set(self.active)
+        if self.slots is not None:
+            self._spawn(self._give_back())
+            return
+        while self.active < self.config.max_concurrency:
+            future = self._pop_waiter()
+            if future is None:
+                break
+            self._take()
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.config.max_concurrency,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_queue": self.config.max_queue,
+            "admitted": self.admitted,
+            "average_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+            "rejected": dict(self.rejected),
+        }
+
+    async def _claim(self) -> bool:
+        if self.slots is None:
+            return self.active < self.config.max_concurrency
+        return await self.slots.take()
+
+    async def _give_back(self) -> None:
+        await self.slots.give()
+        self._freed.set()
+
+    async def _claim_for_queue(self) -> None:
+        """Hand shared slots to queued requests until the queue is empty."""
+        while self._heap:
+            self._freed.clear()
+            if not await self.slots.take():
+                try:
+                    await asyncio.wait_for(self._freed.wait(), self.slots.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            future = self._pop_waiter()
+            if future is None:
+                await self.slots.give()
+                return
+            self._take()
+            future.set_result(None)
+
+    def _pop_waiter(self) -> Optional[asyncio.Future]:
+        """Take the next request that is still waiting off the queue."""
+        while self._heap:
+            _, tag, _, future = heapq.heappop(self._heap)
+            if future.done():  # timed out or cancelled while queued
+                continue
+            self.waiting -= 1
+            self._depth.set(self.waiting)
+            self._virtual_time = tag
+            return future
+        return None
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _take(self) -> None:
+        self.active += 1
+        self._slots.set(self.active)
+
+    def _reject(self, reason: str) -> None:
+        self.rejected[reason] += 1
+        metrics.QUEUE_REJECTED.labels(self.provider, reason).inc()
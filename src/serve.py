@@ -0,0 +1,67 @@
+"""Launch the router, optionally as several worker processes.
+
+    python -m src.serve --workers 4 [--config config/providers.yaml]
+
+With more than one worker, rate limits, circuit state and the response
+cache disk tier are kept in the shared state store (``shared_state.path``)
+and Prometheus metrics are aggregated across processes. SIGHUP sent to this
+process is forwarded to every worker, which reloads its config.
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import signal
+
+import uvicorn
+
+from .config import DEFAULT_CONFIG_PATH, load_config
+from .shared import WORKERS_ENV, SharedState
+
+
+def _forward_sighup(signum, frame) -> None:
+    for child in multiprocessing.active_children():
+        os.kill(child.pid, signal.SIGHUP)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the router.")
+    parser.add_argument("--config", default=os.getenv("ROUTER_CONFIG", DEFAULT_CONFIG_PATH))
+    parser.add_argument("--workers", type=int, default=int(os.getenv(WORKERS_ENV, "1")))
+    parser.add_argument("--host", help="Defaults to server.host from the config")
+    parser.add_argument("--port", type=int, help="Defaults to server.port from the config")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    workers = max(1, args.workers)
+    # Workers are separate interpreters; they read these on import.
+    os.environ["ROUTER_CONFIG"] = args.config
+    os.environ[WORKERS_ENV] = str(workers)
+
+    if workers > 1:
+        shared = SharedState(config.shared_state, workers)
+        shared.reset_transient()
+        shared.close()
+        if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+            metrics_dir = os.path.join(
+                os.path.dirname(config.shared_state.path) or ".", "metrics"
+            )
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+            os.makedirs(metrics_dir)
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, _forward_sighup)
+
+    uvicorn.run(
+        "src.main:app",
+        host=args.host or config.server.host,
+        port=args.port or config.server.port,
+        workers=workers,
+    )
+
+
+if __name__ == "__main__":
+    main()
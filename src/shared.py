@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from .config import SharedStateConfig
+
+WORKERS_ENV = "ROUTER_WORKERS"
+
+T = TypeVar("T")
+
+
+def worker_count() -> int:
+    """Number of worker processes the launcher started (1 when run directly)."""
+    try:
+        return max(1, int(os.getenv(WORKERS_ENV, "1")))
+    except ValueError:
+        return 1
+
+
+def key_id(key: str) -> str:
+    """Stable row id for an API key so raw keys never hit the disk."""
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class SharedState:
+    """Cross-process state for multi-worker deployments, in one SQLite file.
+
+    Runs in WAL mode so readers never block on the writer; read-modify-write
+    updates take the write lock with ``BEGIN IMMEDIATE``. Every worker opens
+    its own connection, guarded by a lock; anything that may wait on another
+    worker's write lock goes through ``run`` to stay off the event loop.
+    """
+
+    def __init__(self, config: SharedStateConfig, workers: int = 1):
+        self.config = config
+        self.workers = workers
+        directory = os.path.dirname(config.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(
+            config.path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, requests REAL, tokens REAL, updated REAL NOT NULL, "
+            "streams INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS circuits (key TEXT PRIMARY KEY, opened_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS slots ("
+            "provider TEXT NOT NULL, pid INTEGER NOT NULL, active INTEGER NOT NULL, "
+            "PRIMARY KEY (provider, pid))"
+        )
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def execute(self, sql: str, args: tuple = ()) -> list:
+        """Run one statement outside a transaction and return its rows."""
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Call ``fn`` on a thread so waiting on other workers never stalls the loop."""
+        return await asyncio.to_thread(fn, *args)
+
+    def reset_transient(self) -> None:
+        """Forget state that only makes sense while the old processes lived.
+
+        Stream counts left by workers that died mid-stream would otherwise
+        block those keys forever.
+        """
+
+        with self.transaction() as db:
+            db.execute("UPDATE rate_limits SET streams = 0")
+            db.execute("DELETE FROM circuits")
+            db.execute("DELETE FROM slots")
+
+    def config_generation(self) -> int:
+        rows = self.execute("SELECT value FROM meta WHERE key = 'config'")
+        return rows[0][0] if rows else 0
+
+    def bump_config_generation(self) -> int:
+        """Tell the other workers to reload their config."""
+        with self.transaction() as db:
+            db.execute(
+                "INSERT INTO meta (key, value) VALUES ('config', 1) "
+                "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+            )
+            return db.execute("SELECT value FROM meta WHERE key = 'config'").fetchone()[0]
+
+    def circuit(self, name: str) -> "SharedCircuit":
+        return SharedCircuit(self, name)
+
+    def slots(self, provider: str, limit: int) -> "SharedSlots":
+        return SharedSlots(self, provider, limit)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedCircuit:
+    """Open/closed state of one circuit breaker as seen by every worker.
+
+    Workers publish when they trip or reset a breaker and poll the shared
+    state at most every ``circuit_sync_interval`` seconds, so one worker
+    discovering a dead upstream spares the others from rediscovering it.
+    """
+
+    def __init__(self, state: SharedState, name: str):
+        self._state = state
+        self.name = name
+        self.sync_interval = state.config.circuit_sync_interval
+        self._next_sync = 0.0
+
+    def due(self, now: float) -> bool:
+        if now < self._next_sync:
+            return False
+        self._next_sync = now + self.sync_interval
+        return True
+
+    def opened_at(self) -> Optional[float]:
+        """Wall-clock time the circuit was opened, or None if it is closed."""
+        rows = self._state.execute("SELECT opened_at FROM circuits WHERE key = ?", (self.name,))
+        return rows[0][0] if rows else None
+
+    def publish_open(self) -> None:
+        self._state.execute(
+            "INSERT OR REPLACE INTO circuits (key, opened_at) VALUES (?, ?)",
+            (self.name, time.time()),
+        )
+
+    def publish_closed(self) -> None:
+        self._state.execute("DELETE FROM circuits WHERE key = ?", (self.name,))
+
+
+class SharedSlots:
+    """Concurrency slots of one provider, counted across every worker.
+
+    Each worker keeps its own row of slots in use, keyed by pid, so rows
+    left by a worker that died can be dropped when the limit looks reached.
+    """
+
+    def __init__(self, state: SharedState, provider: str, limit: int):
+        self._state = state
+        self.provider = provider
+        self.limit = limit
+        self.poll_interval = state.config.slot_poll_interval
+        self._pid = os.getpid()
+
+    async def take(self) -> bool:
+        """Claim a slot if fewer than ``limit`` are in use by all workers."""
+        return await self._state.run(self._take)
+
+    async def give(self) -> None:
+        await self._state.run(self._give)
+
+    def _take(self) -> bool:
+        with self._state.transaction() as db:
+            in_use = self._in_use(db)
+            if in_use >= self.limit and self._forget_dead(db):
+                in_use = self._in_use(db)
+            if in_use >= self.limit:
+                return False
+            db.execute(
+                "INSERT INTO slots (provider, pid, active) VALUES (?, ?, 1) "
+                "ON CONFLICT(provider, pid) DO UPDATE SET active = active + 1",
+                (self.provider, self._pid),
+            )
+            return True
+
+    def _give(self) -> None:
+        with self._state.transaction() as db:
+            db.execute(
+                "UPDATE slots SET active = MAX(active - 1, 0) WHERE provider = ? AND pid = ?",
+                (self.provider, self._pid),
+            )
+
+    def _in_use(self, db: sqlite3.Connection) -> int:
+        return db.execute(
+            "SELECT COALESCE(SUM(active), 0) FROM slots WHERE provider = ?", (self.provider,)
+        ).fetchone()[0]
+
+    def _forget_dead(self, db: sqlite3.Connection) -> bool:
+        """Drop rows of workers that no longer exist; True if any were."""
+        dead = []
+        for (pid,) in db.execute(
+            "SELECT pid FROM slots WHERE provider = ? AND active > 0", (self.provider,)
+        ).fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                dead.append(pid)
+            except PermissionError:
+                pass
+        for pid in dead:
+            db.execute("DELETE FROM slots WHERE pid = ?", (pid,))
+        return bool(dead)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import json
+from typing import AsyncIterator, Optional, Tuple, Union
+
+Chunk = Union[str, bytes]
+
+DONE_EVENT = b"data: [DONE]\n\n"
+_DATA = b"data:"
+_EVENT_END = b"\n\n"
+_USAGE_KEY = '"usage":'
+_decoder = json.JSONDecoder()
+
+
+def is_done(chunk: Chunk) -> bool:
+    """Return whether ``chunk`` ends with the ``[DONE]`` sentinel."""
+    if isinstance(chunk, bytes):
+        return b"[DONE]" in chunk[-16:]
+    return "[DONE]" in chunk[-16:]
+
+
+def find_usage(chunk: Chunk) -> Optional[dict]:
+    """Return the last ``usage`` object carried by ``chunk``, if any.
+
+    Content chunks cost a single substring scan; only chunks that mention
+    usage are decoded, and only from the key onwards.
+    """
+
+    if isinstance(chunk, bytes):
+        if b'"usage"' not in chunk:
+            return None
+        chunk = chunk.decode("utf-8", "replace")
+    start = chunk.rfind(_USAGE_KEY)
+    if start == -1:
+        return None
+    start += len(_USAGE_KEY)
+    while chunk[start : start + 1] == " ":
+        start += 1
+    try:
+        usage, _ = _decoder.raw_decode(chunk, start)
+    except ValueError:
+        return None
+    return usage if isinstance(usage, dict) else None
+
+
+_EMPTY_CHOICES = (b'"choices":[]', b'"choices": []')
+
+
+async def drop_usage_events(stream: AsyncIterator[Chunk]) -> AsyncIterator[Chunk]:
+    """Remove the usage-only event (``"choices": []``) ending OpenAI streams.
+
+    The router asks upstreams for it to account usage; clients that did not
+    set ``stream_options.include_usage`` do not expect it.
+    """
+
+    async for chunk in stream:
+        data = chunk if isinstance(chunk, bytes) else chunk.encode()
+        if _EMPTY_CHOICES[0] not in data and _EMPTY_CHOICES[1] not in data:
+            yield chunk
+            continue
+        kept = b"".join(
+            event + _EVENT_END
+            for event in data.split(_EVENT_END)
+            if event and _EMPTY_CHOICES[0] not in event and _EMPTY_CHOICES[1] not in event
+        )
+        if kept:
+            yield kept
+
+
+def model_rewrites(upstream: str, routed: str) -> Tuple[Tuple[bytes, bytes], ...]:
+    """Byte patterns replacing the upstream model id with the routed name.
+
+    Both compact and ``json.dumps``-style spacing are covered since upstreams
+    differ.
+    """
+
+    old = upstream.encode()
+    new = routed.encode()
+    return (
+        (b'"model":"' + old + b'"', b'"model":"' + new + b'"'),
+        (b'"model": "' + old + b'"', b'"model": "' + new + b'"'),
+    )
+
+
+async def passthrough(
+    source: AsyncIterator[bytes],
+    rewrites: Optional[Tuple[Tuple[bytes, bytes], ...]] = None,
+) -> AsyncIterator[bytes]:
+    """Forward an OpenAI-style SSE byte stream without decoding it.
+
+    Network chunks are yielded as-is whenever they end on an event boundary
+    and hold only ``data:`` lines, which is the common case; otherwise only the
+    trailing partial event is held back. Comment, ``event:`` and other non-data
+    lines are dropped, matching what line-by-line forwarding did.
+    """
+
+    buffer = b""
+    async for chunk in source:
+        if buffer:
+            chunk = buffer + chunk
+            buffer = b""
+        if b"\r" in chunk:
+            chunk = chunk.replace(b"\r\n", b"\n")
+
+        end = chunk.rfind(_EVENT_END)
+        if end == -1:
+            buffer = chunk
+            continue
+        end += 2
+        if end < len(chunk):
+            buffer = chunk[end:]
+            chunk = chunk[:end]
+
+        if not _is_clean(chunk):
+            chunk = _data_lines_only(chunk)
+            if not chunk:
+                continue
+
+        if rewrites:
+            for old, new in rewrites:
+                chunk = chunk.replace(old, new)
+        yield chunk
+
+    if buffer.startswith(_DATA):
+        # Upstream closed without a trailing blank line.
+        yield buffer.rstrip(b"\n") + _EVENT_END
+
+
+def _is_clean(chunk: bytes) -> bool:
+    # A run of "data: ...\n\n" events has exactly two newlines per event and
+    # every event after the first starts right after a separator.
+    events = chunk.count(_EVENT_END)
+    return (
+        chunk.startswith(_DATA)
+        and chunk.count(b"\n") == 2 * events
+        and chunk.count(b"\n\ndata:") == events - 1
+    )
+
+
+def _data_lines_only(chunk: bytes) -> bytes:
+    return b"".join(
+        line + _EVENT_END for line in chunk.split(b"\n") if line.startswith(_DATA)
+    )
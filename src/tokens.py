@@ -0,0 +1,102 @@
+"""Prompt token estimates for context-window checks and rate limits.
+
+A backend turns one string into a token count: ``heuristic`` divides its
+length by ``chars_per_token``, ``tiktoken`` runs a BPE encoding and
+``module:function`` names any other callable. Messages are counted one by
+one and long ones keep their count in an LRU, so a conversation that is
+resent with one more turn only tokenizes the new message.
+"""
+
+from __future__ import annotations
+
+import importlib
+import logging
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from .config import ModelConfig, TokenizerConfig
+
+logger = logging.getLogger(__name__)
+
+Counter = Callable[[str], int]
+
+
+class ContextLengthExceeded(Exception):
+    """A prompt is too long for the model and every ``overflow_to`` model."""
+
+    def __init__(self, model: ModelConfig, prompt_tokens: int):
+        super().__init__(
+            f"This model's maximum context length is {model.context_window} tokens. "
+            f"However, your messages resulted in about {prompt_tokens} tokens. "
+            "Please reduce the length of the messages."
+        )
+        self.prompt_tokens = prompt_tokens
+
+
+def heuristic_counter(chars_per_token: float) -> Counter:
+    return lambda text: int(len(text) / chars_per_token)
+
+
+def tiktoken_counter(encoding: str) -> Counter:
+    import tiktoken
+
+    encode = tiktoken.get_encoding(encoding).encode_ordinary
+    return lambda text: len(encode(text))
+
+
+def load_counter(config: TokenizerConfig) -> Counter:
+    if config.backend == "heuristic":
+        return heuristic_counter(config.chars_per_token)
+    if config.backend == "tiktoken":
+        try:
+            return tiktoken_counter(config.encoding)
+        except ImportError:
+            logger.warning("tokenizer.backend is 'tiktoken' but it is not installed; using the heuristic")
+            return heuristic_counter(config.chars_per_token)
+    module, _, name = config.backend.partition(":")
+    if not name:
+        raise ValueError(f"Unknown tokenizer backend: {config.backend}")
+    return getattr(importlib.import_module(module), name)
+
+
+class TokenEstimator:
+    def __init__(self, config: TokenizerConfig):
+        self.config = config
+        self._count = load_counter(config)
+        # Counting by length is cheaper than a cache lookup.
+        self._cached = config.backend != "heuristic" and config.cache_size > 0
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+
+    def count(self, messages: list) -> int:
+        """Estimated prompt tokens of ``messages``, framing included."""
+        total = 0
+        for message in messages:
+            total += self.config.per_message_tokens + self.count_text(message.get("content") or "")
+        return total
+
+    def count_text(self, text: str) -> int:
+        if not self._cached or len(text) < self.config.cache_min_chars:
+            return self._count(text)
+        tokens = self._cache.get(text)
+        if tokens is not None:
+            self._cache.move_to_end(text)
+            return tokens
+        tokens = self._cache[text] = self._count(text)
+        if len(self._cache) > self.config.cache_size:
+            self._cache.popitem(last=False)
+        return tokens
+
+
+def output_limit(model: ModelConfig, prompt_tokens: int) -> Optional[int]:
+    """The most output tokens ``model`` allows after a prompt; None if unbounded."""
+    limits = []
+    if model.max_output is not None:
+        limits.append(model.max_output)
+    if model.context_window is not None:
+        limits.append(model.context_window - prompt_tokens)
+    return min(limits) if limits else None
+
+
+def fits(model: ModelConfig, prompt_tokens: int) -> bool:
+    """Whether the prompt leaves room for at least one output token."""
+    return model.context_window is None or prompt_tokens < model.context_window
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Dict, Optional
+
+from .jsonlib import dumps
+
+_LINE_END = b"\n"
+
+
+class ChunkEncoder:
+    """Byte templates for the ``chat.completion.chunk`` events of one stream.
+
+    Everything except the delta text is fixed for the lifetime of a stream,
+    so it is serialized once up front and each content chunk is a single
+    concatenation around the already JSON-escaped text.
+    """
+
+    def __init__(self, chunk_id: str, model: str, created: int):
+        self._head = (
+            b'data: {"id":'
+            + dumps(chunk_id)
+            + b',"object":"chat.completion.chunk","created":'
+            + str(created).encode()
+            + b',"model":'
+            + dumps(model)
+            + b',"choices":[{"index":0,"delta":'
+        )
+        self._content_prefix = self._head + b'{"content":'
+        self._content_suffix = b'},"finish_reason":null}]}\n\n'
+
+    def content(self, escaped: bytes) -> bytes:
+        """Chunk for a delta whose text is already a JSON string literal."""
+        return self._content_prefix + escaped + self._content_suffix
+
+    def text(self, text: str) -> bytes:
+        return self._content_prefix + dumps(text) + self._content_suffix
+
+    def role(self) -> bytes:
+        return self._head + b'{"role":"assistant","content":""},"finish_reason":null}]}\n\n'
+
+    def finish(self, finish_reason: Optional[str], usage: Optional[Dict[str, Any]] = None) -> bytes:
+        chunk = self._head + b'{},"finish_reason":' + dumps(finish_reason) + b"}]"
+        if usage is not None:
+            chunk += b',"usage":' + dumps(usage)
+        return chunk + b"}\n\n"
+
+
+def usage_dict(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def extract_string(line: bytes, marker: bytes, terminator: bytes) -> Optional[bytes]:
+    """Return the raw JSON string literal between ``marker`` and ``terminator``.
+
+    Used to lift delta text out of upstream events without decoding them.
+    ``terminator`` must end the line; anything that does not match the
+    expected shape returns ``None`` so the caller can fall back to parsing.
+    """
+
+    if not line.endswith(terminator):
+        return None
+    start = line.find(marker)
+    if start == -1:
+        return None
+    literal = line[start + len(marker) : len(line) - len(terminator)]
+    if len(literal) < 2 or literal[:1] != b'"' or literal[-1:] != b'"':
+        return None
+    # Escaped text can never contain '","'; seeing it means the object has
+    # extra fields after the string.
+    if b'","' in literal:
+        return None
+    return literal
+
+
+async def iter_lines(source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines without decoding it; blank lines are skipped."""
+    buffer = b""
+    async for chunk in source:
+        if buffer:
+            chunk = buffer + chunk
+        lines = chunk.split(_LINE_END)
+        buffer = lines.pop()
+        for line in lines:
+            if line:
+                yield line[:-1] if line[-1:] == b"\r" else line
+    if buffer:
+        yield buffer
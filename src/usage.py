@@ -0,0 +1,259 @@
+"""Token usage accounting per API key and model.
+
+Counters live in memory and are flushed in one transaction every
+``flush_interval`` seconds to an SQLite file, bucketed by hour. Workers share
+the file; each adds its own counts, so totals cover every process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Sequence, Tuple
+
+from .config import UsageConfig
+from .jsonlib import usage_of
+from .sse import Chunk, find_usage
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS = "anonymous"
+GROUP_COLUMNS = ("key", "model", "period")
+# Usage arrives in the final events of a stream; a few chunks of slack cover
+# a trailing finish chunk and [DONE] sent separately.
+_TAIL_CHUNKS = 4
+
+
+class StreamUsage:
+    """Usage of a stream, read from its last chunks once it has ended.
+
+    Per chunk this only counts and keeps a reference, so metering adds no
+    scanning to the streaming path. The chunk count stands in for completion
+    tokens when the upstream reports no usage.
+    """
+
+    __slots__ = ("chunks", "_tail")
+
+    def __init__(self):
+        self.chunks = 0
+        self._tail: Deque[Chunk] = deque(maxlen=_TAIL_CHUNKS)
+
+    async def tap(self, stream: AsyncIterator[Chunk]) -> AsyncIterator[Chunk]:
+        keep = self._tail.append
+        count = 0
+        try:
+            async for chunk in stream:
+                count += 1
+                keep(chunk)
+                yield chunk
+        finally:
+            self.chunks = count
+
+    def usage(self) -> Optional[dict]:
+        for chunk in reversed(self._tail):
+            usage = find_usage(chunk)
+            if usage is not None:
+                return usage
+        return None
+
+
+def response_completion_estimate(response: Any) -> int:
+    """Completion tokens of a non-streaming response from its text length."""
+    total = 0
+    for choice in response.get("choices") or ():
+        content = (choice.get("message") or {}).get("content") or ""
+        total += len(content) // 4
+    return total
+
+
+class UsageTracker:
+    def __init__(self, config: UsageConfig):
+        self.config = config
+        # (hour, key, model) -> [requests, prompt, completion, estimated, cache hits]
+        self._pending: Dict[Tuple[int, str, str], List[int]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.flushes = 0
+        self.failed_flushes = 0
+        directory = os.path.dirname(config.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Opened at import, used from worker threads afterwards.
+        self._conn = sqlite3.connect(
+            config.path, timeout=5.0, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            "period INTEGER NOT NULL, key TEXT NOT NULL, model TEXT NOT NULL, "
+            "requests INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+            "completion_tokens INTEGER NOT NULL, estimated_requests INTEGER NOT NULL, "
+            "cache_hits INTEGER NOT NULL, PRIMARY KEY (period, key, model))"
+        )
+
+    def record(
+        self,
+        key: Optional[str],
+        model: str,
+        usage: Optional[dict],
+        prompt_estimate: int,
+        completion_estimate: int,
+    ) -> None:
+        """Count one upstream-served request, estimating missing usage."""
+        counters = self._counters(key, model)
+        counters[0] += 1
+        if usage and (usage.get("prompt_tokens") or usage.get("completion_tokens")):
+            counters[1] += usage.get("prompt_tokens") or 0
+            counters[2] += usage.get("completion_tokens") or 0
+        else:
+            counters[1] += prompt_estimate
+            counters[2] += completion_estimate
+            counters[3] += 1
+
+    def record_response(self, key: Optional[str], model: str, response: Any, prompt_estimate: int) -> None:
+        usage = usage_of(response)
+        estimate = 0 if usage else response_completion_estimate(response)
+        self.record(key, model, usage, prompt_estimate, estimate)
+
+    def record_stream(self, key: Optional[str], model: str, meter: StreamUsage, prompt_estimate: int) -> None:
+        self.record(key, model, meter.usage(), prompt_estimate, meter.chunks)
+
+    def record_cache_hit(self, key: Optional[str], model: str) -> None:
+        counters = self._counters(key, model)
+        counters[0] += 1
+        counters[4] += 1
+
+    def _counters(self, key: Optional[str], model: str) -> List[int]:
+        bucket = (int(time.time()) // 3600 * 3600, key or ANONYMOUS, model)
+        counters = self._pending.get(bucket)
+        if counters is None:
+            counters = self._pending[bucket] = [0, 0, 0, 0, 0]
+        return counters
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write, pending)
+                self.flushes += 1
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Failed to flush usage counters: {e}")
+                # Keep the counts for the next attempt.
+                for bucket, counters in pending.items():
+                    current = self._pending.setdefault(bucket, [0, 0, 0, 0, 0])
+                    for i, value in enumerate(counters):
+                        current[i] += value
+
+    def _write(self, pending: Dict[Tuple[int, str, str], List[int]]) -> None:
+        rows = [(period, key, model, *counters) for (period, key, model), counters in pending.items()]
+        db = self._conn
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany(
+                "INSERT INTO usage (period, key, model, requests, prompt_tokens, "
+                "completion_tokens, estimated_requests, cache_hits) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(period, key, model) DO UPDATE SET "
+                "requests = requests + excluded.requests, "
+                "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "estimated_requests = estimated_requests + excluded.estimated_requests, "
+                "cache_hits = cache_hits + excluded.cache_hits",
+                rows,
+            )
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    async def query(
+        self,
+        key: Optional[str] = None,
+        model: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        group_by: Sequence[str] = ("key", "model"),
+    ) -> List[Dict[str, Any]]:
+        """Totals grouped by any of ``key``, ``model`` and ``period`` (hour).
+
+        ``start`` and ``end`` are unix times, rounded to whole hours.
+        """
+
+        await self.flush()
+        return await asyncio.to_thread(self._select, key, model, start, end, tuple(group_by))
+
+    def _select(
+        self,
+        key: Optional[str],
+        model: Optional[str],
+        start: Optional[float],
+        end: Optional[float],
+        group_by: Tuple[str, ...],
+    ) -> List[Dict[str, Any]]:
+        where, args = [], []
+        if key is not None:
+            where.append("key = ?")
+            args.append(key)
+        if model is not None:
+            where.append("model = ?")
+            args.append(model)
+        if start is not None:
+            where.append("period >= ?")
+            args.append(int(start) // 3600 * 3600)
+        if end is not None:
+            where.append("period <= ?")
+            args.append(int(end))
+        columns = [c for c in GROUP_COLUMNS if c in group_by]
+        sql = (
+            "SELECT " + "".join(f"{c}, " for c in columns)
+            + "SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), "
+            "SUM(estimated_requests), SUM(cache_hits) FROM usage"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if columns:
+            sql += " GROUP BY " + ", ".join(columns) + " ORDER BY " + ", ".join(columns)
+
+        results = []
+        for row in self._conn.execute(sql, args):
+            entry = dict(zip(columns, row))
+            requests, prompt, completion, estimated, cache_hits = (v or 0 for v in row[len(columns):])
+            if not requests:
+                continue
+            entry.update(
+                requests=requests,
+                prompt_tokens=prompt,
+                completion_tokens=completion,
+                total_tokens=prompt + completion,
+                estimated_requests=estimated,
+                cache_hits=cache_hits,
+            )
+            results.append(entry)
+        return results
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        self._conn.close()